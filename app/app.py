@@ -1,239 +1,509 @@
 # app.py - Aplicação Flask para D&D Solo com CrewAI
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, session
+import atexit
 import json
 import os
+import re
+import sqlite3
+import threading
 import time
-from threading import Thread, Event
-from queue import Queue, Empty
+import uuid
+from queue import Empty
 
-# Importa o sistema de jogo
-from main import processar_comando
+from sessions import SessionStore
+from workers import SessionWorkerPool
+from notifier import StatusBroker
+from jobs import JobStore
+from persistence import GameStore
+from characters import characters
+from metrics import registry
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'dnd-crewai-secret'
 
-# Filas para processar comandos de forma assíncrona
-command_queue = Queue()
-# Store responses with command_id: { 'status': 'processing'/'done'/'error', 'data': ... }
-response_cache = {}
-processing_event = Event() # To indicate if *any* task is running
 
-# Store original command text associated with command_id
-command_texts = {}
+def load_game():
+    """
+    Imports the game engine (main.py: crewai, langchain, LLM clients and agents).
+    Deferred so the server answers pages right away; the import lock makes
+    concurrent callers wait for a single load.
+    """
+    import main
+    return main
 
-# Função para processar comandos em background
-def process_commands():
-    while True:
+
+def warm_up():
+    """Loads the game engine in the background so the first turn doesn't pay for it"""
+    if os.environ.get('DND_WARMUP', '1') == '0':
+        return
+
+    def load():
+        started = time.perf_counter()
         try:
-            # Use non-blocking get
-            command_id, command_text = command_queue.get_nowait()
-            processing_event.set()
-            response_cache[command_id] = {'status': 'processing', 'data': None}
-            print(f"Processing command {command_id}: {command_text}")
-
-            try:
-                # Usa a função correta do main.py para processar o comando
-                response_obj = processar_comando(command_text)
-                response_str = str(response_obj)
-                print(f"Response for {command_id} generated.")
-                # Store successful response
-                response_cache[command_id] = {
-                    'status': 'done',
-                    'data': response_str
-                }
-
-            except Exception as e:
-                error_str = str(e)
-                print(f"Error processing command {command_id}: {error_str}")
-                 # Store error response
-                response_cache[command_id] = {
-                    'status': 'error',
-                    'data': error_str
-                }
-            finally:
-                processing_event.clear() # Clear after this specific task
-                command_queue.task_done()
-
-        except Empty:
-            # Queue is empty, wait a bit
-            time.sleep(0.2)
+            main = load_game()
         except Exception as e:
-             # Catch potential errors in the loop itself
-             print(f"Error in command processing thread: {e}")
-             # Optionally clear the processing event if it was set
-             if processing_event.is_set():
-                 processing_event.clear()
-             time.sleep(1) # Wait longer after an error
+            print(f"Warm-up failed, the game will load on the first turn: {e}")
+            return
+        print(f"Game engine loaded in {time.perf_counter() - started:.2f}s")
+        # Open the LLM connections now, so the first turn skips the TCP/TLS handshake
+        if main.gateway is not None:
+            main.gateway.aquecer(int(os.environ.get('DND_LLM_WARM_CONNECTIONS', 2)))
+        # Encounter difficulty table for the base sheet (Monte Carlo, ~1s), before the first fight
+        started = time.perf_counter()
+        if main.tabela_encontros(main.carregar_ficha()) is not None:
+            print(f"Encounter table ready in {time.perf_counter() - started:.2f}s")
+
+    threading.Thread(target=load, name='warm-up', daemon=True).start()
+
+
+# Saved games (SQLite, WAL): every turn is appended, with a full snapshot every few turns
+db_path = os.environ.get('DND_DB_PATH', 'dnd_sessions.sqlite3')
+game_store = GameStore(
+    db_path, snapshot_every=int(os.environ.get('DND_SNAPSHOT_EVERY', 10))
+) if db_path else None
+
+
+class PlayerSession:
+    """Estado de um jogador no servidor: partida, histórico exibido e comandos"""
+
+    def __init__(self, session_id):
+        # Runs as the SessionStore factory, under the store lock: no I/O here
+        self.session_id = session_id
+        self._game = None
+        self._history = []
+        self._saved = None
+        self._restored = game_store is None
+        self._restore_lock = threading.Lock()
+
+    def restore(self):
+        """
+        Reads the saved game (if any) the first time the session is used after
+        a restart or eviction; callers hold the session lock, not the store lock
+        """
+        if self._restored:
+            return
+        with self._restore_lock:
+            if not self._restored:
+                self._saved = game_store.load(self.session_id)
+                if self._saved is not None:
+                    self._history = self._saved.history
+                self._restored = True
+
+    @property
+    def history(self):
+        self.restore()
+        return self._history
+
+    @history.setter
+    def history(self, value):
+        self.restore()
+        self._history = value
+
+    @property
+    def game(self):
+        """GameState for this player, created (and the engine loaded) on the first turn"""
+        if self._game is None:
+            self.restore()
+            main = load_game()
+            saved, self._saved = self._saved, None
+            if saved is not None and saved.snapshot is not None:
+                game = main.GameState.from_dict(saved.snapshot, self.session_id)
+            else:
+                game = main.GameState(self.session_id)
+            if saved is not None:
+                # Replays the turns after the snapshot (history and combat state, no LLM calls)
+                for changes in saved.changes:
+                    game.aplicar_alteracoes(changes)
+                print(f"Session {self.session_id} restored ({saved.seq} saved turns).")
+            self._game = game
+        return self._game
+
+    @property
+    def has_game(self):
+        return self._game is not None
+
+    def approx_size(self):
+        # Called by the store under its lock: only what is already in memory
+        history_size = sum(len(str(msg.get('content', ''))) for msg in self._history)
+        game_size = self._game.tamanho_estimado() if self._game is not None else 0
+        return game_size + history_size
+
+
+# Command status and results for every session, with TTL after completion and an LRU cap
+jobs = JobStore(
+    max_jobs=int(os.environ.get('DND_MAX_JOBS', 10000)),
+    ttl=float(os.environ.get('DND_JOB_TTL', 900)),
+)
+registry.gauge('jobs_resident', 'Comandos guardados no registro de jobs').track(lambda: len(jobs))
+commands_deduplicated = registry.counter(
+    'commands_deduplicated_total', 'Envios repetidos (mesma chave de idempotência) que não rodaram o turno de novo'
+)
+# Keys end up in the /events/<command_id> and /status/<command_id> URLs
+IDEMPOTENCY_KEY_PATTERN = re.compile(r'[A-Za-z0-9_.:-]{1,128}')
+
+
+def forget_session(sid, player):
+    # Jobs, sheet versions and cached routing decisions belong to the session and go away with it
+    jobs.discard_session(sid)
+    characters.forget(sid)
+    if game_store is not None:
+        game_store.forget(sid)
+    if player.has_game:
+        load_game().cache_roteamento.invalidar(sid)
+
+
+# Isolated game state per browser session, with LRU/idle eviction and a memory cap
+sessions = SessionStore(
+    PlayerSession,
+    max_sessions=int(os.environ.get('DND_MAX_SESSIONS', 500)),
+    idle_ttl=float(os.environ.get('DND_SESSION_TTL', 3600)),
+    max_bytes=int(os.environ.get('DND_SESSION_MAX_BYTES', 256 * 1024 * 1024)),
+    sizeof=lambda player: player.approx_size(),
+    on_evict=forget_session,
+)
+
+
+# Pushes command status transitions to the /events streams
+status_broker = StatusBroker()
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def save_turn(sid, player, history_additions, clears_history=False):
+    """Appends a finished turn to the saved game; call with the session lock held"""
+    if game_store is None:
+        return
+    changes = player.game.extrair_alteracoes() if player.has_game else None
+    try:
+        seq = game_store.append_turn(sid, history_additions, changes, clears_history)
+        if player.has_game and game_store.snapshot_due(seq):
+            game_store.save_snapshot(sid, seq, player.game.to_dict())
+    except sqlite3.Error as e:
+        # The game goes on in memory; only the resume after a restart is affected
+        print(f"Could not save turn for session {sid}: {e}")
+
+
+def current_session_id():
+    """Returns the session id stored in the signed cookie, creating one if needed"""
+    sid = session.get('sid')
+    if not sid:
+        sid = uuid.uuid4().hex
+        session['sid'] = sid
+    return sid
+
+
+def set_command_status(entry, command_id, status, data=None):
+    """Updates the job record and pushes the transition to SSE listeners"""
+    job = jobs.get(entry.id, command_id)
+    if job is None:
+        return # The session was reset while the command was running
+
+    history_additions = None
+    if status in ('done', 'error'):
+        # History is updated once, when the turn finishes (not on every status check)
+        if status == 'done':
+            result_message = {'type': 'response', 'content': data}
+        else:
+            result_message = {'type': 'error', 'content': f"Erro: {data}"}
+        history_additions = [
+            {'type': 'command', 'content': job.command},
+            result_message
+        ]
+        with entry.lock:
+            entry.state.history.extend(history_additions)
+            save_turn(entry.id, entry.state, history_additions)
 
+    jobs.update(entry.id, command_id, status, data, history_additions)
+    status_broker.publish((entry.id, command_id), status_payload(job))
 
-# Inicia o thread de processamento
-processor_thread = Thread(target=process_commands, daemon=True)
-processor_thread.start()
 
-# Histórico da sessão (in-memory, will reset on server restart)
-# *** IMPORTANT: This needs proper session management for multiple users ***
-# For simplicity now, it's global, but this is NOT production-ready for >1 user.
-session_history = []
+def status_payload(job):
+    """Builds the JSON body shared by /status and the /events stream"""
+    if job is None:
+        return {'success': False, 'error': 'Unknown command ID', 'processing': False}
+
+    status = job.status
+    if status == 'queued' or status == 'processing':
+        return {
+            'success': True,
+            'processing': True,
+            'status': status,
+            'message': 'Pensando...' if status == 'processing' else 'Na fila...'
+        }
+    elif status == 'done':
+        return {
+            'success': True,
+            'processing': False,
+            'status': status,
+            'history_additions': job.history_additions
+        }
+    elif status == 'error':
+        return {
+            'success': False,
+            'processing': False,
+            'status': status,
+            'error': job.data,
+            'history_additions': job.history_additions
+        }
+    else:
+         # Should not happen
+         print(f"Unknown status '{status}'")
+         return {'success': False, 'error': 'Internal status error', 'processing': False}
+
+
+# Time from /command accepting a command until a worker starts it (includes the session's own backlog)
+command_queue_wait = registry.histogram(
+    'command_queue_wait_seconds', 'Tempo entre o comando ser aceito e começar a ser processado'
+)
+command_duration = registry.histogram(
+    'command_duration_seconds', 'Duração do processamento de um comando pelo worker'
+)
+
+
+# Função que processa um comando em background (executada pelos workers do pool)
+def process_command(job):
+    entry, command_id, command_text, queued_at = job
+    started = time.monotonic()
+    command_queue_wait.observe(started - queued_at)
+    set_command_status(entry, command_id, 'processing')
+    print(f"Processing command {command_id} (session {entry.id}): {command_text}")
+
+    try:
+        # Usa a função correta do main.py para processar o comando
+        key = (entry.id, command_id)
+
+        def on_token(text):
+            # Narration tokens go straight to the SSE listeners, not to the record
+            status_broker.publish(key, {'token': text})
+
+        with entry.lock:
+            response_obj = load_game().processar_comando(command_text, entry.state.game, on_token=on_token)
+        response_str = str(response_obj)
+        print(f"Response for {command_id} generated.")
+        # Store successful response
+        set_command_status(entry, command_id, 'done', response_str)
+
+    except Exception as e:
+        error_str = str(e)
+        print(f"Error processing command {command_id}: {error_str}")
+         # Store error response
+        set_command_status(entry, command_id, 'error', error_str)
+    finally:
+        command_duration.observe(time.monotonic() - started)
+        sessions.release(entry) # Held since /command queued it
+
+
+def sweep_idle():
+    """Evicts idle sessions and expired jobs even when no request arrives"""
+    sessions.evict_expired()
+    jobs.evict_expired()
+
+
+# Pool de workers: sessões diferentes em paralelo, cada sessão em ordem
+worker_pool = SessionWorkerPool(
+    process_command,
+    num_workers=int(os.environ.get('DND_WORKERS', 4)),
+    maintenance=sweep_idle,
+    maintenance_interval=float(os.environ.get('DND_SWEEP_INTERVAL', 60)),
+)
+worker_pool.start()
+atexit.register(worker_pool.stop) # Finish in-flight turns on shutdown
+
+registry.gauge('worker_queue_depth', 'Comandos aguardando um worker').track(worker_pool.pending)
+registry.gauge('worker_active_jobs', 'Comandos em execução').track(lambda: worker_pool.active)
+registry.gauge('sessions_active', 'Sessões de jogadores em memória').track(lambda: len(sessions))
+registry.gauge('sse_listeners', 'Conexões /events abertas').track(status_broker.listeners)
+
+if __name__ != '__main__':
+    warm_up() # Imported by a WSGI server
 
 @app.route('/')
 def index():
-    global session_history, response_cache, command_texts
-    session_history = []
-    response_cache = {} # Clear caches for new session
-    command_texts = {}
-    print("New session started, history cleared.")
+    sid = current_session_id()
+    if game_store is not None:
+        game_store.delete(sid) # A new game replaces the saved one
+    sessions.reset(sid) # Only this player's state is cleared
+    print(f"New session started for {sid}, history cleared.")
     return render_template('index.html')
 
 @app.route('/start', methods=['GET'])
 def start_game():
-    global session_history
-    session_history = [] # Ensure history is clean
+    sid = current_session_id()
 
     try:
-        print("Starting game...")
-        # Use a distinct command for intro observation
-        intro_command = "Descreva a entrada da Cripta do Coração Negro e os primeiros passos de Alion dentro dela."
-        # Process the command directly instead of using CrewAI here
-        intro_response_str = processar_comando(intro_command)
-        print("Intro response received.")
-
-        # Add intro messages to history
-        history_additions = [
-            {'type': 'system','content': '🎲 D&D 5e Solo com IA: Cripta do Coração Negro'},
-            {'type': 'system','content': '🧙‍♂️ Você é Alion, um mago humano explorando as profundezas da sinistra Cripta do Coração Negro.'},
-            {'type': 'response', 'content': intro_response_str}
-        ]
-        session_history.extend(history_additions)
-        print("History initialized:", session_history)
-
-        return jsonify({
-            'success': True,
-            'history': session_history # Send the initial history
-        })
+        print(f"Starting game for session {sid}...")
+        with sessions.session(sid) as player:
+            player.history = [] # Ensure history is clean
+
+            # Use a distinct command for intro observation
+            intro_command = "Descreva a entrada da Cripta do Coração Negro e os primeiros passos de Alion dentro dela."
+            # Process the command directly instead of using CrewAI here
+            intro_response_str = load_game().processar_comando(intro_command, player.game)
+            print("Intro response received.")
+
+            # Add intro messages to history
+            history_additions = [
+                {'type': 'system','content': '🎲 D&D 5e Solo com IA: Cripta do Coração Negro'},
+                {'type': 'system','content': '🧙‍♂️ Você é Alion, um mago humano explorando as profundezas da sinistra Cripta do Coração Negro.'},
+                {'type': 'response', 'content': intro_response_str}
+            ]
+            player.history.extend(history_additions)
+            save_turn(sid, player, history_additions, clears_history=True)
+            print("History initialized:", player.history)
+
+            return jsonify({
+                'success': True,
+                'history': player.history # Send the initial history
+            })
     except Exception as e:
         print(f"Error during game start: {e}")
         return jsonify({'success': False, 'error': f'Failed to start game: {str(e)}'}), 500
 
 @app.route('/command', methods=['POST'])
 def handle_command(): # Renamed from process_command to avoid confusion
-    global command_texts
+    sid = current_session_id()
     data = request.json
     command_text = data.get('command', '').strip()
-    # Use frontend ID if possible, ensure uniqueness
-    command_id = data.get('id', f"cmd_{int(time.time() * 1000)}_{hash(command_text)}")
+    # Idempotency key chosen by the client once per submission and reused on retries;
+    # without one, every request is a new command
+    command_id = str(
+        request.headers.get('Idempotency-Key')
+        or data.get('idempotency_key')
+        or data.get('id')  # older clients
+        or uuid.uuid4().hex
+    )
 
     if not command_text:
          return jsonify({'success': False, 'error': 'Empty command received'}), 400
+    if not IDEMPOTENCY_KEY_PATTERN.fullmatch(command_id):
+         return jsonify({
+             'success': False,
+             'error': 'Invalid idempotency key (up to 128 letters, digits or "_.:-")'
+         }), 400
 
-    print(f"Received command {command_id}: {command_text}")
+    print(f"Received command {command_id} (session {sid}): {command_text}")
 
     # Check for quit command BEFORE queuing
     if command_text.lower() in ['sair', 'exit', 'quit']:
         print(f"Quit command received.")
+        entry = sessions.get(sid)
+        player = entry.state
         # Add command and quit message to history
         history_additions = [
              {'type': 'command', 'content': command_text},
              {'type': 'system', 'content': '⚰️ A sessão termina aqui. Obrigado por jogar!'}
         ]
-        session_history.extend(history_additions)
+        with entry.lock:
+            player.history.extend(history_additions)
+            save_turn(sid, player, history_additions)
+            history = list(player.history) # Send final history state
         return jsonify({
             'success': True,
-            'history': session_history, # Send final history state
+            'history': history,
             'ended': True
         })
 
-    # Store command text associated with ID for later retrieval
-    command_texts[command_id] = command_text
+    # Held until the worker finishes, so the session is not evicted while queued
+    entry = sessions.get(sid, hold=True)
+
+    # The job keeps the command text for the history once the turn finishes.
+    # A retry or double-click with the same key gets the original job instead of a second turn
+    job, created = jobs.get_or_create(entry.id, command_id, command_text) # Queued
+    if not created:
+        sessions.release(entry)
+        if job.command != command_text:
+            return jsonify({
+                'success': False,
+                'error': 'Idempotency key already used for a different command',
+                'command_id': command_id
+            }), 409
+        commands_deduplicated.inc()
+        print(f"Duplicate submission of {command_id} ({job.status}), not queued again")
+        # Still running: the client watches it as usual; finished: the result comes straight from the job
+        return jsonify(dict(status_payload(job), command_id=command_id, duplicate=True))
+
+    status_broker.publish((entry.id, command_id), status_payload(job))
 
     # Envia o comando para processamento em background
-    command_queue.put((command_id, command_text))
-    response_cache[command_id] = {'status': 'queued', 'data': None} # Mark as queued
+    worker_pool.submit(entry.id, (entry, command_id, command_text, time.monotonic()))
 
     # Return immediately acknowledging receipt, indicating processing will start
-    # Do NOT send history here, let /status handle updates
+    # Do NOT send history here, let /events (or /status) deliver updates
     return jsonify({
         'success': True,
-        'processing': True, # Tell frontend to start polling
+        'processing': True, # Tell frontend to subscribe to /events/<command_id>
         'command_id': command_id
     })
 
 @app.route('/status/<command_id>', methods=['GET'])
 def check_status(command_id):
-    global session_history, response_cache, command_texts
-
-    print(f"Checking status for command {command_id}")
-    status_info = response_cache.get(command_id)
-
-    if not status_info:
-        # Command ID not recognized or very old?
-        print(f"Status check for unknown/old command ID: {command_id}")
-        return jsonify({'success': False, 'error': 'Unknown command ID', 'processing': False})
-
-    status = status_info['status']
-    data = status_info['data']
-
-    if status == 'queued' or status == 'processing':
-        print(f"Command {command_id} is {status}.")
-        return jsonify({
-            'success': True,
-            'processing': True,
-            'message': 'Pensando...' if status == 'processing' else 'Na fila...'
-        })
-    elif status == 'done':
-        print(f"Command {command_id} is done.")
-        # Get the original command text
-        original_command = command_texts.get(command_id, "[Comando não encontrado]")
-        response_content = data
-
-        history_additions = [
-            {'type': 'command', 'content': original_command},
-            {'type': 'response', 'content': response_content}
-        ]
-        session_history.extend(history_additions)
-
-        return jsonify({
-            'success': True,
-            'processing': False,
-            'history_additions': history_additions
-        })
-    elif status == 'error':
-        print(f"Command {command_id} resulted in error.")
-        original_command = command_texts.get(command_id, "[Comando não encontrado]")
-        error_message = data
+    # Polling fallback for browsers without EventSource; read-only and quiet
+    return jsonify(status_payload(jobs.get(current_session_id(), command_id)))
+
+@app.route('/events/<command_id>', methods=['GET'])
+def stream_status(command_id):
+    """Server-Sent Events: pushes queued/processing/done/error as they happen"""
+    entry = sessions.get(current_session_id())
+    key = (entry.id, command_id)
+
+    def sse(payload):
+        if 'token' in payload:
+            return f"event: token\ndata: {json.dumps({'text': payload['token']})}\n\n"
+        return f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+    def generate():
+        # Subscribe before reading the current state so no transition is lost
+        events = status_broker.subscribe(key)
+        try:
+            payload = status_payload(jobs.get(entry.id, command_id))
+            yield sse(payload)
+            while payload.get('processing'):
+                try:
+                    event = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse(event)
+                if 'token' not in event:
+                    payload = event
+        finally:
+            status_broker.unsubscribe(key, events)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
-        history_additions = [
-             {'type': 'command', 'content': original_command},
-             {'type': 'error', 'content': f"Erro: {error_message}"}
-        ]
-        session_history.extend(history_additions)
 
-        return jsonify({
-            'success': False,
-            'processing': False,
-            'error': error_message,
-            'history_additions': history_additions
-        })
-    else:
-         # Should not happen
-         print(f"Unknown status '{status}' for command {command_id}")
-         return jsonify({'success': False, 'error': 'Internal status error', 'processing': False})
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format: per-phase/agent latency and tokens, queue and cache counters"""
+    return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/character', methods=['GET'])
 def get_character():
+    """
+    The player's sheet: once the game started, the in-game copy (current HP);
+    before that, the base sheet cached from personagem.json. Supports
+    If-None-Match/If-Modified-Since, so an unchanged sheet costs a 304.
+    """
     try:
-        file_path = 'personagem.json'
-        if not os.path.exists(file_path):
-             # Try one level up if running from a subdirectory? Unlikely here.
-             # file_path = os.path.join(os.path.dirname(__file__), '..', 'personagem.json')
-             raise FileNotFoundError("personagem.json not found.")
-
-        with open(file_path, 'r', encoding='utf-8') as file:
-            character = json.load(file)
-        return jsonify({
+        entry = sessions.get(current_session_id())
+        with entry.lock: # A turn may be changing the sheet (HP, loot); session_sheet copies it
+            in_game = entry.state.has_game
+            if in_game:
+                sheet = characters.session_sheet(entry.id, entry.state.game.ficha)
+        if not in_game:
+            sheet = characters.get()
+
+        response = jsonify({
             'success': True,
-            'character': character
+            'character': sheet.data
         })
+        response.set_etag(sheet.etag)
+        response.last_modified = sheet.last_modified
+        response.cache_control.no_cache = True # Always revalidate; the HP changes during the game
+        return response.make_conditional(request)
     except FileNotFoundError:
          print("Error: personagem.json not found at expected path.")
          return jsonify({'success': False,'error': 'Character file not found.'}), 404
@@ -247,4 +517,6 @@ def get_character():
 
 if __name__ == '__main__':
     print("Starting Flask server...")
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up() # Only the reloader's child serves requests; the parent just watches files
     app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=True) # use_reloader might be default with debug=True
\ No newline at end of file
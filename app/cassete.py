@@ -0,0 +1,288 @@
+# cassete.py - Gravação e reprodução de partidas reais (respostas do LLM e sorteios)
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from historico import estimar_tokens
+
+VERSAO = 1
+
+
+class DivergenciaCassete(RuntimeError):
+    """A reprodução pediu algo que não foi gravado (prompt, sorteio ou turno diferente)"""
+
+
+def chave_prompt(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:24]
+
+
+def _abrir(caminho: str, modo: str):
+    # .gz comprime o arquivo (prompts repetem muito texto)
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, modo + "t", encoding="utf-8")
+    return open(caminho, modo, encoding="utf-8")
+
+
+class RandomGravado(random.Random):
+    """
+    `random.Random` que anota cada sorteio (floats de `random()` e inteiros de
+    `getrandbits`, de onde saem randint, choice etc.) até o fim do turno.
+    """
+
+    def __init__(self, semente=None):
+        self.sorteios: List = []
+        super().__init__(semente)
+
+    def random(self) -> float:
+        valor = super().random()
+        self.sorteios.append(valor)
+        return valor
+
+    def getrandbits(self, k: int) -> int:
+        valor = super().getrandbits(k)
+        self.sorteios.append(valor)
+        return valor
+
+    def extrair(self) -> List:
+        sorteios, self.sorteios = self.sorteios, []
+        return sorteios
+
+
+class RandomReproduzido(random.Random):
+    """Devolve, na mesma ordem, os sorteios gravados de uma partida"""
+
+    def __init__(self, sorteios: List):
+        self._sorteios: Deque = deque(sorteios)
+        super().__init__(0)
+
+    def _proximo(self, tipo: type, chamada: str):
+        if not self._sorteios:
+            raise DivergenciaCassete(f"Sorteio além dos gravados ({chamada})")
+        valor = self._sorteios.popleft()
+        if type(valor) is not tipo:
+            raise DivergenciaCassete(f"Sorteio gravado {valor!r} não corresponde a {chamada}")
+        return valor
+
+    def random(self) -> float:
+        return self._proximo(float, "random()")
+
+    def getrandbits(self, k: int) -> int:
+        valor = self._proximo(int, f"getrandbits({k})")
+        if valor >> k:
+            raise DivergenciaCassete(f"Sorteio gravado {valor} não cabe em getrandbits({k})")
+        return valor
+
+    def restantes(self) -> int:
+        return len(self._sorteios)
+
+
+class GravadorLLM(BaseCallbackHandler):
+    """Callback dos LLMs que grava cada prompt (como texto) e a resposta completa"""
+
+    def __init__(self, cassete: "Cassete"):
+        super().__init__()
+        self.cassete = cassete
+        self._prompts: Dict[Any, str] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs) -> None:
+        # Chat models sem on_chat_model_start chegam aqui com get_buffer_string(mensagens)
+        self._prompts[run_id] = prompts[0] if prompts else ""
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs) -> None:
+        prompt = self._prompts.pop(run_id, "")
+        texto = response.generations[0][0].text if response.generations else ""
+        self.cassete.escrever(
+            {"t": "llm", "chave": chave_prompt(prompt), "prompt": prompt, "resposta": texto}
+        )
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs) -> None:
+        self._prompts.pop(run_id, None)
+
+
+class Cassete:
+    """
+    Registro de partidas em JSON Lines (`.gz` para comprimir). Em gravação:
+    - `partida`: estado inicial de cada GameState, no seu primeiro turno
+      (partida nova, restaurada do banco ou reiniciada);
+    - `llm`: cada chamada ao LLM, com o prompt e a resposta;
+    - `turno`: comando, pipeline usado, sorteios feitos pelo gerador da
+      partida durante o turno e resposta final (ou erro).
+    Em reprodução, as respostas saem pelo hash do prompt (mesmo prompt
+    repetido: na ordem gravada) e cada partida recebe os seus sorteios na
+    ordem em que foram feitos: o n-ésimo GameState a jogar um turno é a
+    partida gravada n, numerada como na gravação.
+    """
+
+    def __init__(self, caminho: str, modo: str = "gravar"):
+        if modo not in ("gravar", "reproduzir"):
+            raise ValueError(f"Modo de cassete inválido: {modo}")
+        self.caminho = caminho
+        self.modo = modo
+        self._lock = threading.Lock()
+        self._arquivo = None
+        self.turnos: List[Dict] = []
+        self.partidas: Dict[int, Dict] = {}
+        self._reproduzidas = 0  # Partidas já associadas a um GameState na reprodução
+        self._respostas: Dict[str, Deque[str]] = defaultdict(deque)
+        if modo == "gravar":
+            self._arquivo = _abrir(caminho, "a")
+            self.escrever({"t": "cassete", "versao": VERSAO, "inicio": time.time()})
+        else:
+            self._carregar()
+
+    @property
+    def gravando(self) -> bool:
+        return self.modo == "gravar"
+
+    def _carregar(self) -> None:
+        self.turnos, self.partidas = [], {}
+        self._reproduzidas = 0
+        self._respostas.clear()
+        base = 0  # Cada gravação (um processo) numera as partidas a partir de 0
+        with _abrir(self.caminho, "r") as arquivo:
+            for linha in arquivo:
+                if not linha.strip():
+                    continue
+                registro = json.loads(linha)
+                if registro["t"] == "cassete":
+                    base = len(self.partidas)
+                elif registro["t"] == "llm":
+                    self._respostas[registro["chave"]].append(registro["resposta"])
+                elif registro["t"] == "partida":
+                    registro["partida"] += base
+                    self.partidas[registro["partida"]] = dict(registro, sorteios=[])
+                elif registro["t"] == "turno":
+                    registro["partida"] += base
+                    self.turnos.append(registro)
+                    self.partidas[registro["partida"]]["sorteios"].extend(registro["sorteios"])
+
+    def rebobinar(self) -> None:
+        """Volta a reprodução ao início (para repetir a mesma cassete)"""
+        self._carregar()
+
+    def escrever(self, registro: Dict) -> None:
+        linha = json.dumps(registro, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._arquivo.write(linha + "\n")
+            self._arquivo.flush()
+
+    def fechar(self) -> None:
+        with self._lock:
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+
+    # Ganchos usados pelo motor do jogo (main.py)
+
+    def callbacks(self) -> List:
+        return [GravadorLLM(self)] if self.gravando else []
+
+    def rng_sessao(self, semente: Optional[int] = None) -> Optional[random.Random]:
+        """Gerador de uma partida nova (na reprodução, `iniciar_turno` o troca pelo da partida gravada)"""
+        return RandomGravado(semente) if self.gravando else None
+
+    def rng_partida(self, partida: int) -> RandomReproduzido:
+        if partida not in self.partidas:
+            raise DivergenciaCassete(f"Partida {partida} não foi gravada ({len(self.partidas)} na cassete)")
+        return RandomReproduzido(self.partidas[partida]["sorteios"])
+
+    def iniciar_turno(self, estado) -> None:
+        """
+        No primeiro turno de um GameState, numera a partida. Na reprodução, o
+        gerador da partida passa a devolver os sorteios da partida gravada
+        com o mesmo número.
+        """
+        if estado.partida_cassete is not None:
+            return
+        if not self.gravando:
+            with self._lock:
+                partida = self._reproduzidas
+                self._reproduzidas += 1
+            rng = self.rng_partida(partida)
+            estado.partida_cassete = partida
+            estado.dados.rng = rng
+            estado.event_system.rng = rng
+            return
+        with self._lock:
+            estado.partida_cassete = len(self.partidas)
+            self.partidas[estado.partida_cassete] = {}
+        self.escrever(
+            {"t": "partida", "partida": estado.partida_cassete, "sessao": estado.session_id, "estado": estado.to_dict()}
+        )
+
+    def registrar_turno(self, estado, comando: str, resposta: Optional[str], erro: Optional[str] = None) -> None:
+        if not self.gravando:
+            return
+        registro = {
+            "t": "turno",
+            "partida": estado.partida_cassete,
+            "sessao": estado.session_id,
+            "comando": comando,
+            "pipeline": estado.ultimo_pipeline,
+            "sorteios": estado.dados.rng.extrair(),
+            "resposta": resposta,
+        }
+        if erro is not None:
+            registro["erro"] = erro
+        self.escrever(registro)
+
+    def resposta(self, prompt: str) -> str:
+        fila = self._respostas.get(chave_prompt(prompt))
+        if not fila:
+            raise DivergenciaCassete(f"Prompt não gravado: {prompt[:200]!r}...")
+        with self._lock:
+            return fila.popleft()
+
+
+class LLMCassete(BaseChatModel):
+    """Chat model que responde com o que foi gravado, sem rede e sem latência"""
+
+    cassete: Any
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "dnd-cassete"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = get_buffer_string(messages)
+        texto = self.cassete.resposta(prompt)
+        if self.streaming and run_manager:
+            for pedaco in re.findall(r"\S+\s*", texto):
+                run_manager.on_llm_new_token(pedaco)
+        uso = {"prompt_tokens": estimar_tokens(prompt), "completion_tokens": estimar_tokens(texto)}
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=texto))],
+            llm_output={"token_usage": uso, "model_name": self._llm_type},
+        )
+
+
+def cassete_do_ambiente() -> Optional[Cassete]:
+    """
+    DND_CASSETTE=<arquivo> liga a gravação; com DND_CASSETTE_MODE=replay o
+    arquivo é reproduzido no lugar do LLM e dos geradores das sessões.
+    """
+    caminho = os.environ.get("DND_CASSETTE")
+    if not caminho:
+        return None
+    modo = "reproduzir" if os.environ.get("DND_CASSETTE_MODE", "record") == "replay" else "gravar"
+    return Cassete(caminho, modo)
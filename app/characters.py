@@ -0,0 +1,94 @@
+# characters.py - Fichas de personagem lidas do disco uma vez e compartilhadas pelo servidor e pelo jogo
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# Valores padrão para campos ausentes na ficha
+PADROES = {"proficiencia": 2}  # Nível 1
+
+
+class SheetVersion:
+    """Uma versão da ficha: dados, ETag e instante da última mudança (para respostas condicionais)"""
+
+    def __init__(self, data: Dict, etag: str, last_modified: float):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+def _etag(data: Dict) -> str:
+    conteudo = json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(conteudo).hexdigest()
+
+
+class CharacterRepository:
+    """
+    Fichas de personagem (`<nome>.json` em `directory`) em cache.
+
+    O arquivo só é lido e interpretado de novo quando o mtime ou o tamanho
+    mudam; nas demais chamadas o custo é um `os.stat`. Quem for alterar a
+    ficha (ex.: o estado de uma partida) deve trabalhar numa cópia.
+
+    `session_sheet` devolve a versão da ficha de uma partida (com o PV atual
+    do jogo), com ETag e Last-Modified estáveis enquanto ela não muda.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._cache: Dict[str, tuple] = {}  # nome -> ((mtime, tamanho), SheetVersion)
+        self._sessions: Dict[str, SheetVersion] = {}
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, name: str = "personagem") -> SheetVersion:
+        """
+        Ficha base do personagem (compartilhada: não modifique `data`).
+        FileNotFoundError se o arquivo não existe; ValueError se o JSON é inválido.
+        """
+        info = os.stat(self.path(name))
+        chave = (info.st_mtime_ns, info.st_size)
+        with self._lock:
+            cacheado = self._cache.get(name)
+        if cacheado is not None and cacheado[0] == chave:
+            return cacheado[1]
+
+        with open(self.path(name), "r", encoding="utf-8") as arquivo:
+            data = json.load(arquivo)
+        for campo, valor in PADROES.items():
+            data.setdefault(campo, valor)
+        versao = SheetVersion(data, _etag(data), info.st_mtime)
+        with self._lock:
+            self._cache[name] = (chave, versao)
+        return versao
+
+    def session_sheet(self, session_id: str, data: Dict) -> SheetVersion:
+        """Versão da ficha de uma partida; Last-Modified só avança quando o conteúdo muda"""
+        etag = _etag(data)
+        with self._lock:
+            atual = self._sessions.get(session_id)
+            if atual is None or atual.etag != etag:
+                atual = SheetVersion(copy.deepcopy(data), etag, time.time())
+                self._sessions[session_id] = atual
+            return atual
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Descarta o cache (de uma ficha ou de todas); a próxima leitura vai ao disco"""
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
+
+# Repositório único, usado pelo servidor (app.py) e pelo motor do jogo (main.py)
+characters = CharacterRepository(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,210 @@
+# combate.py - Registro de monstros (carregado uma vez) e rodada dos inimigos por iniciativa
+import json
+import math
+import os
+import random
+from array import array
+from typing import Dict, List, Optional, Sequence, Union
+
+from dados import ExpressaoDados, compilar
+
+
+class Monstro:
+    """Ficha de um monstro do registro (só leitura)"""
+
+    __slots__ = ("indice", "nome", "ataque", "bonus_ataque", "dano", "ca", "vida", "iniciativa")
+
+    def __init__(self, indice: int, nome: str, ataque: str, bonus_ataque: int, dano: ExpressaoDados,
+                 ca: int, vida: ExpressaoDados, iniciativa: int):
+        self.indice = indice
+        self.nome = nome
+        self.ataque = ataque
+        self.bonus_ataque = bonus_ataque
+        self.dano = dano
+        self.ca = ca
+        self.vida = vida
+        self.iniciativa = iniciativa
+
+
+class RegistroMonstros:
+    """
+    Monstros em colunas: uma `array` de inteiros por atributo numérico (bônus
+    de ataque, CA, modificador de iniciativa) e as expressões de dano e de
+    vida já compiladas, todos indexados pela posição do monstro. Os inimigos
+    de uma partida guardam só o `tipo` (nome), e a consulta é um dicionário.
+    Tipos desconhecidos (ex.: estados antigos) usam o primeiro monstro cujo
+    nome aparece no tipo ou, se nenhum, o primeiro do registro.
+    """
+
+    __slots__ = ("nomes", "ataques", "bonus_ataque", "ca", "iniciativa", "dano", "vida", "_indices")
+
+    def __init__(self, registros: Sequence[Dict]):
+        if not registros:
+            raise ValueError("Registro de monstros vazio")
+        self.nomes: List[str] = [r["nome"] for r in registros]
+        self.ataques: List[str] = [r.get("ataque", "Ataque") for r in registros]
+        self.bonus_ataque = array("h", (int(r["bonus_ataque"]) for r in registros))
+        self.ca = array("h", (int(r["ca"]) for r in registros))
+        self.iniciativa = array("h", (int(r.get("iniciativa", 0)) for r in registros))
+        self.dano: List[ExpressaoDados] = [compilar(r["dano"]) for r in registros]
+        self.vida: List[ExpressaoDados] = [compilar(r["vida"]) for r in registros]
+        self._indices: Dict[str, int] = {nome.lower(): i for i, nome in enumerate(self.nomes)}
+
+    @classmethod
+    def carregar(cls, caminho: str) -> "RegistroMonstros":
+        with open(caminho, "r", encoding="utf-8") as arquivo:
+            return cls(json.load(arquivo))
+
+    def __len__(self) -> int:
+        return len(self.nomes)
+
+    def indice(self, tipo: str) -> int:
+        tipo = tipo.lower()
+        indice = self._indices.get(tipo)
+        if indice is None:
+            indice = next((i for nome, i in self._indices.items() if nome in tipo), 0)
+            self._indices[tipo] = indice
+        return indice
+
+    def __getitem__(self, chave: Union[int, str]) -> Monstro:
+        i = chave if isinstance(chave, int) else self.indice(chave)
+        return Monstro(i, self.nomes[i], self.ataques[i], self.bonus_ataque[i], self.dano[i],
+                       self.ca[i], self.vida[i], self.iniciativa[i])
+
+    def rolar_pv(self, indice: int, fracao: float, rng: random.Random) -> int:
+        """Dados de vida do monstro, reduzidos a `fracao` (encontros mais fáceis); mínimo 1"""
+        return max(1, math.ceil(self.vida[indice].rolar(rng)[0] * fracao))
+
+    def rolar_iniciativa(self, indice: int, rng: random.Random) -> int:
+        return rng.randint(1, 20) + self.iniciativa[indice]
+
+    def criar_inimigo(self, tipo: str, fracao_pv: float, rng: random.Random) -> Dict:
+        """Inimigo de um encontro: PV, CA e iniciativa vêm do registro"""
+        indice = self.indice(tipo)
+        hp = self.rolar_pv(indice, fracao_pv, rng)
+        return {
+            "tipo": self.nomes[indice],
+            "hp": hp,
+            "hp_max": hp,
+            "ca": self.ca[indice],
+            "iniciativa": self.rolar_iniciativa(indice, rng),
+        }
+
+
+class AtaqueInimigo:
+    """Um ataque da rodada dos inimigos"""
+
+    __slots__ = ("inimigo", "ataque", "iniciativa", "rolagem_ataque", "valor_d20", "critico", "acerto", "dano")
+
+    def __init__(self, inimigo: str, ataque: str, iniciativa: int, rolagem_ataque: int, valor_d20: int,
+                 critico: bool, acerto: bool, dano: int):
+        self.inimigo = inimigo
+        self.ataque = ataque
+        self.iniciativa = iniciativa
+        self.rolagem_ataque = rolagem_ataque
+        self.valor_d20 = valor_d20
+        self.critico = critico
+        self.acerto = acerto
+        self.dano = dano
+
+    def to_dict(self) -> Dict:
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+
+class ResultadoRodada:
+    """Resultado de uma rodada inteira dos inimigos, narrado numa única chamada"""
+
+    __slots__ = ("ataques", "dano_total", "pv_jogador", "pv_maximo", "ca_jogador")
+
+    def __init__(self, ataques: List[AtaqueInimigo], dano_total: int, pv_jogador: int, pv_maximo: int,
+                 ca_jogador: int):
+        self.ataques = ataques
+        self.dano_total = dano_total
+        self.pv_jogador = pv_jogador
+        self.pv_maximo = pv_maximo
+        self.ca_jogador = ca_jogador
+
+    @property
+    def jogador_caido(self) -> bool:
+        return self.pv_jogador <= 0
+
+    def descricao(self) -> str:
+        """Resultados mecânicos da rodada, em ordem de iniciativa, para o prompt de narração"""
+        linhas = []
+        for ordem, ataque in enumerate(self.ataques, 1):
+            if ataque.acerto:
+                linhas.append(
+                    f"{ordem}. {ataque.inimigo} ({ataque.ataque}, iniciativa {ataque.iniciativa}): "
+                    f"{ataque.valor_d20}{' (CRÍTICO!)' if ataque.critico else ' (d20)'} + bônus = "
+                    f"{ataque.rolagem_ataque}, acerta (CA {self.ca_jogador}) e causa {ataque.dano} de dano"
+                )
+            else:
+                linhas.append(
+                    f"{ordem}. {ataque.inimigo} ({ataque.ataque}, iniciativa {ataque.iniciativa}): "
+                    f"{ataque.valor_d20} (d20) + bônus = {ataque.rolagem_ataque}, erra (CA {self.ca_jogador})"
+                )
+        linhas.append(f"- Dano total sofrido: {self.dano_total} pontos de vida")
+        linhas.append(f"- Seus pontos de vida: {self.pv_jogador}/{self.pv_maximo}")
+        if self.jogador_caido:
+            linhas.append("- Alion cai inconsciente!")
+        return "\n".join(linhas)
+
+    def to_dict(self) -> Dict:
+        return {
+            "ataques": [ataque.to_dict() for ataque in self.ataques],
+            "dano_total": self.dano_total,
+            "pv_jogador": self.pv_jogador,
+        }
+
+
+def ordem_iniciativa(inimigos: List[Dict], registro: RegistroMonstros) -> List[Dict]:
+    """Inimigos vivos na ordem em que agem (iniciativa; empate pelo modificador)"""
+    vivos = [inimigo for inimigo in inimigos if inimigo["hp"] > 0]
+    return sorted(
+        vivos,
+        key=lambda inimigo: (
+            inimigo.get("iniciativa", 0),
+            registro.iniciativa[registro.indice(inimigo["tipo"])],
+        ),
+        reverse=True,
+    )
+
+
+def resolver_rodada(
+    inimigos: List[Dict],
+    ca_jogador: int,
+    pv_jogador: int,
+    pv_maximo: int,
+    rng: random.Random,
+    registro: RegistroMonstros,
+) -> Optional[ResultadoRodada]:
+    """
+    Todos os inimigos vivos atacam, em ordem de iniciativa: primeiro todos os
+    d20, depois o dano de quem acertou (dobrado no 20 natural). Não altera a
+    ficha; o chamador aplica `pv_jogador` do resultado. None sem inimigos vivos.
+    """
+    agindo = ordem_iniciativa(inimigos, registro)
+    if not agindo:
+        return None
+    indices = [registro.indice(inimigo["tipo"]) for inimigo in agindo]
+    d20s = [rng.randint(1, 20) for _ in agindo]
+
+    ataques, dano_total = [], 0
+    for inimigo, indice, d20 in zip(agindo, indices, d20s):
+        rolagem = d20 + registro.bonus_ataque[indice]
+        critico = d20 == 20
+        acerto = rolagem >= ca_jogador
+        dano = 0
+        if acerto:
+            expressao = registro.dano[indice]
+            dano = expressao.rolar(rng)[0] + (expressao.rolar(rng)[0] if critico else 0)
+        dano_total += dano
+        ataques.append(AtaqueInimigo(
+            inimigo["tipo"], registro.ataques[indice], inimigo.get("iniciativa", 0),
+            rolagem, d20, critico and acerto, acerto, dano,
+        ))
+    return ResultadoRodada(ataques, dano_total, max(0, pv_jogador - dano_total), pv_maximo, ca_jogador)
+
+
+# Registro único, lido de monstros.json na importação
+monstros = RegistroMonstros.carregar(os.path.join(os.path.dirname(os.path.abspath(__file__)), "monstros.json"))
@@ -0,0 +1,206 @@
+# dados.py - Expressões de dados compiladas, rolagens em lote e gerador por sessão
+import random
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Está no requirements.txt; se faltar, o lote cai para rolagens uma a uma
+    np = None
+
+# Limites contra expressões absurdas vindas de prompts ou comandos
+MAX_DADOS = 1000
+MAX_FACES = 1000
+MAX_EXPLOSOES = 100  # Rolagens extras por dado explosivo
+
+VANTAGEM = "2d20kh1"
+DESVANTAGEM = "2d20kl1"
+
+TERMO = re.compile(
+    r"\s*([+-])?\s*(?:(\d*)d(\d+|%)((?:kh\d*|kl\d*|k\d*|r\d*|!)*)|(\d+))\s*",
+    re.IGNORECASE,
+)
+MODIFICADOR = re.compile(r"(kh|kl|k|r|!)(\d*)", re.IGNORECASE)
+
+
+class Dado:
+    """
+    Termo `NdM` de uma expressão, com modificadores opcionais:
+    `khK`/`klK` mantêm os K maiores/menores, `rX` rerrola uma vez os dados
+    que tirarem X ou menos e `!` faz o dado explodir (rola de novo no máximo).
+    """
+
+    __slots__ = ("quantidade", "faces", "manter", "rerrolar", "explodir")
+
+    def __init__(self, quantidade: int, faces: int, manter: Optional[Tuple[str, int]] = None,
+                 rerrolar: int = 0, explodir: bool = False):
+        self.quantidade = quantidade
+        self.faces = faces
+        self.manter = manter  # ("h" | "l", quantos) ou None
+        self.rerrolar = rerrolar
+        self.explodir = explodir
+
+    def rolar(self, rng: random.Random) -> List[int]:
+        """Valores que contam para o total (depois de rerrolar, explodir e manter)"""
+        valores = []
+        for _ in range(self.quantidade):
+            valor = rng.randint(1, self.faces)
+            if valor <= self.rerrolar:
+                valor = rng.randint(1, self.faces)
+            if self.explodir:
+                extra = valor
+                for _ in range(MAX_EXPLOSOES):
+                    if extra != self.faces:
+                        break
+                    extra = rng.randint(1, self.faces)
+                    valor += extra
+            valores.append(valor)
+        if self.manter is not None:
+            lado, quantos = self.manter
+            mantidos = set(sorted(range(len(valores)), key=valores.__getitem__, reverse=lado == "h")[:quantos])
+            valores = [v for i, v in enumerate(valores) if i in mantidos]
+        return valores
+
+    def rolar_lote(self, gerador, quantidade: int):
+        """Soma deste termo em `quantidade` rolagens independentes (vetor NumPy)"""
+        valores = gerador.integers(1, self.faces + 1, size=(quantidade, self.quantidade))
+        if self.rerrolar:
+            refazer = valores <= self.rerrolar
+            valores[refazer] = gerador.integers(1, self.faces + 1, size=int(refazer.sum()))
+        if self.explodir:
+            ultimo = valores
+            for _ in range(MAX_EXPLOSOES):
+                explodiu = ultimo == self.faces
+                if not explodiu.any():
+                    break
+                ultimo = np.where(explodiu, gerador.integers(1, self.faces + 1, size=valores.shape), 0)
+                valores = valores + ultimo
+        if self.manter is not None:
+            lado, quantos = self.manter
+            valores = np.sort(valores, axis=1)
+            valores = valores[:, -quantos:] if lado == "h" else valores[:, :quantos]
+        return valores.sum(axis=1)
+
+
+class ExpressaoDados:
+    """Expressão compilada, ex.: `2d6+1d4+3`: termos com sinal (dados ou constantes)"""
+
+    __slots__ = ("notacao", "termos")
+
+    def __init__(self, notacao: str, termos: List[Tuple[int, object]]):
+        self.notacao = notacao
+        self.termos = termos  # (+1 | -1, Dado | int)
+
+    def rolar(self, rng: random.Random) -> Tuple[int, List[int]]:
+        """Retorna (total, [valores dos dados que contaram])"""
+        total, valores = 0, []
+        for sinal, termo in self.termos:
+            if isinstance(termo, Dado):
+                rolados = termo.rolar(rng)
+                valores.extend(rolados)
+                total += sinal * sum(rolados)
+            else:
+                total += sinal * termo
+        return total, valores
+
+    def rolar_lote(self, gerador, quantidade: int):
+        """Totais de `quantidade` rolagens, de uma vez (vetor NumPy de inteiros)"""
+        totais = np.zeros(quantidade, dtype=np.int64)
+        for sinal, termo in self.termos:
+            totais += sinal * (termo.rolar_lote(gerador, quantidade) if isinstance(termo, Dado) else termo)
+        return totais
+
+
+@lru_cache(maxsize=512)
+def compilar(notacao: str) -> ExpressaoDados:
+    """Interpreta a notação uma única vez; as chamadas seguintes vêm do cache"""
+    termos, posicao = [], 0
+    texto = notacao.strip()
+    while posicao < len(texto):
+        encontrado = TERMO.match(texto, posicao)
+        if not encontrado or encontrado.end() == posicao or (termos and not encontrado.group(1)):
+            raise ValueError(f"Formato de dado inválido: {notacao}")
+        sinal_txt, quantidade, faces, modificadores, constante = encontrado.groups()
+        sinal = -1 if sinal_txt == "-" else 1
+        if constante is not None:
+            termos.append((sinal, int(constante)))
+        else:
+            termos.append((sinal, _dado(notacao, quantidade, faces, modificadores)))
+        posicao = encontrado.end()
+    if not termos:
+        raise ValueError(f"Formato de dado inválido: {notacao}")
+    return ExpressaoDados(notacao, termos)
+
+
+def _dado(notacao: str, quantidade: str, faces: str, modificadores: str) -> Dado:
+    quantidade = int(quantidade) if quantidade else 1
+    faces = 100 if faces == "%" else int(faces)
+    if not 1 <= quantidade <= MAX_DADOS or not 1 <= faces <= MAX_FACES:
+        raise ValueError(f"Formato de dado inválido: {notacao}")
+    manter, rerrolar, explodir = None, 0, False
+    for nome, valor in MODIFICADOR.findall(modificadores):
+        nome = nome.lower()
+        if nome == "!":
+            explodir = faces > 1  # Um d1 explodiria para sempre
+        elif nome == "r":
+            rerrolar = min(int(valor or 1), faces - 1)
+        else:
+            manter = ("l" if nome == "kl" else "h", max(1, min(int(valor or 1), quantidade)))
+    return Dado(quantidade, faces, manter, rerrolar, explodir)
+
+
+class RoladorDados:
+    """
+    Gerador de números de uma sessão. Com uma semente, a mesma sequência de
+    comandos produz as mesmas rolagens; o gerador NumPy do lote deriva dela.
+    `rng` substitui o gerador padrão (ex.: um que grava ou reproduz os sorteios).
+    """
+
+    def __init__(self, semente: Optional[int] = None, rng: Optional[random.Random] = None):
+        self.semente = semente
+        self.rng = rng if rng is not None else random.Random(semente)
+        self._gerador = None
+
+    @property
+    def gerador(self):
+        """Gerador NumPy (criado na primeira rolagem em lote)"""
+        if self._gerador is None:
+            self._gerador = np.random.default_rng(
+                self.semente if self.semente is not None else self.rng.getrandbits(64)
+            )
+        return self._gerador
+
+    def rolar(self, notacao: str) -> Tuple[int, List[int]]:
+        return compilar(notacao).rolar(self.rng)
+
+    def d20(self, bonus: int = 0) -> Tuple[int, int]:
+        """Retorna (total, valor do d20)"""
+        valor = self.rng.randint(1, 20)
+        return valor + bonus, valor
+
+    def rolar_lote(self, notacao: str, quantidade: int):
+        """
+        Totais de `quantidade` rolagens da mesma expressão. Com NumPy, um vetor
+        calculado de uma vez; sem NumPy, uma lista rolada uma a uma.
+        """
+        expressao = compilar(notacao)
+        if np is None:
+            return [expressao.rolar(self.rng)[0] for _ in range(quantidade)]
+        return expressao.rolar_lote(self.gerador, quantidade)
+
+    def rolar_muitas(self, notacoes: Sequence[str]) -> List[int]:
+        """Totais de uma lista de expressões (na mesma ordem); expressões iguais saem num só lote"""
+        posicoes = defaultdict(list)
+        for indice, notacao in enumerate(notacoes):
+            posicoes[notacao].append(indice)
+        totais = [0] * len(notacoes)
+        for notacao, indices in posicoes.items():
+            for indice, total in zip(indices, self.rolar_lote(notacao, len(indices))):
+                totais[indice] = int(total)
+        return totais
+
+
+# Usado quando nenhuma sessão é informada (terminal, testes manuais)
+rolador_padrao = RoladorDados()
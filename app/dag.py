@@ -0,0 +1,46 @@
+# dag.py - Execução das fases de um turno como grafo de dependências
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Callable, Dict, Iterable, Tuple
+
+
+class TurnGraph:
+    """
+    Grafo de fases de um turno. Cada fase é uma função que recebe os
+    resultados das fases já concluídas e roda assim que suas dependências
+    terminam; fases independentes rodam em paralelo no executor.
+
+    As dependências precisam ser adicionadas antes de quem depende delas,
+    o que garante que o grafo não tenha ciclos.
+    """
+
+    def __init__(self):
+        self._fases: Dict[str, Tuple[Callable[[Dict[str, object]], object], Tuple[str, ...]]] = {}
+
+    def adicionar(self, nome: str, funcao: Callable[[Dict[str, object]], object], depende_de: Iterable[str] = ()) -> None:
+        depende_de = tuple(depende_de)
+        for dependencia in depende_de:
+            if dependencia not in self._fases:
+                raise ValueError(f"Fase '{nome}' depende de '{dependencia}', que não existe.")
+        if nome in self._fases:
+            raise ValueError(f"Fase '{nome}' adicionada duas vezes.")
+        self._fases[nome] = (funcao, depende_de)
+
+    def executar(self, executor: Executor) -> Dict[str, object]:
+        """Roda todas as fases e retorna {nome: resultado}; repassa a primeira exceção"""
+        resultados: Dict[str, object] = {}
+        pendentes = dict(self._fases)
+        em_execucao = {}
+
+        while pendentes or em_execucao:
+            for nome, (funcao, depende_de) in list(pendentes.items()):
+                if all(dependencia in resultados for dependencia in depende_de):
+                    futuro = executor.submit(funcao, dict(resultados))
+                    em_execucao[futuro] = nome
+                    del pendentes[nome]
+
+            concluidos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                nome = em_execucao.pop(futuro)
+                resultados[nome] = futuro.result()
+
+        return resultados
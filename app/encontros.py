@@ -0,0 +1,258 @@
+# encontros.py - Simulação Monte Carlo de combates e tabela de dificuldade dos encontros
+import bisect
+import itertools
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from combate import RegistroMonstros
+from dados import RoladorDados, compilar, np
+
+DANO_JOGADOR = "1d8"  # Magia de ataque usada na resolução mecânica do turno
+MAX_RODADAS = 200
+# Grupos que contêm um grupo menor vencido em menos desta fração não são simulados
+LIMIAR_DESCARTE = 0.01
+LINHAS_POR_LOTE = 100_000  # Combates simulados de uma vez (limita a memória)
+
+
+def simular_combates(
+    registro: RegistroMonstros,
+    composicoes,
+    hp,
+    ca,
+    bonus_jogador: int,
+    ca_jogador: int,
+    pv_jogador,
+    gerador,
+):
+    """
+    Joga N combates de uma vez, rodada a rodada, com as regras do turno:
+    o jogador ataca o primeiro inimigo vivo (d20 + bônus contra a CA, 1d8 de
+    dano, dobrado no 20 natural) e depois todos os inimigos vivos atacam com
+    o bônus e o dano do seu monstro no registro (dano dobrado no 20).
+
+    `composicoes`, `hp` e `ca` são matrizes (N, k): índice do monstro de cada
+    inimigo, PV e CA (PV 0 = vaga vazia). Um combate termina quando todos os
+    inimigos caem ou o dano sofrido alcança `pv_jogador`. A cada rodada só os
+    combates ainda em andamento são processados.
+
+    Retorna (dano sofrido, rodadas, vitória), vetores de tamanho N.
+    """
+    n = hp.shape[0]
+    bonus_monstro = np.array(registro.bonus_ataque, dtype=np.int64)
+    dano_jogador = compilar(DANO_JOGADOR)
+
+    dano_sofrido = np.zeros(n, dtype=np.int64)
+    rodadas = np.zeros(n, dtype=np.int64)
+    vitoria = np.zeros(n, dtype=bool)
+
+    # Combates em andamento: índices nos vetores de saída e suas matrizes
+    andamento = np.flatnonzero((hp > 0).any(axis=1))
+    vitoria[np.setdiff1d(np.arange(n), andamento)] = True
+    hp, ca, composicoes = hp[andamento], ca[andamento], composicoes[andamento]
+    sofrido = np.zeros(len(andamento), dtype=np.int64)
+
+    for rodada in range(1, MAX_RODADAS + 1):
+        m, k = hp.shape
+        if not m:
+            break
+        linhas = np.arange(m)
+
+        # Ataque do jogador contra o primeiro inimigo vivo
+        alvo = (hp > 0).argmax(axis=1)
+        d20 = gerador.integers(1, 21, m)
+        dano = dano_jogador.rolar_lote(gerador, m) + np.where(d20 == 20, dano_jogador.rolar_lote(gerador, m), 0)
+        hp[linhas, alvo] -= np.where(d20 + bonus_jogador >= ca[linhas, alvo], dano, 0)
+        vivos = hp > 0
+        restam = vivos.any(axis=1)
+
+        # Rodada dos inimigos: todos os vivos atacam; dano rolado só para os acertos
+        d20 = gerador.integers(1, 21, (m, k))
+        acerto = vivos & (d20 + bonus_monstro[composicoes] >= ca_jogador)
+        linhas_acerto, vagas = np.nonzero(acerto)
+        monstro = composicoes[linhas_acerto, vagas]
+        critico = d20[linhas_acerto, vagas] == 20
+        dano = np.zeros(len(linhas_acerto), dtype=np.int64)
+        for indice, expressao in enumerate(registro.dano):
+            deste = monstro == indice
+            acertos = int(deste.sum())
+            if acertos:
+                dano[deste] = expressao.rolar_lote(gerador, acertos) + np.where(
+                    critico[deste], expressao.rolar_lote(gerador, acertos), 0
+                )
+        sofrido += np.bincount(linhas_acerto, weights=dano, minlength=m).astype(np.int64)
+
+        # Guarda os combates que terminaram nesta rodada e segue só com os outros
+        continua = restam & (sofrido < pv_jogador)
+        terminou = ~continua
+        indices = andamento[terminou]
+        dano_sofrido[indices] = sofrido[terminou]
+        rodadas[indices] = rodada
+        vitoria[indices] = ~restam[terminou]
+        andamento = andamento[continua]
+        hp, ca, composicoes, sofrido = hp[continua], ca[continua], composicoes[continua], sofrido[continua]
+
+    # Combates que passaram do limite de rodadas contam como derrota
+    dano_sofrido[andamento] = sofrido
+    rodadas[andamento] = MAX_RODADAS
+    return dano_sofrido, rodadas, vitoria
+
+
+class TabelaEncontros:
+    """
+    Dificuldade pré-calculada de cada grupo possível de monstros (até
+    `max_inimigos`) em cada faixa de PV dos inimigos, para um jogador com o
+    bônus de ataque, a CA e os PV máximos dados. Na faixa f, os PV de cada
+    inimigo são os seus dados de vida multiplicados por `fracoes_pv[f]`.
+
+    O dano sofrido até vencer não depende dos PV atuais do jogador (só a
+    hora em que o combate para), então cada grupo é simulado uma vez com os
+    PV máximos e a tabela guarda a distribuição desse dano: a chance de vitória
+    com P PV é a fração das simulações vencidas com dano menor que P, uma busca
+    binária em microssegundos.
+
+    Os grupos são simulados por tamanho; um grupo que contém um grupo menor
+    quase nunca vencido (abaixo de LIMIAR_DESCARTE) não é simulado, já que
+    mais um inimigo não facilita o combate, e fica com vitória 0.
+    """
+
+    def __init__(
+        self,
+        registro: RegistroMonstros,
+        bonus_jogador: int,
+        ca_jogador: int,
+        pv_maximo: int,
+        fracoes_pv: Sequence[float] = (1.0,),
+        max_inimigos: int = 4,
+        simulacoes: int = 1000,
+        semente: Optional[int] = 0,
+    ):
+        self.registro = registro
+        self.bonus_jogador = bonus_jogador
+        self.ca_jogador = ca_jogador
+        self.fracoes_pv = list(fracoes_pv)
+        self.pv_maximo = max(1, pv_maximo)
+        self.simulacoes = simulacoes
+        self.max_inimigos = max_inimigos
+        self.simulados = 0  # Grupos realmente simulados (os demais foram descartados)
+        self._gerador = RoladorDados(semente).gerador
+        self._entradas: Dict[Tuple[int, Tuple[int, ...]], Tuple[List[int], int, float, float]] = {}
+
+        for quantidade in range(1, max_inimigos + 1):
+            chaves = []
+            for faixa in range(len(self.fracoes_pv)):
+                for grupo in itertools.combinations_with_replacement(range(len(registro)), quantidade):
+                    perdido = self._subgrupo_perdido(faixa, grupo)
+                    if perdido is None:
+                        chaves.append((faixa, grupo))
+                    else:
+                        self._entradas[(faixa, grupo)] = ([], simulacoes, perdido[2], perdido[3])
+            por_lote = max(1, LINHAS_POR_LOTE // simulacoes)
+            for inicio in range(0, len(chaves), por_lote):
+                self._simular(chaves[inicio:inicio + por_lote])
+
+    def _subgrupo_perdido(self, faixa: int, grupo: Tuple[int, ...]):
+        for subgrupo in set(itertools.combinations(grupo, len(grupo) - 1)):
+            entrada = self._entradas.get((faixa, subgrupo))
+            if entrada is not None and len(entrada[0]) < LIMIAR_DESCARTE * entrada[1]:
+                return entrada
+        return None
+
+    def _simular(self, chaves: List[Tuple[int, Tuple[int, ...]]]) -> None:
+        # Uma única simulação: `simulacoes` linhas por (faixa, grupo), todos do mesmo tamanho
+        simulacoes, gerador = self.simulacoes, self._gerador
+        forma = (len(chaves) * simulacoes, len(chaves[0][1]))
+        composicoes = np.repeat(np.array([grupo for _, grupo in chaves], dtype=np.int64), simulacoes, axis=0)
+        fracao = np.repeat(np.array([self.fracoes_pv[faixa] for faixa, _ in chaves]), simulacoes)
+        hp = np.zeros(forma, dtype=np.int64)
+        for indice, vida in enumerate(self.registro.vida):
+            do_monstro = composicoes == indice
+            quantos = int(do_monstro.sum())
+            if quantos:
+                pv = vida.rolar_lote(gerador, quantos) * np.broadcast_to(fracao[:, None], forma)[do_monstro]
+                hp[do_monstro] = np.maximum(1, np.ceil(pv))
+        # A ordem dos inimigos também é sorteada, como na geração real
+        ordem = np.argsort(gerador.random(forma), axis=1)
+        composicoes = np.take_along_axis(composicoes, ordem, axis=1)
+        hp = np.take_along_axis(hp, ordem, axis=1)
+        ca = np.array(self.registro.ca, dtype=np.int64)[composicoes]
+
+        dano, rodadas, vitoria = simular_combates(
+            self.registro, composicoes, hp, ca, self.bonus_jogador, self.ca_jogador, self.pv_maximo, gerador
+        )
+        for indice, chave in enumerate(chaves):
+            bloco = slice(indice * simulacoes, (indice + 1) * simulacoes)
+            self._entradas[chave] = (
+                np.sort(dano[bloco][vitoria[bloco]]).tolist(),  # Dano sofrido nas vitórias
+                simulacoes,
+                float(rodadas[bloco].mean()),
+                float(dano[bloco].mean()),
+            )
+        self.simulados += len(chaves)
+
+    def estatisticas(self, faixa: int, monstros_grupo: Sequence[int], pv_jogador: int) -> Dict[str, float]:
+        """
+        Chance de vitória com `pv_jogador` PV, rodadas e dano esperados contra um
+        grupo (índices dos monstros no registro) da faixa de PV `faixa`. Rodadas
+        e dano são médias dos combates simulados com os PV máximos.
+        """
+        danos_vitorias, total, rodadas, dano = self._entradas[(faixa, tuple(sorted(monstros_grupo)))]
+        vencidos = bisect.bisect_left(danos_vitorias, min(pv_jogador, self.pv_maximo))
+        return {"vitoria": vencidos / total, "rodadas": rodadas, "dano": dano}
+
+    def chance_vitoria(self, faixa: int, monstros_grupo: Sequence[int], pv_jogador: int) -> float:
+        return self.estatisticas(faixa, monstros_grupo, pv_jogador)["vitoria"]
+
+
+class CacheTabelas:
+    """Uma tabela por (bônus de ataque, CA, PV máximos) do jogador, calculada na primeira consulta"""
+
+    def __init__(self, registro: RegistroMonstros, **opcoes):
+        self.registro = registro
+        self.opcoes = opcoes
+        self._tabelas: Dict[Tuple[int, int, int], TabelaEncontros] = {}
+        self._lock = threading.Lock()
+        self._sem_numpy_avisado = False
+
+    def tabela(self, bonus_jogador: int, ca_jogador: int, pv_maximo: int) -> Optional[TabelaEncontros]:
+        """None só se o NumPy (dependência do requirements.txt) faltar na instalação"""
+        if np is None:
+            if not self._sem_numpy_avisado:
+                self._sem_numpy_avisado = True
+                print("NumPy não instalado: encontros sem balanceamento (pip install -r requirements.txt)")
+            return None
+        chave = (bonus_jogador, ca_jogador, pv_maximo)
+        with self._lock:  # Quem chegar durante o cálculo espera a mesma tabela
+            tabela = self._tabelas.get(chave)
+            if tabela is None:
+                tabela = TabelaEncontros(self.registro, bonus_jogador, ca_jogador, pv_maximo, **self.opcoes)
+                self._tabelas[chave] = tabela
+            return tabela
+
+
+def simular_encontro(
+    registro: RegistroMonstros,
+    inimigos: List[Dict],
+    bonus_jogador: int,
+    ca_jogador: int,
+    pv_jogador: int,
+    simulacoes: int = 20000,
+    rolador: Optional[RoladorDados] = None,
+) -> Dict[str, float]:
+    """
+    Simula um encontro concreto (PV e CA de cada inimigo já definidos) até o
+    fim, `simulacoes` vezes. Retorna a chance de vitória e as médias de
+    rodadas e dano sofrido.
+    """
+    gerador = (rolador or RoladorDados()).gerador
+    forma = (simulacoes, len(inimigos))
+    composicoes = np.broadcast_to([registro.indice(i["tipo"]) for i in inimigos], forma).copy()
+    hp = np.broadcast_to([i["hp"] for i in inimigos], forma).copy()
+    ca = np.broadcast_to([i["ca"] for i in inimigos], forma).copy()
+    dano, rodadas, vitoria = simular_combates(
+        registro, composicoes, hp, ca, bonus_jogador, ca_jogador, pv_jogador, gerador
+    )
+    return {
+        "vitoria": float(vitoria.mean()),
+        "rodadas": float(rodadas.mean()),
+        "dano": float(dano.mean()),
+    }
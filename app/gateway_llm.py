@@ -0,0 +1,176 @@
+# gateway_llm.py - Cliente HTTP compartilhado (pool de conexões) para a API da OpenAI ou um servidor compatível
+import atexit
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from metrics import registry
+
+URL_OPENAI = "https://api.openai.com/v1"
+
+conexoes_aquecidas = registry.counter(
+    "llm_warm_connections_total", "Conexões abertas com o servidor do LLM durante o aquecimento"
+)
+
+
+class PerfilModelo:
+    """Configuração de um nível de modelo: nome, temperatura, limite de tokens da resposta e timeout"""
+
+    def __init__(self, modelo: str, temperatura: float, max_tokens: Optional[int], timeout: float):
+        self.modelo = modelo
+        self.temperatura = temperatura
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+
+
+def _inteiro(nome: str, padrao: Optional[int]) -> Optional[int]:
+    valor = os.environ.get(nome)
+    return int(valor) if valor else padrao
+
+
+def perfis_do_ambiente() -> Dict[str, PerfilModelo]:
+    """
+    Níveis de modelo: "principal" (narração final e agentes líderes) e
+    "rapido" (chamadas curtas e estruturadas). Sem DND_LLM_FAST_MODEL, o
+    rápido usa o mesmo modelo, com temperatura menor e resposta limitada.
+    """
+    principal = PerfilModelo(
+        os.environ.get("DND_LLM_MODEL", "gpt-3.5-turbo"),
+        float(os.environ.get("DND_LLM_TEMPERATURE", 0.8)),
+        _inteiro("DND_LLM_MAX_TOKENS", None),
+        float(os.environ.get("DND_LLM_TIMEOUT", 60)),
+    )
+    rapido = PerfilModelo(
+        os.environ.get("DND_LLM_FAST_MODEL", principal.modelo),
+        float(os.environ.get("DND_LLM_FAST_TEMPERATURE", 0.3)),
+        _inteiro("DND_LLM_FAST_MAX_TOKENS", 400),
+        float(os.environ.get("DND_LLM_FAST_TIMEOUT", 20)),
+    )
+    return {"principal": principal, "rapido": rapido}
+
+
+def niveis_do_ambiente(padrao: Dict[str, str]) -> Dict[str, str]:
+    """Nível de cada agente/fase: `padrao` com as trocas de DND_LLM_TIERS (ex.: "regras=rapido,loot=principal")"""
+    niveis = dict(padrao)
+    for item in os.environ.get("DND_LLM_TIERS", "").split(","):
+        if "=" in item:
+            nome, nivel = (parte.strip() for parte in item.split("=", 1))
+            if nivel not in ("principal", "rapido"):
+                raise ValueError(f"Nível de modelo inválido em DND_LLM_TIERS: {item}")
+            niveis[nome] = nivel
+    return niveis
+
+
+class GatewayLLM:
+    """
+    Ponto único de acesso ao servidor do LLM. Todos os chat models criados
+    aqui usam o mesmo `httpx.Client`, com um pool de conexões mantidas
+    abertas (keep-alive) e timeouts explícitos, e apontam para `base_url`:
+    a API da OpenAI ou um servidor local compatível (llama.cpp, vLLM, mock).
+
+    `aquecer` abre conexões antes do primeiro turno, para que o handshake
+    TCP/TLS não entre na latência do jogador, e carrega o tokenizador do
+    modelo (o CrewAI conta os tokens com tiktoken, que baixa a codificação
+    no primeiro uso).
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        modelo: str = "gpt-3.5-turbo",
+        timeout: float = 60.0,
+        timeout_conexao: float = 5.0,
+        max_conexoes: int = 20,
+        conexoes_ociosas: int = 10,
+        tempo_ocioso: float = 90.0,
+        max_tentativas: int = 2,
+    ):
+        self.base_url = (base_url or os.environ.get("OPENAI_API_BASE") or URL_OPENAI).rstrip("/")
+        # Servidores locais costumam não exigir chave, mas o cliente da OpenAI exige uma
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY") or ("local" if base_url else None)
+        self.modelo = modelo
+        self.timeout = timeout
+        self.max_tentativas = max_tentativas
+        self.max_conexoes = max_conexoes
+        self.cliente = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_conexoes,
+                max_keepalive_connections=conexoes_ociosas,
+                keepalive_expiry=tempo_ocioso,
+            ),
+            timeout=httpx.Timeout(timeout, connect=timeout_conexao),
+        )
+        atexit.register(self.fechar)
+
+    @classmethod
+    def do_ambiente(cls) -> "GatewayLLM":
+        return cls(
+            base_url=os.environ.get("DND_LLM_BASE_URL") or None,
+            api_key=os.environ.get("DND_LLM_API_KEY") or None,
+            modelo=os.environ.get("DND_LLM_MODEL", "gpt-3.5-turbo"),
+            timeout=float(os.environ.get("DND_LLM_TIMEOUT", 60)),
+            max_conexoes=int(os.environ.get("DND_LLM_MAX_CONNECTIONS", 20)),
+            conexoes_ociosas=int(os.environ.get("DND_LLM_KEEPALIVE_CONNECTIONS", 10)),
+        )
+
+    def criar_chat(
+        self,
+        streaming: bool = False,
+        callbacks: Optional[List] = None,
+        temperature: float = 0.8,
+        modelo: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **opcoes,
+    ) -> ChatOpenAI:
+        return ChatOpenAI(
+            model=modelo or self.modelo,
+            temperature=temperature,
+            streaming=streaming,
+            callbacks=callbacks,
+            base_url=self.base_url,
+            api_key=self.api_key,
+            http_client=self.cliente,
+            request_timeout=timeout or self.timeout,
+            max_retries=self.max_tentativas,
+            **opcoes,
+        )
+
+    def aquecer(self, conexoes: int = 2) -> float:
+        """
+        Abre `conexoes` conexões em paralelo com um GET em /models (qualquer
+        resposta HTTP serve: a conexão fica no pool). Retorna a duração; erros
+        de rede só são registrados no log, o primeiro turno tenta de novo.
+        """
+        inicio = time.perf_counter()
+        conexoes = max(1, min(conexoes, self.max_conexoes))
+        cabecalhos = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+        def abrir(_):
+            try:
+                self.cliente.get(f"{self.base_url}/models", headers=cabecalhos)
+                conexoes_aquecidas.inc()
+                return True
+            except httpx.HTTPError as e:
+                print(f"Aquecimento da conexão com {self.base_url} falhou: {e}")
+                return False
+
+        # Um GET por thread ao mesmo tempo: cada um ocupa (e deixa no pool) uma conexão diferente
+        with ThreadPoolExecutor(max_workers=conexoes) as executor:
+            abertas = sum(executor.map(abrir, range(conexoes)))
+        try:
+            import tiktoken
+
+            tiktoken.encoding_for_model(self.modelo)
+        except Exception as e:  # Modelo desconhecido ou sem acesso à rede: fica para o primeiro turno
+            print(f"Tokenizador de {self.modelo} não carregado: {e}")
+        duracao = time.perf_counter() - inicio
+        print(f"{abertas}/{conexoes} conexões com {self.base_url} abertas em {duracao:.2f}s")
+        return duracao
+
+    def fechar(self) -> None:
+        self.cliente.close()
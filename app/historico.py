@@ -0,0 +1,181 @@
+# historico.py - Histórico da aventura com resumo incremental e orçamento de tokens
+import re
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+from metrics import registry
+
+tokens_economizados = registry.counter(
+    "history_prompt_tokens_saved_total",
+    "Tokens de prompt economizados pelo resumo do histórico (em relação aos 12 turnos literais)",
+)
+
+# Quantos turnos o histórico antigo colava literalmente em cada prompt
+TURNOS_SEM_RESUMO = 12
+
+# Palavras que costumam marcar fatos importantes da aventura
+TERMOS_RELEVANTES = (
+    "dano", "pv", "morre", "derrot", "venc", "fog", "encontr", "descobr", "revela",
+    "chave", "porta", "tesouro", "loot", "ouro", "aliad", "inimig", "combate", "ataca",
+)
+
+SEPARADOR_FRASES = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa de tokens sem tokenizador: ~4 caracteres por token em português"""
+    return (len(texto) + 3) // 4
+
+
+def cortar_em_tokens(texto: str, limite: int, do_fim: bool = False) -> str:
+    """Corta o texto para caber em `limite` tokens, em fronteira de palavra"""
+    if estimar_tokens(texto) <= limite:
+        return texto
+    caracteres = max(0, limite * 4 - 3)
+    if do_fim:
+        corte = texto[-caracteres:]
+        return "..." + corte[corte.find(" ") + 1:] if " " in corte else "..." + corte
+    corte = texto[:caracteres]
+    return (corte.rsplit(" ", 1)[0] if " " in corte else corte) + "..."
+
+
+def resumir_turno(texto: str, limite_tokens: int) -> str:
+    """
+    Resumo extrativo de um turno: as frases com mais nomes, números e termos
+    relevantes, na ordem original, dentro do limite de tokens.
+    """
+    frases = [f.strip() for f in SEPARADOR_FRASES.split(texto.strip()) if f.strip()]
+    if not frases:
+        return ""
+
+    def relevancia(indice_frase: Tuple[int, str]) -> float:
+        indice, frase = indice_frase
+        palavras = frase.split()
+        nomes = sum(1 for p in palavras[1:] if p[:1].isupper())
+        numeros = sum(1 for p in palavras if any(c.isdigit() for c in p))
+        termos = sum(1 for termo in TERMOS_RELEVANTES if termo in frase.lower())
+        # A primeira frase costuma situar a cena; desempate pela posição
+        return nomes + 2 * numeros + 2 * termos + (1.5 if indice == 0 else 0) - indice * 0.01
+
+    escolhidas: List[Tuple[int, str]] = []
+    usados = 0
+    for indice, frase in sorted(enumerate(frases), key=relevancia, reverse=True):
+        custo = estimar_tokens(frase) + 1
+        if usados + custo > limite_tokens:
+            continue
+        escolhidas.append((indice, frase))
+        usados += custo
+    if not escolhidas:
+        return cortar_em_tokens(frases[0], limite_tokens)
+    return " ".join(frase for _, frase in sorted(escolhidas))
+
+
+class HistoricoAventura:
+    """
+    Histórico usado como contexto nos prompts dos agentes.
+
+    Os últimos `turnos_literais` turnos entram na íntegra; os mais antigos
+    viram uma linha de resumo cada, calculada uma única vez quando o turno
+    sai da janela literal. Resumo e turnos literais somados cabem em
+    `orcamento_tokens`: se passar, o resumo mais antigo é condensado e depois
+    descartado, e por último os turnos literais também passam a ser resumidos.
+    """
+
+    def __init__(self, turnos_literais: int = 3, orcamento_tokens: int = 1200, tokens_por_resumo: int = 60):
+        self.turnos_literais = max(1, turnos_literais)
+        self.orcamento_tokens = orcamento_tokens
+        self.tokens_por_resumo = tokens_por_resumo
+        self.total_turnos = 0
+        self.recentes: Deque[Tuple[int, str]] = deque()  # (número do turno, texto)
+        self.resumo: Deque[Tuple[int, str, bool]] = deque()  # (número, resumo, já condensado)
+        self.omitidos = 0  # Turnos que já não cabem nem no resumo
+        # Tamanho dos turnos na íntegra, para comparar com o histórico sem resumo
+        self._tokens_literais: Deque[int] = deque(maxlen=TURNOS_SEM_RESUMO)
+
+    def adicionar(self, mensagem: str) -> None:
+        self.total_turnos += 1
+        self.recentes.append((self.total_turnos, mensagem))
+        self._tokens_literais.append(estimar_tokens(f"Turno {min(self.total_turnos, TURNOS_SEM_RESUMO)}: {mensagem}\n"))
+        while len(self.recentes) > self.turnos_literais:
+            self._resumir_mais_antigo()
+        self._ajustar_ao_orcamento()
+
+    def contexto(self) -> str:
+        if not self.recentes:
+            return "Nenhum turno anterior registrado."
+        partes = []
+        if self.resumo or self.omitidos:
+            linhas = [f"Turno {numero}: {texto}" for numero, texto, _ in self.resumo]
+            if self.omitidos:
+                linhas.insert(0, f"({self.omitidos} turnos iniciais omitidos)")
+            partes.append("Resumo dos turnos anteriores:\n" + "\n".join(linhas))
+            partes.append("Turnos recentes:")
+        partes.append("\n".join(f"Turno {numero}: {texto}" for numero, texto in self.recentes))
+        return "\n".join(partes)
+
+    def economia(self, contexto: str) -> int:
+        """Tokens a menos que este contexto custa em relação aos 12 turnos literais"""
+        return max(0, sum(self._tokens_literais) - estimar_tokens(contexto))
+
+    def registrar_economia(self, contexto: str, prompts: int) -> int:
+        """Contabiliza a economia de um turno em que o contexto foi enviado em `prompts` prompts"""
+        economia = self.economia(contexto) * prompts
+        tokens_economizados.inc(economia)
+        print(
+            f"Histórico: {estimar_tokens(contexto)} tokens de contexto x {prompts} prompts | "
+            f"{economia} tokens economizados neste turno"
+        )
+        return economia
+
+    def to_dict(self) -> Dict:
+        """Estado serializável em JSON (para salvar a partida)"""
+        return {
+            "turnos_literais": self.turnos_literais,
+            "orcamento_tokens": self.orcamento_tokens,
+            "tokens_por_resumo": self.tokens_por_resumo,
+            "total_turnos": self.total_turnos,
+            "recentes": [list(item) for item in self.recentes],
+            "resumo": [list(item) for item in self.resumo],
+            "omitidos": self.omitidos,
+            "tokens_literais": list(self._tokens_literais),
+        }
+
+    @classmethod
+    def from_dict(cls, dados: Dict) -> "HistoricoAventura":
+        historico = cls(dados["turnos_literais"], dados["orcamento_tokens"], dados["tokens_por_resumo"])
+        historico.total_turnos = dados["total_turnos"]
+        historico.recentes.extend(tuple(item) for item in dados["recentes"])
+        historico.resumo.extend(tuple(item) for item in dados["resumo"])
+        historico.omitidos = dados["omitidos"]
+        historico._tokens_literais.extend(dados["tokens_literais"])
+        return historico
+
+    def tamanho_estimado(self) -> int:
+        """Bytes aproximados de texto guardado"""
+        return sum(len(texto) for _, texto in self.recentes) + sum(len(texto) for _, texto, _ in self.resumo)
+
+    def _resumir_mais_antigo(self) -> None:
+        numero, texto = self.recentes.popleft()
+        self.resumo.append((numero, resumir_turno(texto, self.tokens_por_resumo), False))
+
+    def _tokens(self) -> int:
+        return estimar_tokens(self.contexto())
+
+    def _ajustar_ao_orcamento(self) -> None:
+        while self._tokens() > self.orcamento_tokens:
+            if self.resumo:
+                # Condensa o resumo mais antigo ainda não condensado; se todos já foram, descarta o mais antigo
+                for indice, (numero, texto, condensado) in enumerate(self.resumo):
+                    if not condensado:
+                        self.resumo[indice] = (numero, resumir_turno(texto, self.tokens_por_resumo // 3), True)
+                        break
+                else:
+                    self.resumo.popleft()
+                    self.omitidos += 1
+            elif len(self.recentes) > 1:
+                self._resumir_mais_antigo()
+            else:
+                # Um único turno maior que o orçamento: mantém o final, que é o mais recente
+                numero, texto = self.recentes[0]
+                self.recentes[0] = (numero, cortar_em_tokens(texto, max(16, self.orcamento_tokens - 10), do_fim=True))
+                break
@@ -0,0 +1,164 @@
+# jobs.py - Registro dos comandos enviados (estado e resultado) com limite de memória
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+
+from metrics import registry
+
+QUEUED = "queued"
+PROCESSING = "processing"
+DONE = "done"
+ERROR = "error"
+
+FINISHED = (DONE, ERROR)
+
+jobs_evicted = {
+    motivo: registry.counter(
+        "jobs_evicted_total", "Comandos removidos do registro de jobs", motivo=motivo
+    )
+    for motivo in ("ttl", "lru", "sessao")
+}
+
+
+class Job:
+    """Um comando de um jogador: texto, estado atual e resultado quando terminar"""
+
+    def __init__(self, session_id: Hashable, command_id: str, command: str, now: float):
+        self.session_id = session_id
+        self.id = command_id
+        self.command = command
+        self.status = QUEUED
+        self.data = None
+        self.history_additions: Optional[List[dict]] = None
+        self.created_at = now
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def approx_size(self) -> int:
+        return len(self.command) + len(str(self.data or ""))
+
+
+class JobStore:
+    """
+    Jobs de todas as sessões, por (sessão, id do comando).
+
+    - Jobs na fila ou em execução nunca são removidos
+    - Um job terminado expira `ttl` segundos depois de terminar
+    - Acima de `max_jobs`, os terminados menos consultados (LRU) saem primeiro
+    - `discard_session` remove os jobs de uma sessão sem afetar as outras
+    """
+
+    def __init__(
+        self,
+        max_jobs: int = 10000,
+        ttl: float = 900.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._clock = clock
+        self._jobs: "OrderedDict[Tuple[Hashable, str], Job]" = OrderedDict()  # ordem de uso
+        self._finished: "OrderedDict[Tuple[Hashable, str], Job]" = OrderedDict()  # ordem de término
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def get_or_create(self, session_id: Hashable, command_id: str, command: str) -> Tuple[Job, bool]:
+        """
+        Job do comando com este id (chave de idempotência), criando-o se ainda
+        não existir. Retorna (job, criado): um reenvio recebe o job original,
+        na fila, em execução ou já terminado, em vez de rodar o turno de novo.
+        """
+        with self._lock:
+            now = self._clock()
+            self._expire_locked(now)
+            key = (session_id, command_id)
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+                return job, False
+            job = Job(session_id, command_id, command, now)
+            self._jobs[key] = job
+            self._evict_locked(now)
+            return job, True
+
+    def get(self, session_id: Hashable, command_id: str) -> Optional[Job]:
+        with self._lock:
+            now = self._clock()
+            self._expire_locked(now)
+            key = (session_id, command_id)
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+            return job
+
+    def update(
+        self,
+        session_id: Hashable,
+        command_id: str,
+        status: str,
+        data=None,
+        history_additions: Optional[List[dict]] = None,
+    ) -> Optional[Job]:
+        """Muda o estado do job; None se ele já saiu do registro (ex.: sessão reiniciada)"""
+        with self._lock:
+            now = self._clock()
+            key = (session_id, command_id)
+            job = self._jobs.get(key)
+            if job is None:
+                return None
+            job.status = status
+            job.data = data
+            job.history_additions = history_additions
+            if job.finished:
+                job.finished_at = now
+                self._finished[key] = job
+            self._evict_locked(now)
+            return job
+
+    def discard_session(self, session_id: Hashable) -> int:
+        with self._lock:
+            keys = [key for key in self._jobs if key[0] == session_id]
+            for key in keys:
+                del self._jobs[key]
+                self._finished.pop(key, None)
+        jobs_evicted["sessao"].inc(len(keys))
+        return len(keys)
+
+    def evict_expired(self) -> int:
+        """Remove os jobs expirados; o servidor chama a cada `DND_SWEEP_INTERVAL` segundos"""
+        with self._lock:
+            return self._expire_locked(self._clock())
+
+    def _expire_locked(self, now: float) -> int:
+        removed = 0
+        # _finished está em ordem de término: basta olhar o começo
+        while self._finished:
+            key, job = next(iter(self._finished.items()))
+            if now - job.finished_at < self.ttl:
+                break
+            del self._finished[key]
+            del self._jobs[key]
+            removed += 1
+        jobs_evicted["ttl"].inc(removed)
+        return removed
+
+    def _evict_locked(self, now: float) -> None:
+        self._expire_locked(now)
+        if len(self._jobs) <= self.max_jobs:
+            return
+        removed = 0
+        for key, job in list(self._jobs.items()):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if not job.finished:
+                continue
+            del self._jobs[key]
+            del self._finished[key]
+            removed += 1
+        jobs_evicted["lru"].inc(removed)
@@ -0,0 +1,130 @@
+# llm_falso.py - LLM determinístico para benchmarks e testes sem a API da OpenAI
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from historico import estimar_tokens
+from metrics import registry
+from roteador import IntentRouter
+
+chamadas_llm_falso = registry.counter(
+    "fake_llm_calls_total", "Chamadas respondidas pelo LLM falso"
+)
+
+# Frases usadas para montar as narrações; a escolha depende só do prompt
+FRASES_NARRACAO = [
+    "A luz trêmula da tocha revela runas gastas nas paredes da cripta.",
+    "Um vento frio sopra do corredor e apaga por um instante o brilho das velas.",
+    "Alion sente o cheiro de pedra úmida e de algo muito mais antigo.",
+    "O eco dos passos se perde entre os sarcófagos alinhados.",
+    "Uma inscrição em élfico menciona o Coração Negro e um guardião esquecido.",
+    "Ossos estalam no escuro, como se algo observasse cada movimento.",
+    "O raio arcano rasga o ar e explode contra o alvo em faíscas violetas.",
+    "A criatura recua, ferida, e ruge de dor antes de avançar outra vez.",
+    "Entre as cinzas, algo metálico reflete a luz da tocha.",
+    "O silêncio volta a dominar a sala, pesado como a própria pedra.",
+]
+
+RESPOSTA_FINAL = "Thought: I now can give a great answer\nFinal Answer: "
+ACAO_JOGADOR = re.compile(r'Ação do jogador: "(.*)"')
+
+
+class LLMFalso(BaseChatModel):
+    """
+    Chat model determinístico que substitui o `ChatOpenAI` (DND_LLM_BACKEND=fake).
+
+    O mesmo prompt gera sempre a mesma resposta: JSON de roteamento para o
+    Orquestrador, JSON completo para o modo rápido e narrações montadas a
+    partir de frases fixas para os demais agentes, no formato
+    "Thought/Final Answer" que o CrewAI espera. A latência e o tamanho da
+    resposta são configuráveis, e o uso de tokens é informado como a API faria.
+    """
+
+    latencia: float = 0.0  # Segundos por chamada
+    tokens_resposta: int = 80  # Tamanho aproximado das narrações
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "dnd-falso"
+
+    def responder(self, prompt: str) -> str:
+        semente = int(hashlib.md5(prompt.encode("utf-8")).hexdigest(), 16)
+        acao = ACAO_JOGADOR.search(prompt)
+        acao = acao.group(1) if acao else ""
+        narrativa = self._narracao(semente)
+
+        if '"narrativa_final"' in prompt:
+            return json.dumps(
+                {
+                    "agente_lider": self._decisao(acao, prompt)["agente_lider"],
+                    "agentes_auxiliares": ["narrador"],
+                    "análise_situacional": f"Resposta simulada para: {acao}",
+                    "conteudo_lider": narrativa,
+                    "narrativa_final": narrativa,
+                },
+                ensure_ascii=False,
+            )
+        if '"direcionamento"' in prompt and '"agente_lider"' in prompt:
+            return json.dumps(self._decisao(acao, prompt), ensure_ascii=False)
+        return narrativa
+
+    def _narracao(self, semente: int) -> str:
+        # Frases embaralhadas sem repetição até esgotar a lista
+        sorteio = random.Random(semente)
+        frases: List[str] = []
+        baralho: List[str] = []
+        while estimar_tokens(" ".join(frases)) < self.tokens_resposta:
+            if not baralho:
+                baralho = sorteio.sample(FRASES_NARRACAO, len(FRASES_NARRACAO))
+            frases.append(baralho.pop())
+        return " ".join(frases)
+
+    def _decisao(self, acao: str, prompt: str) -> dict:
+        # O mesmo critério do roteador local, sem o limite de confiança
+        roteamento = IntentRouter().classificar(acao, em_combate="Estado atual: Em combate" in prompt)
+        if roteamento.decisao:
+            return roteamento.decisao
+        return {
+            "agente_lider": "mestre",
+            "agentes_auxiliares": ["narrador"],
+            "análise_situacional": f"Resposta simulada para: {acao}",
+            "direcionamento": "Descreva a situação atual e continue a narrativa.",
+        }
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = "\n".join(str(mensagem.content) for mensagem in messages)
+        texto = RESPOSTA_FINAL + self.responder(prompt)
+        chamadas_llm_falso.inc()
+
+        if self.streaming and run_manager:
+            # Tokens entregues aos poucos, com a latência distribuída entre eles
+            pedacos = re.findall(r"\S+\s*", texto)
+            for pedaco in pedacos:
+                time.sleep(self.latencia / len(pedacos))
+                run_manager.on_llm_new_token(pedaco)
+        elif self.latencia:
+            time.sleep(self.latencia)
+
+        uso = {
+            "prompt_tokens": estimar_tokens(prompt),
+            "completion_tokens": estimar_tokens(texto),
+        }
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=texto))],
+            llm_output={"token_usage": uso, "model_name": self._llm_type},
+        )
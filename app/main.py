@@ -1,42 +1,120 @@
+import copy
 import json
 import random
-from crewai import Agent, Task, Crew
-from langchain_openai import ChatOpenAI
+import time
+from crewai import Agent
 from typing import Dict, List, Tuple, Optional
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dag import TurnGraph
+from gateway_llm import GatewayLLM, niveis_do_ambiente, perfis_do_ambiente
+from cassete import LLMCassete, cassete_do_ambiente
+from characters import characters
+from combate import ResultadoRodada, monstros, resolver_rodada
+from dados import RoladorDados, rolador_padrao
+from encontros import CacheTabelas, TabelaEncontros
+from historico import HistoricoAventura
+from pipelines import PipelineAgente, copiar_agente
+from roteador import IntentRouter, RoutingCache, contem_termo, TERMOS_ATAQUE, TERMOS_DEFESA, TERMOS_MOVIMENTO
+from streaming import streaming_narracao
+from telemetria import MedidorLatenciaLLM, medidor_tokens, medir_fase
+from metrics import registry
 
 # Configuração da LLM
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.8)
-
-# Carrega a ficha do personagem e adiciona valores padrão para campos ausentes
-filepath = os.path.join(os.path.dirname(__file__), "personagem.json")
-try:
-    with open(filepath, "r", encoding="utf-8") as file:
-        ficha = json.load(file)
-        print(f"Ficha carregada de: {filepath}")
-        print(f"Atributos disponíveis: {list(ficha.get('atributos', {}).keys())}")
-
-        # Adicionar valores padrão para campos ausentes
-        if "proficiencia" not in ficha:
-            ficha["proficiencia"] = 2  # Valor padrão para nível 1
-except FileNotFoundError:
-    print(f"Arquivo não encontrado: {filepath}")
-    # Criar uma ficha básica como fallback
-    ficha = {
-        "nome": "Alion",
-        "classe": "Mago",
-        "raca": "Humano",
-        "nivel": 1,
-        "atributos": {
-            "Força": 8,
-            "Destreza": 14,
-            "Constituição": 12,
-            "Inteligência": 17,
-            "Sabedoria": 11,
-            "Carisma": 13,
-        },
-        "proficiencia": 2,
-    }
+# DND_LLM_BACKEND=fake troca a OpenAI por um LLM determinístico local (benchmarks e testes)
+BACKEND_LLM = os.environ.get("DND_LLM_BACKEND", "openai")
+# DND_CASSETTE grava a partida (prompts, respostas e sorteios); com
+# DND_CASSETTE_MODE=replay a reproduz sem rede (ver cassete.py)
+cassete = cassete_do_ambiente()
+# Cliente HTTP compartilhado por todos os agentes (pool de conexões, timeouts e
+# DND_LLM_BASE_URL para um servidor local compatível com a API da OpenAI)
+gateway = GatewayLLM.do_ambiente() if BACKEND_LLM != "fake" else None
+
+
+# Níveis de modelo: o "rapido" (menor, mais barato, temperatura baixa) fica com
+# as chamadas curtas e estruturadas; o "principal", com a narração final
+PERFIS_LLM = perfis_do_ambiente()
+NIVEIS_LLM = niveis_do_ambiente(
+    {"orquestrador": "rapido", "contra_ataque": "rapido", "loot": "rapido"}
+)
+
+
+def criar_llm(streaming: bool = False, callbacks: Optional[List] = None, nivel: str = "principal"):
+    perfil = PERFIS_LLM[nivel]
+    callbacks = list(callbacks or []) + [medidor_tokens, MedidorLatenciaLLM(nivel, perfil.modelo)]
+    if cassete is not None and not cassete.gravando:
+        return LLMCassete(cassete=cassete, streaming=streaming, callbacks=callbacks)
+    if cassete is not None:
+        callbacks += cassete.callbacks()
+    if BACKEND_LLM == "fake":
+        from llm_falso import LLMFalso
+
+        latencia = os.environ.get("DND_FAKE_LLM_LATENCY", "0")
+        if nivel == "rapido":
+            latencia = os.environ.get("DND_FAKE_LLM_FAST_LATENCY", latencia)
+        return LLMFalso(
+            latencia=float(latencia),
+            tokens_resposta=int(os.environ.get("DND_FAKE_LLM_TOKENS", 80)),
+            streaming=streaming,
+            callbacks=callbacks,
+        )
+    return gateway.criar_chat(
+        streaming=streaming,
+        callbacks=callbacks,
+        temperature=perfil.temperatura,
+        modelo=perfil.modelo,
+        timeout=perfil.timeout,
+        max_tokens=perfil.max_tokens,
+    )
+
+
+# Um LLM por nível; as versões com streaming repassam os tokens da narração ao jogador
+llms = {
+    (nivel, streaming): criar_llm(
+        streaming=streaming, callbacks=[streaming_narracao] if streaming else None, nivel=nivel
+    )
+    for nivel in PERFIS_LLM
+    for streaming in (False, True)
+}
+
+
+def llm_de(nome: str, streaming: bool = False):
+    """LLM do nível configurado para um agente ou fase (principal, se não configurado)"""
+    return llms[(NIVEIS_LLM.get(nome, "principal"), streaming)]
+
+
+# Ficha usada quando personagem.json não existe
+FICHA_PADRAO = {
+    "nome": "Alion",
+    "classe": "Mago",
+    "raca": "Humano",
+    "nivel": 1,
+    "atributos": {
+        "Força": 8,
+        "Destreza": 14,
+        "Constituição": 12,
+        "Inteligência": 17,
+        "Sabedoria": 11,
+        "Carisma": 13,
+    },
+    "pv_maximo": 7,
+    "pv_atual": 7,
+    "ca": 12,
+    "proficiencia": 2,
+}
+
+
+def carregar_ficha() -> Dict:
+    """
+    Cópia da ficha base do personagem. O arquivo fica em cache no repositório
+    compartilhado com o servidor e só é relido quando muda no disco.
+    """
+    try:
+        return copy.deepcopy(characters.get().data)
+    except FileNotFoundError:
+        print(f"Arquivo não encontrado: {characters.path('personagem')}")
+        return copy.deepcopy(FICHA_PADRAO)
+
 
 # --------------------------
 # Sistema de Dados e Mecânicas D&D
@@ -45,70 +123,40 @@ except FileNotFoundError:
 
 class DiceSystem:
     @staticmethod
-    def roll(dice_notation: str) -> Tuple[int, List[int]]:
+    def roll(dice_notation: str, rolador: Optional[RoladorDados] = None) -> Tuple[int, List[int]]:
         """
-        Rola dados no formato padrão D&D (exemplo: 2d6, 1d20, 3d8+5)
+        Rola dados no formato D&D (exemplos: 1d20, 3d8+5, 2d6+1d4+3, 2d20kh1
+        para vantagem, 4d6kh3, 2d6r2, 1d6!). A notação é compilada uma vez e
+        reaproveitada; `rolador` é o gerador da sessão.
         Retorna: (total, [valores individuais])
         """
-        # Parse da notação de dados
-        parts = dice_notation.lower().split("d")
-        if len(parts) != 2:
-            raise ValueError(f"Formato de dado inválido: {dice_notation}")
-
-        # Lidar com modificadores (ex: 1d20+5)
-        mod = 0
-        if "+" in parts[1]:
-            dice_parts = parts[1].split("+")
-            parts[1] = dice_parts[0]
-            mod = int(dice_parts[1])
-        elif "-" in parts[1]:
-            dice_parts = parts[1].split("-")
-            parts[1] = dice_parts[0]
-            mod = -int(dice_parts[1])
-
-        # Converter para inteiros
-        try:
-            num_dice = int(parts[0]) if parts[0] else 1
-            dice_type = int(parts[1])
-        except ValueError:
-            raise ValueError(f"Formato de dado inválido: {dice_notation}")
-
-        # Realizar as rolagens
-        results = [random.randint(1, dice_type) for _ in range(num_dice)]
-        total = sum(results) + mod
-
-        return total, results
+        return (rolador or rolador_padrao).rolar(dice_notation)
 
     @staticmethod
-    def attack_roll(bonus: int) -> Tuple[int, int, bool]:
+    def attack_roll(bonus: int, rolador: Optional[RoladorDados] = None) -> Tuple[int, int, bool]:
         """
         Realiza uma rolagem de ataque D&D 5e
         Retorna: (total, valor do d20, crítico?)
         """
-        d20_roll = random.randint(1, 20)
-        total = d20_roll + bonus
+        total, d20_roll = (rolador or rolador_padrao).d20(bonus)
         is_critical = d20_roll == 20
         return total, d20_roll, is_critical
 
     @staticmethod
-    def check_roll(ability_mod: int, proficiency: int = 0) -> Tuple[int, int]:
+    def check_roll(ability_mod: int, proficiency: int = 0, rolador: Optional[RoladorDados] = None) -> Tuple[int, int]:
         """
         Realiza uma rolagem de teste de habilidade D&D 5e
         Retorna: (total, valor do d20)
         """
-        d20_roll = random.randint(1, 20)
-        total = d20_roll + ability_mod + proficiency
-        return total, d20_roll
+        return (rolador or rolador_padrao).d20(ability_mod + proficiency)
 
     @staticmethod
-    def save_roll(save_mod: int) -> Tuple[int, int]:
+    def save_roll(save_mod: int, rolador: Optional[RoladorDados] = None) -> Tuple[int, int]:
         """
         Realiza uma rolagem de resistência D&D 5e
         Retorna: (total, valor do d20)
         """
-        d20_roll = random.randint(1, 20)
-        total = d20_roll + save_mod
-        return total, d20_roll
+        return (rolador or rolador_padrao).d20(save_mod)
 
 
 class CharacterManager:
@@ -222,8 +270,36 @@ class CharacterManager:
 # --------------------------
 
 
+# Inimigos da Cripta (ataque, CA, dados de vida e iniciativa em monstros.json)
+TIPOS_INIMIGOS = monstros.nomes
+
+# Faixas de PV dos inimigos: fração dos dados de vida, da original (mais forte) para a mais fraca
+FRACOES_PV_INIMIGOS = [1.0, 0.5, 0.25]
+# Encontros hostis escolhidos para o jogador vencer com pelo menos esta chance
+BALANCEAR_ENCONTROS = os.environ.get("DND_ENCOUNTER_BALANCE", "1") != "0"
+CHANCE_VITORIA_ALVO = float(os.environ.get("DND_ENCOUNTER_TARGET_WIN", 0.6))
+TENTATIVAS_ENCONTRO = 4  # Grupos sorteados por quantidade e faixa de PV
+
+tabelas_encontro = CacheTabelas(
+    monstros,
+    fracoes_pv=FRACOES_PV_INIMIGOS,
+    simulacoes=int(os.environ.get("DND_ENCOUNTER_SIMULATIONS", 1000)),
+)
+
+
+def tabela_encontros(ficha: Dict) -> Optional[TabelaEncontros]:
+    """Tabela de dificuldade para o personagem (calculada na primeira vez, ~1s)"""
+    return tabelas_encontro.tabela(
+        CharacterManager.calculate_attack_bonus(ficha, "magia"),
+        ficha.get("ca", 10),
+        ficha.get("pv_maximo", 0),
+    )
+
+
 class EventSystem:
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
+        # Gerador dos sorteios de eventos (o da sessão, para poder gravar e reproduzir)
+        self.rng = rng if rng is not None else random.Random()
         self.encounter_chance = 5.0  # Chance inicial de 5%
         self.turn_counter = 0
         self.in_combat = False
@@ -234,61 +310,54 @@ class EventSystem:
         """Incrementa o contador de turnos e aumenta a chance de encontro"""
         self.turn_counter += 1
         # Incremento entre 2.5% e 5%
-        self.encounter_chance += random.uniform(2.5, 5.0)
+        self.encounter_chance += self.rng.uniform(2.5, 5.0)
 
-    def check_random_encounter(self) -> Optional[Dict]:
+    def check_random_encounter(self, ficha: Optional[Dict] = None) -> Optional[Dict]:
         """
-        Verifica se ocorre um encontro aleatório
+        Verifica se ocorre um encontro aleatório. Com a ficha, os inimigos são
+        escolhidos pela tabela de dificuldade (ver `escolher_inimigos`).
         Retorna: None ou um dicionário descrevendo o encontro
         """
         if self.in_combat:
             return None  # Já está em combate, não gerar novos encontros
 
-        roll = random.random() * 100  # Porcentagem
+        roll = self.rng.random() * 100  # Porcentagem
 
         if roll <= self.encounter_chance:
             # Ocorreu um encontro! Resetar a chance
             self.encounter_chance = 5.0
 
             # Determinar o tipo de encontro (70% inimigo, 30% aliado)
-            encounter_type = "inimigo" if random.random() < 0.7 else "aliado"
+            encounter_type = "inimigo" if self.rng.random() < 0.7 else "aliado"
 
             if encounter_type == "inimigo":
-                # Gerar inimigos apropriados para a Cripta
-                enemy_types = [
-                    "esqueleto",
-                    "zumbi",
-                    "sombra",
-                    "espectro",
-                    "cultista",
-                    "carniçal",
-                    "aparição",
-                    "ghoul",
-                ]
                 # Determinar quantidade com base no turno
                 quantity = min(1 + self.turn_counter // 3, 4)  # Max 4 inimigos
-
-                enemies = []
-                for _ in range(max(1, random.randint(1, quantity))):
-                    enemy_type = random.choice(enemy_types)
-                    hp = random.randint(10, 30)  # HP simplificado
-                    enemies.append(
-                        {
-                            "tipo": enemy_type,
-                            "hp": hp,
-                            "hp_max": hp,
-                            "ca": random.randint(10, 14),
-                        }
-                    )
+                enemy_types, faixa, dificuldade = self.escolher_inimigos(
+                    max(1, self.rng.randint(1, quantity)), ficha
+                )
+
+                # PV, CA e iniciativa de cada inimigo vêm do registro de monstros
+                enemies = [
+                    monstros.criar_inimigo(enemy_type, FRACOES_PV_INIMIGOS[faixa], self.rng)
+                    for enemy_type in enemy_types
+                ]
 
                 self.current_enemies = enemies
                 self.in_combat = True
 
-                return {
+                encontro = {
                     "tipo": "encontro_hostil",
                     "inimigos": enemies,
-                    "descricao": f"Encontro com {len(enemies)} {enemy_types[0] if len(enemies) == 1 else 'criaturas'}",
+                    "descricao": f"Encontro com {len(enemies)} {enemies[0]['tipo'] if len(enemies) == 1 else 'criaturas'}",
                 }
+                if dificuldade is not None:
+                    encontro["dificuldade"] = dificuldade
+                    print(
+                        f"Encontro: {', '.join(enemy_types)} (PV x{FRACOES_PV_INIMIGOS[faixa]}) | "
+                        f"vitória {dificuldade['vitoria']:.0%}, ~{dificuldade['rodadas']:.1f} rodadas"
+                    )
+                return encontro
             else:
                 # Encontro com aliado
                 ally_types = [
@@ -298,10 +367,10 @@ class EventSystem:
                     "pesquisador arcano",
                 ]
 
-                ally_type = random.choice(ally_types)
+                ally_type = self.rng.choice(ally_types)
                 ally = {
                     "tipo": ally_type,
-                    "atitude": random.choice(
+                    "atitude": self.rng.choice(
                         ["amigável", "cauteloso", "desesperado", "sábio"]
                     ),
                 }
@@ -316,11 +385,53 @@ class EventSystem:
 
         return None
 
+    def escolher_inimigos(
+        self, quantidade: int, ficha: Optional[Dict] = None
+    ) -> Tuple[List[str], int, Optional[Dict]]:
+        """
+        Tipos dos inimigos, faixa de PV e dificuldade estimada do encontro.
+        Com a ficha, consulta a tabela Monte Carlo: fica com o primeiro grupo
+        (do mais numeroso e forte ao mais fraco) em que o jogador, com os PV
+        atuais, vence com chance de pelo menos CHANCE_VITORIA_ALVO; se nenhum
+        chegar lá, com o mais fácil que foi sorteado.
+        """
+        tabela = tabela_encontros(ficha) if ficha is not None and BALANCEAR_ENCONTROS else None
+        if tabela is None:
+            return [self.rng.choice(TIPOS_INIMIGOS) for _ in range(quantidade)], 0, None
+
+        pv = ficha.get("pv_atual", ficha.get("pv_maximo", 0))
+        mais_facil = None
+        for tamanho in range(quantidade, 0, -1):
+            for faixa in range(len(FRACOES_PV_INIMIGOS)):
+                for _ in range(TENTATIVAS_ENCONTRO):
+                    tipos = [self.rng.choice(TIPOS_INIMIGOS) for _ in range(tamanho)]
+                    dificuldade = tabela.estatisticas(faixa, [monstros.indice(t) for t in tipos], pv)
+                    if dificuldade["vitoria"] >= CHANCE_VITORIA_ALVO:
+                        return tipos, faixa, dificuldade
+                    if mais_facil is None or dificuldade["vitoria"] > mais_facil[2]["vitoria"]:
+                        mais_facil = (tipos, faixa, dificuldade)
+        return mais_facil
+
     def end_combat(self) -> None:
         """Finaliza o estado de combate"""
         self.in_combat = False
         self.current_enemies = []
 
+    def to_dict(self) -> Dict:
+        return {
+            "encounter_chance": self.encounter_chance,
+            "turn_counter": self.turn_counter,
+            "in_combat": self.in_combat,
+            "current_enemies": self.current_enemies,
+            "current_allies": self.current_allies,
+        }
+
+    @classmethod
+    def from_dict(cls, dados: Dict, rng: Optional[random.Random] = None) -> "EventSystem":
+        event_system = cls(rng)
+        event_system.__dict__.update(copy.deepcopy(dados))
+        return event_system
+
 
 # --------------------------
 # Definição dos Agentes
@@ -336,7 +447,7 @@ Você é um coordenador central altamente inteligente que analisa a situação a
 o histórico recente e a intenção do jogador para determinar qual agente especializado deve
 assumir o controle narrativo. Sua função é garantir transições fluidas entre diferentes
 especialistas e manter uma experiência coesa e imersiva para o jogador.""",
-    llm=llm,
+    llm=llm_de("orquestrador"),
 )
 
 # Agente Mestre - Supervisiona a narrativa
@@ -348,7 +459,7 @@ mestre = Agent(
 Você supervisiona a narrativa para garantir coesão, continuidade e progressão da aventura.
 Trabalha diretamente com o Orquestrador para determinar quais elementos narrativos precisam ser desenvolvidos.
 Seu estilo é épico e envolvente, mantendo o tom de uma verdadeira aventura de D&D.""",
-    llm=llm,
+    llm=llm_de("mestre"),
 )
 
 # Agente Narrativo - Cria a descrição dramática
@@ -360,8 +471,19 @@ narrador = Agent(
 Você narra os acontecimentos do jogo com estilo, tensão e conexão com o arco da aventura.
 Sua função é transformar decisões mecânicas em momentos memoráveis e envolventes.
 Seu estilo varia conforme o contexto: épico durante exploração e mais tático durante combates.""",
-    llm=llm,
+    llm=llm_de("narrador", streaming=True),
 )
+# Narrador das narrações curtas (contra-ataque, loot), por nível de modelo
+narradores_por_nivel = {NIVEIS_LLM.get("narrador", "principal"): narrador}
+
+
+def narrador_da_fase(fase: str) -> Agent:
+    """O mesmo narrador, com o LLM (com streaming) do nível configurado para a fase"""
+    nivel = NIVEIS_LLM.get(fase, "principal")
+    if nivel not in narradores_por_nivel:
+        narradores_por_nivel[nivel] = copiar_agente(narrador, llm=llms[(nivel, True)])
+    return narradores_por_nivel[nivel]
+
 
 # Agente de Mundo - Especialista em ambientação
 mundo = Agent(
@@ -373,7 +495,7 @@ Você cria descrições ricas dos ambientes, focando em detalhes sensoriais, atm
 que podem ser relevantes para a exploração. Sua função é fazer o mundo parecer vivo e tangível.
 Quando o jogador faz perguntas sobre o ambiente, você assume o controle para fornecer detalhes
 imersivos que ajudam a criar uma imagem mental clara do cenário.""",
-    llm=llm,
+    llm=llm_de("mundo"),
 )
 
 # Agente de NPCs - Dá vida aos personagens não-jogadores
@@ -386,7 +508,7 @@ Você interpreta todos os personagens não-jogadores com personalidades distinta
 claras e reações realistas. Sua função é fazer cada interação social parecer genuína.
 Quando o jogador interage com um NPC, você assume o controle da narração para criar diálogos
 autênticos e reações que refletem a personalidade e os objetivos desses personagens.""",
-    llm=llm,
+    llm=llm_de("npcs"),
 )
 
 # Agente de Regras - Aplica as mecânicas do sistema
@@ -399,7 +521,7 @@ Você conhece profundamente o sistema D&D 5e e aplica as regras de forma justa e
 Sua função é resolver qualquer situação mecânica mantendo o jogo fluindo.
 Você garante que a ficha do personagem seja utilizada corretamente, e que os
 modificadores apropriados sejam aplicados em cada situação.""",
-    llm=llm,
+    llm=llm_de("regras"),
 )
 
 # Agente de Combate Aprimorado - Com sistema de rolagem de dados
@@ -413,74 +535,45 @@ Seu estilo de narração muda para um tom mais tático e objetivo durante combat
 a uma mesa de RPG real. Você integra resultados reais de rolagens de dados nas suas descrições,
 sempre explicando claramente os resultados e suas consequências. Você mantém o registro do
 estado dos combatentes e garante que as ações tenham impacto mecânico adequado.""",
-    llm=llm,
+    llm=llm_de("combate"),
 )
 
+# Agentes que podem liderar ou auxiliar um turno, pelo nome usado pelo Orquestrador
+AGENTES_POR_NOME = {
+    "narrador": narrador,
+    "mestre": mestre,
+    "mundo": mundo,
+    "npcs": npcs,
+    "regras": regras,
+    "combate": combate,
+}
+
+# Roteador local: decide o agente líder sem LLM quando a intenção é óbvia
+roteador = IntentRouter(
+    confianca_minima=float(os.environ.get("DND_ROUTER_MIN_CONFIDENCE", 0.75))
+)
 
-# Cache para manter o histórico da aventura
-cache = []
-# Sistema de eventos
-event_system = EventSystem()
-
-
-def adicionar_ao_cache(mensagem):
-    cache.append(mensagem)
-    if len(cache) > 12:  # Aumentado para manter mais contexto
-        cache.pop(0)
-
-
-def contexto_cache():
-    if not cache:
-        return "Nenhum turno anterior registrado."
-    return "\n".join([f"Turno {i + 1}: {msg}" for i, msg in enumerate(cache)])
+# Decisões do Orquestrador já calculadas, por sessão e entradas canônicas
+cache_roteamento = RoutingCache(
+    max_entradas=int(os.environ.get("DND_ROUTING_CACHE_SIZE", 2048))
+)
 
+# Threads para as fases independentes de um turno (líder, dados, auxiliares)
+executor_fases = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("DND_PHASE_THREADS", 8)),
+    thread_name_prefix="fase-turno",
+)
 
 # --------------------------
-# Sistema de Orquestração Aprimorado
+# Modelos de Prompt e Pipelines dos Agentes
 # --------------------------
 
+# Os prompts são modelos de `str.format`: as crews e tarefas são montadas uma
+# vez (por thread) e cada turno só preenche as variáveis
 
-def executar_turno(comando_usuario):
-    # Incrementar o contador de turnos e verificar eventos aleatórios
-    event_system.increment_turn()
-    random_encounter = event_system.check_random_encounter()
-
-    contexto = contexto_cache()
-    info_estado_jogo = {
-        "em_combate": event_system.in_combat,
-        "inimigos_atuais": event_system.current_enemies,
-        "aliados_atuais": event_system.current_allies,
-    }
-
-    # Contexto adicional para o evento aleatório, se ocorrer
-    contexto_evento = ""
-    if random_encounter:
-        if random_encounter["tipo"] == "encontro_hostil":
-            inimigos_str = ", ".join(
-                [
-                    f"{e['tipo']} (PV: {e['hp']}/{e['hp_max']})"
-                    for e in random_encounter["inimigos"]
-                ]
-            )
-            contexto_evento = f"""
-EVENTO ALEATÓRIO: Encontro hostil!
-Inimigos: {inimigos_str}
-Este encontro inicia automaticamente um combate. O jogador deve ser informado e 
-a narrativa deve incluir a aparição dos inimigos de forma fluida e surpreendente.
-"""
-        else:
-            contexto_evento = f"""
-EVENTO ALEATÓRIO: Encontro com aliado!
-Aliado: {random_encounter['aliado']['tipo']} ({random_encounter['aliado']['atitude']})
-Este encontro deve ser introduzido na narrativa de forma natural. O NPC pode oferecer
-informações, ajuda ou ter seus próprios objetivos na Cripta.
-"""
-
-    # Fase 1: Orquestrador inteligente analisa o comando e decide qual agente deve assumir
-    analise_orquestrador = Task(
-        description=f"""Todas as respostas devem ser em português do Brasil e DEVEM seguir ESTRITAMENTE o formato JSON especificado.
+PROMPT_ORQUESTRADOR = """Todas as respostas devem ser em português do Brasil e DEVEM seguir ESTRITAMENTE o formato JSON especificado.
 Contexto da aventura: Um mago humano chamado Alion está explorando a Cripta do Coração Negro.
-Estado atual: {"Em combate" if info_estado_jogo["em_combate"] else "Exploração"}.
+Estado atual: {estado_atual}.
 Histórico recente:
 {contexto}
 
@@ -511,170 +604,23 @@ IMPORTANTE: Sua resposta DEVE ser um objeto JSON válido no seguinte formato e n
 }}
 
 NÃO adicione explicações, comentários ou qualquer outro texto fora do JSON.
-""",
-        agent=orquestrador,
-        expected_output="Objeto JSON com agente líder, agentes auxiliares e direcionamento",
-    )
-
-    crew_orquestradora = Crew(
-        agents=[orquestrador], tasks=[analise_orquestrador], verbose=True
-    )
-
-    # Executa a orquestração inicial
-    resultado_orquestrador = crew_orquestradora.kickoff()
-    print("Tipo do resultado do orquestrador:", type(resultado_orquestrador))
-    print("Resultado do orquestrador:", resultado_orquestrador)
-
-    try:
-        # Primeiro, obter a string do resultado
-        resultado_texto = str(resultado_orquestrador).strip()
-
-        # Tentar identificar o início do JSON caso haja texto antes
-        if "{" in resultado_texto:
-            inicio_json = resultado_texto.find("{")
-            resultado_texto = resultado_texto[inicio_json:]
-
-            # Encontrar o fechamento do JSON
-            contador = 1
-            for i in range(1, len(resultado_texto)):
-                if resultado_texto[i] == "{":
-                    contador += 1
-                elif resultado_texto[i] == "}":
-                    contador -= 1
-                    if contador == 0:
-                        resultado_texto = resultado_texto[: i + 1]
-                        break
-
-        # Tentar fazer parse do JSON
-        decisao = json.loads(resultado_texto)
-
-        # Validação
-        if not isinstance(decisao, dict):
-            raise ValueError("O retorno do orquestrador não é um dicionário válido.")
-
-        # Verificar se tem as chaves necessárias
-        campos_necessarios = [
-            "agente_lider",
-            "agentes_auxiliares",
-            "análise_situacional",
-            "direcionamento",
-        ]
-        for campo in campos_necessarios:
-            if campo not in decisao:
-                raise ValueError(f"Campo necessário '{campo}' não encontrado no JSON.")
-
-    except json.JSONDecodeError as e:
-        print(f"Erro ao decodificar JSON: {e}")
-        # Valor padrão
-        decisao = {
-            "agente_lider": "mestre",
-            "agentes_auxiliares": ["narrador"],
-            "análise_situacional": "Falha na análise situacional.",
-            "direcionamento": "Descreva a situação atual e continue a narrativa.",
-        }
-    except ValueError as e:
-        print(f"Erro no formato do retorno: {e}")
-        # Valor padrão
-        decisao = {
-            "agente_lider": "mestre",
-            "agentes_auxiliares": ["narrador"],
-            "análise_situacional": "Falha na análise situacional.",
-            "direcionamento": "Descreva a situação atual e continue a narrativa.",
-        }
-    except Exception as e:
-        print(f"Erro inesperado: {e}")
-        # Valor padrão
-        decisao = {
-            "agente_lider": "mestre",
-            "agentes_auxiliares": ["narrador"],
-            "análise_situacional": "Falha na análise situacional.",
-            "direcionamento": "Descreva a situação atual e continue a narrativa.",
-        }
-
-    agente_lider = decisao["agente_lider"]
-    agentes_auxiliares = decisao["agentes_auxiliares"]
-    analise_situacional = decisao["análise_situacional"]
-    direcionamento = decisao["direcionamento"]
-
-    # Certifique-se de que o narrador sempre está incluído
-    if "narrador" not in agentes_auxiliares:
-        agentes_auxiliares.append("narrador")
-
-    # Fase 2: O agente líder processa a ação principal
-    # Criar contexto de regras para qualquer uso de mecânicas
-    contexto_regras = ""
-
-    # Se estivermos em combate ou entrarmos em combate, preparar o contexto mecânico
-    if (
-        agente_lider == "combate"
-        or event_system.in_combat
-        or (random_encounter and random_encounter["tipo"] == "encontro_hostil")
-    ):
-        event_system.in_combat = True
-
-        # Preparar as informações sobre o personagem do jogador
-        atk_bonus = CharacterManager.calculate_attack_bonus(ficha, "magia")
-        spell_dc = CharacterManager.calculate_spell_dc(ficha)
-
-        # Informações sobre inimigos atuais
-        if event_system.current_enemies:
-            inimigos_str = "\n".join(
-                [
-                    f"- {e['tipo']} (PV: {e['hp']}/{e['hp_max']}, CA: {e['ca']})"
-                    for e in event_system.current_enemies
-                ]
-            )
-        else:
-            inimigos_str = "Nenhum inimigo ativo."
-
-        contexto_regras = f"""
-INFORMAÇÕES DE COMBATE:
-Personagem do Jogador:
-- PV Atual: {ficha.get('pontos_vida_atuais', ficha.get('pontos_vida', 0))}/{ficha.get('pontos_vida', 0)}
-- Classe de Armadura: {ficha.get('classe_armadura', 10)}
-- Bônus de Ataque Mágico: +{atk_bonus}
-- CD de Magia: {spell_dc}
-
-Inimigos:
-{inimigos_str}
-
-REGRAS DE COMBATE:
-1. Ataques: Rolar 1d20 + bônus contra a CA do alvo
-2. Dano: Depende da arma/magia
-3. Resistências: Rolar 1d20 + modificador de atributo
-
-Analise a ação do jogador e determine qual mecânica aplicar.
 """
 
-    # Criar a tarefa para o agente líder
-    agente_obj = None
-    if agente_lider == "combate":
-        agente_obj = combate
-    elif agente_lider == "mundo":
-        agente_obj = mundo
-    elif agente_lider == "npcs":
-        agente_obj = npcs
-    elif agente_lider == "regras":
-        agente_obj = regras
-    else:
-        agente_obj = mestre  # Default para o mestre
-
-    tarefa_lider = Task(
-        description=f"""Todas as respostas devem ser em português do Brasil.
+PROMPT_LIDER = """Todas as respostas devem ser em português do Brasil.
 Contexto da aventura: Um mago humano chamado Alion está explorando a Cripta do Coração Negro.
 Histórico recente:
 {contexto}
 
-{contexto_evento if contexto_evento else ""}
+{contexto_evento}
 
 Ação do jogador: "{comando_usuario}"
 
 Análise situacional: {analise_situacional}
 Direcionamento específico: {direcionamento}
 
-{contexto_regras if contexto_regras else ""}
+{contexto_regras}
 
-Como agente {agente_lider.upper()}, você foi escolhido como líder para processar esta ação.
+Como agente {papel}, você foi escolhido como líder para processar esta ação.
 Crie uma resposta detalhada focando na sua especialidade, sabendo que o resultado final
 será integrado pelo Narrador a outras contribuições. Mantenha seu foco específico.
 
@@ -697,106 +643,358 @@ Se for resposta do MESTRE:
 - Avance a narrativa principal
 - Tome decisões sobre o rumo da aventura
 - Mantenha a coerência com eventos anteriores
-""",
-        agent=agente_obj,
-        expected_output=f"Resposta detalhada como agente {agente_lider}",
-    )
-
-    crew_lider = Crew(agents=[agente_obj], tasks=[tarefa_lider], verbose=False)
+"""
 
-    resultado_lider = crew_lider.kickoff()
-    contribuicao_lider = str(resultado_lider).strip()
+PROMPT_AUXILIAR = """Todas as respostas devem ser em português do Brasil.
+Contexto da aventura: Um mago humano chamado Alion está explorando a Cripta do Coração Negro.
+Histórico recente:
+{contexto}
 
-    # Fase 3: Processamento de rolagens para combate
-    # Se estamos em combate, processar rolagens reais
-    resultado_mecanico = None
-    if agente_lider == "combate" or event_system.in_combat:
-        # Analisar o comando para determinar o tipo de ação
-        acao_ataque = any(
-            termo in comando_usuario.lower()
-            for termo in [
-                "atac",
-                "golpe",
-                "lançar",
-                "magica",
-                "magia",
-                "raio",
-                "disparo",
-                "tiro",
-                "fogo",
-                "gelo",
-            ]
-        )
+{contexto_evento}
 
-        acao_defesa = any(
-            termo in comando_usuario.lower()
-            for termo in ["defend", "esquiv", "proteg", "escud", "bloque"]
-        )
+Ação do jogador: "{comando_usuario}"
 
-        acao_movimento = any(
-            termo in comando_usuario.lower()
-            for termo in ["mov", "corr", "salt", "andar", "recuar", "afast", "approx"]
-        )
+{contexto_mecanico}
 
-        # Se for um ataque, fazer rolagem de dados
-        if acao_ataque and event_system.current_enemies:
-            atk_bonus = CharacterManager.calculate_attack_bonus(ficha, "magia")
-            total_roll, d20_value, critical = DiceSystem.attack_roll(atk_bonus)
+Contribuição do agente líder ({agente_lider}):
+{contribuicao_lider}
 
-            # Selecionar alvo (simplificado)
-            alvo = event_system.current_enemies[0]  # Primeiro inimigo na lista
+Como agente {papel}, você foi escolhido como auxiliar na resposta.
+Sua tarefa é complementar a contribuição do agente líder, adicionando elementos
+específicos da sua especialidade. Seja conciso e focado no seu papel específico.
 
-            hit = total_roll >= alvo["ca"]
+Se você for o NARRADOR:
+- Integre todas as contribuições em uma narrativa final coesa
+- Mantenha o tom apropriado (épico para exploração, tático para combate)
+- Crie transições suaves entre diferentes elementos
 
-            # Rolagem de dano (assumindo magia de 1d8 para simplificar)
-            if hit:
-                damage_total, damage_rolls = DiceSystem.roll("1d8")
-                if critical:
-                    bonus_damage, _ = DiceSystem.roll("1d8")
-                    damage_total += bonus_damage
+Se você for MESTRE, MUNDO, NPCs ou REGRAS:
+- Adicione apenas elementos relevantes da sua especialidade
+- Seja breve e complementar ao agente líder
+- Não repita informações já fornecidas
+"""
 
-                # Aplicar dano
-                alvo["hp"] = max(0, alvo["hp"] - damage_total)
+PROMPT_INTEGRACAO = """Todas as respostas devem ser em português do Brasil.
+Contexto da aventura: Um mago humano chamado Alion está explorando a Cripta do Coração Negro.
+Estado atual: {estado_atual}.
 
-                # Verificar se inimigo morreu
-                morto = alvo["hp"] <= 0
+Ação do jogador: "{comando_usuario}"
 
-                resultado_mecanico = {
-                    "tipo": "ataque",
-                    "alvo": alvo["tipo"],
-                    "rolagem_ataque": total_roll,
-                    "valor_d20": d20_value,
-                    "critico": critical,
-                    "acerto": hit,
-                    "dano": damage_total,
-                    "hp_final": alvo["hp"],
-                    "morto": morto,
-                }
+{contexto_integracao}
 
-                # Limpar inimigos mortos
-                event_system.current_enemies = [
-                    e for e in event_system.current_enemies if e["hp"] > 0
-                ]
+CONTRIBUIÇÕES DOS AGENTES:
+Agente principal ({agente_lider}):
+{contribuicao_lider}
 
-                # Verificar se o combate terminou
-                if not event_system.current_enemies:
-                    event_system.end_combat()
-            else:
-                resultado_mecanico = {
-                    "tipo": "ataque",
-                    "alvo": alvo["tipo"],
-                    "rolagem_ataque": total_roll,
-                    "valor_d20": d20_value,
-                    "critico": False,
-                    "acerto": False,
-                }
+{outras_contribuicoes}
 
-        elif acao_defesa:
+Sua tarefa é integrar todas estas contribuições em uma narrativa final coesa e envolvente.
+Mantenha o tom apropriado: épico para exploração, tático e objetivo para combate.
+O resultado deve parecer uma única voz narrativa fluida, como um excelente mestre de RPG.
+
+{instrucao_tom}
+"""
+
+CONTEXTO_INTEGRACAO_COMBATE = """
+INSTRUÇÕES ESPECIAIS PARA INTEGRAÇÃO:
+Este é um resultado de combate. Integre os resultados mecânicos de forma natural
+na narrativa. Mencione os números de rolagem de forma sutil (como um mestre de RPG faria),
+sem quebrar a imersão. Exemplo: "Seu raio arcano dispara com precisão [rolagem 18] e atinge
+o esqueleto, causando 7 pontos de dano e quebrando vários de seus ossos".
+"""
+
+TOM_COMBATE = "Como este é um cenário de COMBATE, use um tom mais objetivo e tático, similar a uma sessão real de D&D."
+TOM_COMBATE_INTEGRACAO = TOM_COMBATE + " Mencione os resultados das rolagens subtilmente integrados na narrativa."
+TOM_EXPLORACAO = "Como este é um cenário de EXPLORAÇÃO, use um tom mais épico e imersivo, rico em detalhes sensoriais e atmosféricos."
+
+PROMPT_TURNO_RAPIDO = """Todas as respostas devem ser em português do Brasil e DEVEM seguir ESTRITAMENTE o formato JSON especificado.
+Contexto da aventura: Um mago humano chamado Alion está explorando a Cripta do Coração Negro.
+Estado atual: {estado_atual}.
+Inimigos: {inimigos}
+Histórico recente:
+{contexto}
+
+{contexto_evento}
+
+Ação do jogador: "{comando_usuario}"
+
+{contexto_mecanico}
+
+Em UMA única resposta, faça o trabalho de toda a mesa de agentes:
+1. Decida qual especialista lidera a resposta (combate, mundo, npcs, regras ou mestre)
+2. Escreva a contribuição desse especialista, focada na especialidade dele
+3. Escreva a narrativa final para o jogador, como o Narrador, integrando a contribuição
+   e os resultados mecânicos de forma sutil (como um mestre de RPG faria)
+
+{instrucao_tom}
+
+IMPORTANTE: Sua resposta DEVE ser um objeto JSON válido no seguinte formato e nada mais:
+{{
+    "agente_lider": "combate|mundo|npcs|regras|mestre",
+    "agentes_auxiliares": ["narrador"],
+    "análise_situacional": "Breve análise da situação atual",
+    "conteudo_lider": "Contribuição do agente líder",
+    "narrativa_final": "Narrativa final integrada para o jogador"
+}}
+
+NÃO adicione explicações, comentários ou qualquer outro texto fora do JSON.
+"""
+
+PROMPT_CONTRA_ATAQUE = """Todas as respostas devem ser em português do Brasil.
+Você precisa criar uma breve narração para a rodada dos inimigos em um combate de D&D.
+Use um estilo tático e direto, similar ao de um mestre de RPG em uma mesa real.
+Integre os resultados mecânicos na narrativa de forma sutil mas informativa.
+
+RESULTADOS MECÂNICOS DA RODADA (em ordem de iniciativa):
+{descricao_ataque}
+
+Crie uma narração breve (2-4 frases) que descreva os ataques dos inimigos, na ordem em que agiram.
+Use vocabulário vívido e detalhes táticos apropriados para o tipo de inimigo.
+"""
+
+PROMPT_LOOT = """Todas as respostas devem ser em português do Brasil.
+Você precisa criar uma breve narração para o loot/recompensa encontrada após um combate em D&D.
+Use um estilo épico e recompensador, como um mestre satisfeito com a vitória dos jogadores.
+
+LOOT ENCONTRADO:
+{descricao_loot}
+
+Crie uma narração breve (1-2 frases) que descreva de forma interessante e épica a descoberta deste loot.
+"""
+
+pipeline_orquestrador = PipelineAgente(
+    "orquestrador",
+    "orquestrador",
+    orquestrador,
+    PROMPT_ORQUESTRADOR,
+    "Objeto JSON com agente líder, agentes auxiliares e direcionamento",
+    verbose=True,
+)
+# Um pipeline por agente que pode liderar o turno (qualquer outro nome cai no mestre)
+pipelines_lider = {
+    nome: PipelineAgente("lider", nome, AGENTES_POR_NOME[nome], PROMPT_LIDER, f"Resposta detalhada como agente {nome}")
+    for nome in ("combate", "mundo", "npcs", "regras", "mestre")
+}
+pipelines_auxiliar = {
+    nome: PipelineAgente("auxiliar", nome, agente, PROMPT_AUXILIAR, f"Contribuição complementar como agente {nome}")
+    for nome, agente in AGENTES_POR_NOME.items()
+    if nome != "narrador"
+}
+pipeline_integracao = PipelineAgente(
+    "integracao", "narrador", narrador, PROMPT_INTEGRACAO, "Narrativa final integrada"
+)
+pipeline_turno_rapido = PipelineAgente(
+    "turno_rapido",
+    "narrador",
+    narrador,
+    PROMPT_TURNO_RAPIDO,
+    "Objeto JSON com roteamento, contribuição do líder e narrativa final",
+)
+pipeline_contra_ataque = PipelineAgente(
+    "contra_ataque",
+    "narrador",
+    narrador_da_fase("contra_ataque"),
+    PROMPT_CONTRA_ATAQUE,
+    "Narração do contra-ataque inimigo",
+)
+pipeline_loot = PipelineAgente(
+    "loot", "narrador", narrador_da_fase("loot"), PROMPT_LOOT, "Narração da descoberta de loot"
+)
+
+
+# --------------------------
+# Estado de Jogo por Sessão
+# --------------------------
+
+
+class GameState:
+    """Estado isolado de uma partida: histórico, eventos/combate e ficha do personagem"""
+
+    def __init__(
+        self,
+        session_id: str = "local",
+        ficha_base: Optional[Dict] = None,
+        semente_dados: Optional[int] = None,
+    ):
+        self.session_id = session_id
+        # Gerador das rolagens da sessão; com DND_DICE_SEED, cada sessão tem uma sequência fixa
+        if semente_dados is None and os.environ.get("DND_DICE_SEED"):
+            semente_dados = random.Random(f"{os.environ['DND_DICE_SEED']}:{session_id}").getrandbits(64)
+        rng = cassete.rng_sessao(semente_dados) if cassete is not None else None
+        self.dados = RoladorDados(semente_dados, rng)
+        # Histórico da aventura: turnos recentes na íntegra e resumo dos antigos
+        self.historico = HistoricoAventura(
+            turnos_literais=int(os.environ.get("DND_HISTORY_VERBATIM_TURNS", 3)),
+            orcamento_tokens=int(os.environ.get("DND_HISTORY_TOKEN_BUDGET", 1200)),
+        )
+        # Sistema de eventos (combate, inimigos e aliados desta partida)
+        self.event_system = EventSystem(self.dados.rng)
+        # Cópia própria da ficha: dano sofrido não afeta outros jogadores
+        self.ficha = copy.deepcopy(ficha_base) if ficha_base is not None else carregar_ficha()
+        # Destino dos tokens da narração durante o turno atual (None = sem streaming)
+        self.on_token = None
+        # Pipeline do turno: "completo", "rapido" ou "auto" (decide pelo orçamento)
+        orcamento = os.environ.get("DND_LATENCY_BUDGET")
+        self.orcamento_latencia: Optional[float] = float(orcamento) if orcamento else None
+        self.modo_pipeline = os.environ.get(
+            "DND_PIPELINE_MODE", "auto" if orcamento else "completo"
+        )
+        self.ultimo_pipeline: Optional[str] = None  # Pipeline usado no último turno
+        # Duração média recente de cada pipeline nesta sessão e turnos rápidos seguidos
+        self.latencia_pipeline: Dict[str, Optional[float]] = {"completo": None, "rapido": None}
+        self.turnos_rapidos_seguidos = 0
+        self.partida_cassete: Optional[int] = None  # Número da partida na cassete gravada
+        # O que mudou desde a última gravação (ver `extrair_alteracoes`)
+        self._mensagens_novas: List[str] = []
+        self._ficha_salva = copy.deepcopy(self.ficha)
+
+    def emitir(self, texto: str) -> None:
+        """Envia um trecho de texto direto ao jogador, se houver streaming ativo"""
+        if self.on_token is not None:
+            self.on_token(texto)
+
+    def adicionar_ao_cache(self, mensagem):
+        self.historico.adicionar(mensagem)
+        self._mensagens_novas.append(mensagem)
+
+    def contexto_cache(self):
+        return self.historico.contexto()
+
+    def tamanho_estimado(self) -> int:
+        """Estimativa grosseira (em bytes) da memória ocupada pelo estado"""
+        return self.historico.tamanho_estimado() + 2048
+
+    # Persistência: uma foto completa de tempos em tempos e, a cada turno, só as alterações
+
+    def to_dict(self) -> Dict:
+        return {
+            "historico": self.historico.to_dict(),
+            "event_system": self.event_system.to_dict(),
+            "ficha": self.ficha,
+        }
+
+    @classmethod
+    def from_dict(cls, dados: Dict, session_id: str = "local") -> "GameState":
+        estado = cls(session_id, ficha_base=dados["ficha"])
+        estado.historico = HistoricoAventura.from_dict(dados["historico"])
+        estado.event_system = EventSystem.from_dict(dados["event_system"], estado.dados.rng)
+        return estado
+
+    def extrair_alteracoes(self) -> Dict:
+        """
+        Alterações desde a chamada anterior: mensagens novas do histórico, o
+        estado do EventSystem (pequeno) e os campos da ficha que mudaram.
+        """
+        alteracoes = {
+            "mensagens": self._mensagens_novas,
+            "event_system": self.event_system.to_dict(),
+            "ficha": {
+                campo: valor
+                for campo, valor in self.ficha.items()
+                if self._ficha_salva.get(campo) != valor
+            },
+        }
+        self._mensagens_novas = []
+        self._ficha_salva = copy.deepcopy(self.ficha)
+        return alteracoes
+
+    def aplicar_alteracoes(self, alteracoes: Dict) -> None:
+        """Refaz um turno gravado por `extrair_alteracoes` (sem chamar o LLM)"""
+        for mensagem in alteracoes["mensagens"]:
+            self.historico.adicionar(mensagem)
+        self.event_system = EventSystem.from_dict(alteracoes["event_system"], self.dados.rng)
+        self.ficha.update(copy.deepcopy(alteracoes["ficha"]))
+        self._ficha_salva = copy.deepcopy(self.ficha)
+
+
+# Estado usado quando nenhuma sessão é informada (ex.: execução pelo terminal)
+estado_padrao = GameState()
+
+
+# --------------------------
+# Resolução Mecânica do Turno
+# --------------------------
+
+
+def resolver_mecanica(comando_usuario, agente_lider, estado: GameState):
+    """
+    Fase 3 do turno: rolagens reais de ataque/defesa quando há combate.
+    Retorna o resultado mecânico (ou None se não houve rolagem).
+    """
+    event_system = estado.event_system
+    ficha = estado.ficha
+
+    # Se estamos em combate, processar rolagens reais
+    resultado_mecanico = None
+    if agente_lider == "combate" or event_system.in_combat:
+        # Analisar o comando para determinar o tipo de ação
+        acao_ataque = contem_termo(comando_usuario, TERMOS_ATAQUE)
+        acao_defesa = contem_termo(comando_usuario, TERMOS_DEFESA)
+        acao_movimento = contem_termo(comando_usuario, TERMOS_MOVIMENTO)
+
+        # Se for um ataque, fazer rolagem de dados
+        if acao_ataque and event_system.current_enemies:
+            atk_bonus = CharacterManager.calculate_attack_bonus(ficha, "magia")
+            total_roll, d20_value, critical = DiceSystem.attack_roll(atk_bonus, estado.dados)
+
+            # Selecionar alvo (simplificado)
+            alvo = event_system.current_enemies[0]  # Primeiro inimigo na lista
+
+            hit = total_roll >= alvo["ca"]
+
+            # Rolagem de dano (assumindo magia de 1d8 para simplificar)
+            if hit:
+                damage_total, damage_rolls = DiceSystem.roll("1d8", estado.dados)
+                if critical:
+                    bonus_damage, _ = DiceSystem.roll("1d8", estado.dados)
+                    damage_total += bonus_damage
+
+                # Aplicar dano
+                alvo["hp"] = max(0, alvo["hp"] - damage_total)
+
+                # Verificar se inimigo morreu
+                morto = alvo["hp"] <= 0
+
+                resultado_mecanico = {
+                    "tipo": "ataque",
+                    "alvo": alvo["tipo"],
+                    "ca_alvo": alvo["ca"],
+                    "hp_max_alvo": alvo["hp_max"],
+                    "rolagem_ataque": total_roll,
+                    "valor_d20": d20_value,
+                    "critico": critical,
+                    "acerto": hit,
+                    "dano": damage_total,
+                    "hp_final": alvo["hp"],
+                    "morto": morto,
+                }
+
+                # Limpar inimigos mortos
+                event_system.current_enemies = [
+                    e for e in event_system.current_enemies if e["hp"] > 0
+                ]
+
+                # Verificar se o combate terminou
+                if not event_system.current_enemies:
+                    event_system.end_combat()
+            else:
+                resultado_mecanico = {
+                    "tipo": "ataque",
+                    "alvo": alvo["tipo"],
+                    "ca_alvo": alvo["ca"],
+                    "hp_max_alvo": alvo["hp_max"],
+                    "rolagem_ataque": total_roll,
+                    "valor_d20": d20_value,
+                    "critico": False,
+                    "acerto": False,
+                }
+
+        elif acao_defesa:
             # Rolagem de defesa (simplificada, usando Destreza)
             dex_mod = CharacterManager.get_ability_modifier(
                 ficha["atributos"]["Destreza"]
             )
-            total_roll, d20_value = DiceSystem.check_roll(dex_mod)
+            total_roll, d20_value = DiceSystem.check_roll(dex_mod, rolador=estado.dados)
 
             resultado_mecanico = {
                 "tipo": "defesa",
@@ -805,11 +1003,11 @@ Se for resposta do MESTRE:
                 "sucesso": total_roll >= 12,  # DC arbitrária
             }
 
-    # Fase 4: Coletar contribuições dos agentes auxiliares
-    contribuicoes = {agente_lider: contribuicao_lider}
-    agentes_auxiliares_objs = []
-    tarefas_auxiliares = []
+    return resultado_mecanico
+
 
+def contexto_resultado_mecanico(resultado_mecanico, event_system: EventSystem) -> str:
+    """Descreve o resultado mecânico para os prompts dos agentes"""
     # Preparar contexto de rolagem mecânica
     contexto_mecanico = ""
     if resultado_mecanico:
@@ -819,18 +1017,18 @@ Se for resposta do MESTRE:
                     contexto_mecanico = f"""
 RESULTADO MECÂNICO: ATAQUE CRÍTICO!
 - Rolagem de ataque: {resultado_mecanico["valor_d20"]} (CRÍTICO!) + bônus = {resultado_mecanico["rolagem_ataque"]}
-- Alvo: {resultado_mecanico["alvo"]} (CA {alvo["ca"]})
+- Alvo: {resultado_mecanico["alvo"]} (CA {resultado_mecanico["ca_alvo"]})
 - Dano causado: {resultado_mecanico["dano"]} pontos de vida
-- Estado do alvo: {resultado_mecanico["hp_final"]}/{alvo["hp_max"]} PV
+- Estado do alvo: {resultado_mecanico["hp_final"]}/{resultado_mecanico["hp_max_alvo"]} PV
 - {resultado_mecanico["alvo"]} está {'morto' if resultado_mecanico["morto"] else 'ferido'}
 """
                 else:
                     contexto_mecanico = f"""
 RESULTADO MECÂNICO: ATAQUE BEM-SUCEDIDO
 - Rolagem de ataque: {resultado_mecanico["valor_d20"]} (d20) + bônus = {resultado_mecanico["rolagem_ataque"]}
-- Alvo: {resultado_mecanico["alvo"]} (CA {alvo["ca"]})
+- Alvo: {resultado_mecanico["alvo"]} (CA {resultado_mecanico["ca_alvo"]})
 - Dano causado: {resultado_mecanico["dano"]} pontos de vida
-- Estado do alvo: {resultado_mecanico["hp_final"]}/{alvo["hp_max"]} PV
+- Estado do alvo: {resultado_mecanico["hp_final"]}/{resultado_mecanico["hp_max_alvo"]} PV
 - {resultado_mecanico["alvo"]} está {'morto' if resultado_mecanico["morto"] else 'ferido'}
 """
                 if not event_system.current_enemies:
@@ -842,7 +1040,7 @@ O sistema de combate está sendo encerrado e você voltará ao modo de exploraç
                 contexto_mecanico = f"""
 RESULTADO MECÂNICO: ATAQUE FALHOU
 - Rolagem de ataque: {resultado_mecanico["valor_d20"]} (d20) + bônus = {resultado_mecanico["rolagem_ataque"]}
-- Alvo: {resultado_mecanico["alvo"]} (CA {alvo["ca"]})
+- Alvo: {resultado_mecanico["alvo"]} (CA {resultado_mecanico["ca_alvo"]})
 - O ataque não acertou o alvo
 """
         elif resultado_mecanico["tipo"] == "defesa":
@@ -858,147 +1056,343 @@ RESULTADO MECÂNICO: DEFESA FALHOU
 - Rolagem de defesa: {resultado_mecanico["valor_d20"]} (d20) + bônus = {resultado_mecanico["rolagem"]}
 - A defesa não foi eficaz
 """
+    return contexto_mecanico
 
-    # Executar tarefas para cada agente auxiliar
-    for agente_nome in agentes_auxiliares:
-        if agente_nome == agente_lider:
-            continue  # Pulamos o agente líder que já processou
-
-        # Escolher o agente correto
-        agente_aux = None
-        if agente_nome == "narrador":
-            agente_aux = narrador
-        elif agente_nome == "mestre":
-            agente_aux = mestre
-        elif agente_nome == "mundo":
-            agente_aux = mundo
-        elif agente_nome == "npcs":
-            agente_aux = npcs
-        elif agente_nome == "regras":
-            agente_aux = regras
-        elif agente_nome == "combate":
-            agente_aux = combate
-
-        if agente_aux:
-            agentes_auxiliares_objs.append(agente_aux)
-            tarefa_aux = Task(
-                description=f"""Todas as respostas devem ser em português do Brasil.
-Contexto da aventura: Um mago humano chamado Alion está explorando a Cripta do Coração Negro.
-Histórico recente:
-{contexto}
 
-{contexto_evento if contexto_evento else ""}
+# --------------------------
+# Sistema de Orquestração Aprimorado
+# --------------------------
 
-Ação do jogador: "{comando_usuario}"
 
-{contexto_mecanico if contexto_mecanico else ""}
+def extrair_objeto_json(texto: str) -> str:
+    """Recorta o primeiro objeto JSON do texto, caso o LLM escreva algo antes ou depois"""
+    # Primeiro, obter a string do resultado
+    resultado_texto = texto.strip()
 
-Contribuição do agente líder ({agente_lider}):
-{contribuicao_lider}
+    # Tentar identificar o início do JSON caso haja texto antes
+    if "{" in resultado_texto:
+        inicio_json = resultado_texto.find("{")
+        resultado_texto = resultado_texto[inicio_json:]
 
-Como agente {agente_nome.upper()}, você foi escolhido como auxiliar na resposta.
-Sua tarefa é complementar a contribuição do agente líder, adicionando elementos
-específicos da sua especialidade. Seja conciso e focado no seu papel específico.
+        # Encontrar o fechamento do JSON
+        contador = 1
+        for i in range(1, len(resultado_texto)):
+            if resultado_texto[i] == "{":
+                contador += 1
+            elif resultado_texto[i] == "}":
+                contador -= 1
+                if contador == 0:
+                    resultado_texto = resultado_texto[: i + 1]
+                    break
 
-Se você for o NARRADOR:
-- Integre todas as contribuições em uma narrativa final coesa
-- Mantenha o tom apropriado (épico para exploração, tático para combate)
-- Crie transições suaves entre diferentes elementos
+    return resultado_texto
 
-Se você for MESTRE, MUNDO, NPCs ou REGRAS:
-- Adicione apenas elementos relevantes da sua especialidade
-- Seja breve e complementar ao agente líder
-- Não repita informações já fornecidas
-""",
-                agent=agente_aux,
-                expected_output=f"Contribuição complementar como agente {agente_nome}",
+
+def descrever_evento_aleatorio(random_encounter: Optional[Dict]) -> str:
+    """Contexto adicional para os prompts quando um evento aleatório ocorre no turno"""
+    contexto_evento = ""
+    if random_encounter:
+        if random_encounter["tipo"] == "encontro_hostil":
+            inimigos_str = ", ".join(
+                [
+                    f"{e['tipo']} (PV: {e['hp']}/{e['hp_max']})"
+                    for e in random_encounter["inimigos"]
+                ]
             )
-            tarefas_auxiliares.append(tarefa_aux)
+            contexto_evento = f"""
+EVENTO ALEATÓRIO: Encontro hostil!
+Inimigos: {inimigos_str}
+Este encontro inicia automaticamente um combate. O jogador deve ser informado e 
+a narrativa deve incluir a aparição dos inimigos de forma fluida e surpreendente.
+"""
+        else:
+            contexto_evento = f"""
+EVENTO ALEATÓRIO: Encontro com aliado!
+Aliado: {random_encounter['aliado']['tipo']} ({random_encounter['aliado']['atitude']})
+Este encontro deve ser introduzido na narrativa de forma natural. O NPC pode oferecer
+informações, ajuda ou ter seus próprios objetivos na Cripta.
+"""
 
-    # Executar tarefas auxiliares se houver
-    if agentes_auxiliares_objs and tarefas_auxiliares:
-        crew_auxiliar = Crew(
-            agents=agentes_auxiliares_objs, tasks=[tarefa_aux], verbose=False
-        )
+    return contexto_evento
+
+
+# Análise usada na decisão padrão quando o retorno do Orquestrador é inválido
+ANALISE_FALHA = "Falha na análise situacional."
+
+
+def analisar_com_orquestrador(
+    comando_usuario, contexto: str, contexto_evento: str, em_combate: bool
+) -> Dict:
+    """Fase 1 via LLM: o Orquestrador decide qual agente deve assumir o turno"""
+    # Executa a orquestração inicial
+    resultado_orquestrador = pipeline_orquestrador.executar(
+        estado_atual="Em combate" if em_combate else "Exploração",
+        contexto=contexto,
+        contexto_evento=contexto_evento,
+        comando_usuario=comando_usuario,
+    )
+    print("Tipo do resultado do orquestrador:", type(resultado_orquestrador))
+    print("Resultado do orquestrador:", resultado_orquestrador)
+
+    try:
+        # Tentar fazer parse do JSON (ignorando texto antes/depois do objeto)
+        decisao = json.loads(extrair_objeto_json(str(resultado_orquestrador)))
+
+        # Validação
+        if not isinstance(decisao, dict):
+            raise ValueError("O retorno do orquestrador não é um dicionário válido.")
+
+        # Verificar se tem as chaves necessárias
+        campos_necessarios = [
+            "agente_lider",
+            "agentes_auxiliares",
+            "análise_situacional",
+            "direcionamento",
+        ]
+        for campo in campos_necessarios:
+            if campo not in decisao:
+                raise ValueError(f"Campo necessário '{campo}' não encontrado no JSON.")
 
-        resultado_auxiliar = crew_auxiliar.kickoff()
-
-        # Processar as contribuições
-        if isinstance(resultado_auxiliar, list):
-            i = 0
-            for agente_nome in agentes_auxiliares:
-                if agente_nome != agente_lider:
-                    if i < len(resultado_auxiliar):
-                        contribuicoes[agente_nome] = str(resultado_auxiliar[i]).strip()
-                    else:
-                        contribuicoes[agente_nome] = "Contribuição não disponível"
-                    i += 1
-        elif hasattr(resultado_auxiliar, "get_first_response"):
-            # Se houver apenas uma resposta, use-a para todos os agentes auxiliares
-            resposta = str(resultado_auxiliar.get_first_response()).strip()
-            for agente_nome in agentes_auxiliares:
-                if agente_nome != agente_lider:
-                    contribuicoes[agente_nome] = resposta
+    except json.JSONDecodeError as e:
+        print(f"Erro ao decodificar JSON: {e}")
+        # Valor padrão
+        decisao = {
+            "agente_lider": "mestre",
+            "agentes_auxiliares": ["narrador"],
+            "análise_situacional": ANALISE_FALHA,
+            "direcionamento": "Descreva a situação atual e continue a narrativa.",
+        }
+    except ValueError as e:
+        print(f"Erro no formato do retorno: {e}")
+        # Valor padrão
+        decisao = {
+            "agente_lider": "mestre",
+            "agentes_auxiliares": ["narrador"],
+            "análise_situacional": ANALISE_FALHA,
+            "direcionamento": "Descreva a situação atual e continue a narrativa.",
+        }
+    except Exception as e:
+        print(f"Erro inesperado: {e}")
+        # Valor padrão
+        decisao = {
+            "agente_lider": "mestre",
+            "agentes_auxiliares": ["narrador"],
+            "análise_situacional": ANALISE_FALHA,
+            "direcionamento": "Descreva a situação atual e continue a narrativa.",
+        }
+
+    return decisao
+
+
+def executar_turno(comando_usuario, estado: Optional[GameState] = None):
+    if estado is None:
+        estado = estado_padrao
+    event_system = estado.event_system
+    ficha = estado.ficha
+
+    # Incrementar o contador de turnos e verificar eventos aleatórios
+    event_system.increment_turn()
+    random_encounter = event_system.check_random_encounter(estado.ficha)
+
+    contexto = estado.contexto_cache()
+    info_estado_jogo = {
+        "em_combate": event_system.in_combat,
+        "inimigos_atuais": event_system.current_enemies,
+        "aliados_atuais": event_system.current_allies,
+    }
+
+    # Contexto adicional para o evento aleatório, se ocorrer
+    contexto_evento = descrever_evento_aleatorio(random_encounter)
+
+    # Fase 1: Decidir qual agente deve assumir. Comandos óbvios são roteados
+    # localmente por palavras-chave; os demais vão para o Orquestrador inteligente
+    roteamento = roteador.classificar(
+        comando_usuario,
+        em_combate=info_estado_jogo["em_combate"],
+        encontro=random_encounter,
+        tem_aliados=bool(info_estado_jogo["aliados_atuais"]),
+    )
+    consultou_orquestrador = False
+    chave_roteamento = RoutingCache.chave(
+        comando_usuario, info_estado_jogo["em_combate"], random_encounter
+    )
+    if roteamento.confiavel:
+        decisao = roteamento.decisao
+        roteador.registrar_local(roteamento)
+    else:
+        decisao = cache_roteamento.obter(estado.session_id, chave_roteamento)
+        if decisao is None:
+            inicio_orquestrador = time.perf_counter()
+            consultou_orquestrador = True
+            decisao = analisar_com_orquestrador(
+                comando_usuario, contexto, contexto_evento, info_estado_jogo["em_combate"]
+            )
+            roteador.registrar_llm(roteamento, time.perf_counter() - inicio_orquestrador)
+            if decisao["análise_situacional"] != ANALISE_FALHA:  # Não guardar o valor padrão
+                cache_roteamento.guardar(estado.session_id, chave_roteamento, decisao)
         else:
-            # Fallback - converter para string
-            resposta = str(resultado_auxiliar).strip()
-            for agente_nome in agentes_auxiliares:
-                if agente_nome != agente_lider:
-                    contribuicoes[agente_nome] = resposta
-
-    # Fase 5: Integrar todas as contribuições em uma resposta final
-    # Se o narrador está entre os agentes, deixá-lo integrar
-    resposta_final = ""
-    if "narrador" in contribuicoes:
-        # Se tivermos um resultado mecânico, fornecer contexto especial
-        contexto_integracao = ""
-        if resultado_mecanico:
-            contexto_integracao = f"""
-INSTRUÇÕES ESPECIAIS PARA INTEGRAÇÃO:
-Este é um resultado de combate. Integre os resultados mecânicos de forma natural
-na narrativa. Mencione os números de rolagem de forma sutil (como um mestre de RPG faria),
-sem quebrar a imersão. Exemplo: "Seu raio arcano dispara com precisão [rolagem 18] e atinge
-o esqueleto, causando 7 pontos de dano e quebrando vários de seus ossos".
-"""
+            print(f"Decisão do Orquestrador reaproveitada do cache: {decisao['agente_lider']}")
 
-        # Tarefa para o narrador integrar
-        tarefa_integracao = Task(
-            description=f"""Todas as respostas devem ser em português do Brasil.
-Contexto da aventura: Um mago humano chamado Alion está explorando a Cripta do Coração Negro.
-Estado atual: {"Em combate" if event_system.in_combat else "Exploração"}.
+    agente_lider = decisao["agente_lider"]
+    agentes_auxiliares = decisao["agentes_auxiliares"]
+    analise_situacional = decisao["análise_situacional"]
+    direcionamento = decisao["direcionamento"]
 
-Ação do jogador: "{comando_usuario}"
+    # Certifique-se de que o narrador sempre está incluído
+    if "narrador" not in agentes_auxiliares:
+        agentes_auxiliares.append("narrador")
 
-{contexto_integracao}
+    # Fase 2: O agente líder processa a ação principal
+    # Criar contexto de regras para qualquer uso de mecânicas
+    contexto_regras = ""
 
-CONTRIBUIÇÕES DOS AGENTES:
-Agente principal ({agente_lider}):
-{contribuicoes[agente_lider]}
+    # Se estivermos em combate ou entrarmos em combate, preparar o contexto mecânico
+    if (
+        agente_lider == "combate"
+        or event_system.in_combat
+        or (random_encounter and random_encounter["tipo"] == "encontro_hostil")
+    ):
+        event_system.in_combat = True
 
-{"".join([f"Agente {agente_nome}:\n{contribuicoes[agente_nome]}\n\n" for agente_nome in contribuicoes if agente_nome != agente_lider and agente_nome != "narrador"])}
+        # Preparar as informações sobre o personagem do jogador
+        atk_bonus = CharacterManager.calculate_attack_bonus(ficha, "magia")
+        spell_dc = CharacterManager.calculate_spell_dc(ficha)
 
-Sua tarefa é integrar todas estas contribuições em uma narrativa final coesa e envolvente.
-Mantenha o tom apropriado: épico para exploração, tático e objetivo para combate.
-O resultado deve parecer uma única voz narrativa fluida, como um excelente mestre de RPG.
+        # Informações sobre inimigos atuais
+        if event_system.current_enemies:
+            inimigos_str = "\n".join(
+                [
+                    f"- {e['tipo']} (PV: {e['hp']}/{e['hp_max']}, CA: {e['ca']})"
+                    for e in event_system.current_enemies
+                ]
+            )
+        else:
+            inimigos_str = "Nenhum inimigo ativo."
 
-{"Como este é um cenário de COMBATE, use um tom mais objetivo e tático, similar a uma sessão real de D&D. Mencione os resultados das rolagens subtilmente integrados na narrativa." if event_system.in_combat else "Como este é um cenário de EXPLORAÇÃO, use um tom mais épico e imersivo, rico em detalhes sensoriais e atmosféricos."}
-""",
-            agent=narrador,
-            expected_output="Narrativa final integrada",
+        contexto_regras = f"""
+INFORMAÇÕES DE COMBATE:
+Personagem do Jogador:
+- PV Atual: {ficha.get('pv_atual', ficha.get('pv_maximo', 0))}/{ficha.get('pv_maximo', 0)}
+- Classe de Armadura: {ficha.get('ca', 10)}
+- Bônus de Ataque Mágico: +{atk_bonus}
+- CD de Magia: {spell_dc}
+
+Inimigos:
+{inimigos_str}
+
+REGRAS DE COMBATE:
+1. Ataques: Rolar 1d20 + bônus contra a CA do alvo
+2. Dano: Depende da arma/magia
+3. Resistências: Rolar 1d20 + modificador de atributo
+
+Analise a ação do jogador e determine qual mecânica aplicar.
+"""
+
+    # Pipeline do agente líder (qualquer outro nome fica com o mestre)
+    pipeline_lider = pipelines_lider.get(agente_lider, pipelines_lider["mestre"])
+
+    # Fases 2 a 5 executadas como grafo de dependências:
+    #
+    #   lider ──┐
+    #           ├──> auxiliares (em paralelo) ──> integracao
+    #   dados ──┘
+    #
+    # A rolagem de dados não depende do texto do líder, então roda junto com ele.
+    # O Narrador não é executado como auxiliar: sua contribuição não era usada,
+    # já que é ele quem faz a integração final.
+    def fase_lider(resultados):
+        return pipeline_lider.executar(
+            contexto=contexto,
+            contexto_evento=contexto_evento,
+            comando_usuario=comando_usuario,
+            analise_situacional=analise_situacional,
+            direcionamento=direcionamento,
+            contexto_regras=contexto_regras,
+            papel=agente_lider.upper(),
         )
 
-        crew_integracao = Crew(
-            agents=[narrador], tasks=[tarefa_integracao], verbose=False
+    def fase_dados(resultados):
+        # Fase 3: Processamento de rolagens para combate
+        with medir_fase("dados"):
+            return resolver_mecanica(comando_usuario, agente_lider, estado)
+
+    def fase_auxiliar(agente_nome, pipeline_aux):
+        # Fase 4: Cada agente auxiliar contribui em uma crew própria
+        def executar(resultados):
+            return pipeline_aux.executar(
+                contexto=contexto,
+                contexto_evento=contexto_evento,
+                comando_usuario=comando_usuario,
+                contexto_mecanico=contexto_resultado_mecanico(resultados["dados"], event_system),
+                agente_lider=agente_lider,
+                contribuicao_lider=resultados["lider"],
+                papel=agente_nome.upper(),
+            )
+
+        return executar
+
+    def fase_integracao(resultados):
+        # Fase 5: Integrar todas as contribuições em uma resposta final
+        contribuicao_lider = resultados["lider"]
+        resultado_mecanico = resultados["dados"]
+
+        # Se o narrador não está entre os agentes, usar a contribuição do agente líder
+        if "narrador" not in agentes_auxiliares:
+            return contribuicao_lider
+
+        contribuicoes = {agente_lider: contribuicao_lider}
+        for agente_nome in nomes_auxiliares:
+            contribuicoes[agente_nome] = resultados[agente_nome]
+
+        outras_contribuicoes = "".join(
+            f"Agente {agente_nome}:\n{contribuicoes[agente_nome]}\n\n"
+            for agente_nome in contribuicoes
+            if agente_nome != agente_lider and agente_nome != "narrador"
         )
+        with streaming_narracao.transmitir(estado.on_token):
+            return pipeline_integracao.executar(
+                estado_atual="Em combate" if event_system.in_combat else "Exploração",
+                comando_usuario=comando_usuario,
+                # Se tivermos um resultado mecânico, fornecer contexto especial
+                contexto_integracao=CONTEXTO_INTEGRACAO_COMBATE if resultado_mecanico else "",
+                agente_lider=agente_lider,
+                contribuicao_lider=contribuicoes[agente_lider],
+                outras_contribuicoes=outras_contribuicoes,
+                instrucao_tom=TOM_COMBATE_INTEGRACAO if event_system.in_combat else TOM_EXPLORACAO,
+            )
 
-        resultado_integracao = crew_integracao.kickoff()
-        resposta_final = str(resultado_integracao).strip()
-    else:
-        # Fallback: usar a contribuição do agente líder
-        resposta_final = contribuicao_lider
+    grafo = TurnGraph()
+    grafo.adicionar("lider", fase_lider)
+    grafo.adicionar("dados", fase_dados)
+
+    nomes_auxiliares = []
+    for agente_nome in agentes_auxiliares:
+        if agente_nome in (agente_lider, "narrador") or agente_nome in nomes_auxiliares:
+            continue  # Pulamos o líder (já processou) e o narrador (integra no fim)
+        pipeline_aux = pipelines_auxiliar.get(agente_nome)
+        if pipeline_aux:
+            nomes_auxiliares.append(agente_nome)
+            grafo.adicionar(
+                agente_nome,
+                fase_auxiliar(agente_nome, pipeline_aux),
+                depende_de=["lider", "dados"],
+            )
+
+    grafo.adicionar(
+        "integracao",
+        fase_integracao,
+        depende_de=["lider", "dados"] + nomes_auxiliares,
+    )
+
+    resposta_final = grafo.executar(executor_fases)["integracao"]
+
+    # O histórico foi enviado ao Orquestrador (se consultado), ao líder e a cada auxiliar
+    estado.historico.registrar_economia(
+        contexto, int(consultou_orquestrador) + 1 + len(nomes_auxiliares)
+    )
 
     # Adicionar ao cache para contexto futuro
-    adicionar_ao_cache(resposta_final)
+    estado.adicionar_ao_cache(resposta_final)
 
     # Ações após o turno completo
     # Se o combate terminou, atualizar o estado
@@ -1009,79 +1403,143 @@ O resultado deve parecer uma única voz narrativa fluida, como um excelente mest
     return resposta_final
 
 
+# --------------------------
+# Modo Rápido: Turno em uma Única Chamada
+# --------------------------
+
+
+def executar_turno_rapido(comando_usuario, estado: Optional[GameState] = None):
+    """
+    Pipeline alternativo: uma única chamada estruturada ao LLM faz o papel do
+    Orquestrador, do agente líder e do Narrador. As rolagens continuam sendo
+    feitas no código e alimentam o prompt.
+    """
+    if estado is None:
+        estado = estado_padrao
+    event_system = estado.event_system
+
+    # Incrementar o contador de turnos e verificar eventos aleatórios
+    event_system.increment_turn()
+    random_encounter = event_system.check_random_encounter(estado.ficha)
+
+    contexto = estado.contexto_cache()
+    contexto_evento = descrever_evento_aleatorio(random_encounter)
+
+    # Sem Orquestrador, o líder provável vem do roteador local (só para as rolagens)
+    roteamento = roteador.classificar(
+        comando_usuario,
+        em_combate=event_system.in_combat,
+        encontro=random_encounter,
+        tem_aliados=bool(event_system.current_allies),
+    )
+    lider_previsto = roteamento.categoria if roteamento.decisao else "mestre"
+    if random_encounter and random_encounter["tipo"] == "encontro_hostil":
+        event_system.in_combat = True
+    with medir_fase("dados"):
+        resultado_mecanico = resolver_mecanica(comando_usuario, lider_previsto, estado)
+    contexto_mecanico = contexto_resultado_mecanico(resultado_mecanico, event_system)
+
+    if event_system.current_enemies:
+        inimigos_str = ", ".join(
+            f"{e['tipo']} (PV: {e['hp']}/{e['hp_max']}, CA: {e['ca']})"
+            for e in event_system.current_enemies
+        )
+    else:
+        inimigos_str = "Nenhum inimigo ativo."
+
+    resultado_texto = pipeline_turno_rapido.executar(
+        estado_atual="Em combate" if event_system.in_combat else "Exploração",
+        inimigos=inimigos_str,
+        contexto=contexto,
+        contexto_evento=contexto_evento,
+        comando_usuario=comando_usuario,
+        contexto_mecanico=contexto_mecanico,
+        instrucao_tom=TOM_COMBATE if event_system.in_combat else TOM_EXPLORACAO,
+    )
+    estado.historico.registrar_economia(contexto, 1)
+
+    try:
+        resultado = json.loads(extrair_objeto_json(resultado_texto))
+        resposta_final = str(resultado.get("narrativa_final") or resultado["conteudo_lider"]).strip()
+        print(f"Turno rápido liderado por: {resultado.get('agente_lider', '?')}")
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        # Sem JSON válido, o texto devolvido já é a melhor narrativa disponível
+        print(f"Resposta do modo rápido fora do formato: {e}")
+        resposta_final = resultado_texto
+
+    estado.emitir(resposta_final)
+
+    # Adicionar ao cache para contexto futuro
+    estado.adicionar_ao_cache(resposta_final)
+
+    # Se o combate terminou, atualizar o estado
+    if event_system.in_combat and not event_system.current_enemies:
+        event_system.end_combat()
+        resposta_final += "\n\nO combate terminou e você retorna ao modo de exploração."
+
+    return resposta_final
+
+
+# No modo "auto", a cada tantos turnos rápidos seguidos um turno usa o pipeline
+# completo, para medir de novo a sua duração (o LLM pode ter ficado mais rápido)
+TURNOS_SONDAGEM_PIPELINE = int(os.environ.get("DND_PIPELINE_PROBE_EVERY", 10))
+
+
+def escolher_pipeline(estado: GameState) -> str:
+    """
+    Decide o pipeline do turno: "completo" (vários agentes) ou "rapido" (uma chamada).
+    No modo "auto", usa o rápido quando a duração média do completo, medida
+    nesta sessão, excede o orçamento de latência, exceto nos turnos de sondagem.
+    """
+    if estado.modo_pipeline in ("completo", "rapido"):
+        return estado.modo_pipeline
+    estimativa = estado.latencia_pipeline["completo"]
+    if estado.orcamento_latencia is None or estimativa is None:
+        return "completo"
+    if estimativa <= estado.orcamento_latencia:
+        return "completo"
+    if TURNOS_SONDAGEM_PIPELINE > 0 and estado.turnos_rapidos_seguidos >= TURNOS_SONDAGEM_PIPELINE:
+        return "completo"
+    return "rapido"
+
+
+def registrar_latencia_pipeline(estado: GameState, modo: str, duracao: float) -> None:
+    """
+    Atualiza a média da sessão (roda sob o lock da sessão, como o turno). Um
+    turno de sondagem substitui a média do completo, que já estava velha.
+    """
+    anterior = estado.latencia_pipeline[modo]
+    if modo == "completo" and estado.turnos_rapidos_seguidos:
+        anterior = None
+    estado.latencia_pipeline[modo] = (
+        duracao if anterior is None else 0.8 * anterior + 0.2 * duracao
+    )
+    estado.turnos_rapidos_seguidos = estado.turnos_rapidos_seguidos + 1 if modo == "rapido" else 0
+
+
 # --------------------------
 # Ataques de Inimigos em Combate
 # --------------------------
 
 
-def processar_ataque_inimigo():
-    """Processa ataques de inimigos durante o combate"""
+def processar_rodada_inimigos(estado: GameState) -> Optional[ResultadoRodada]:
+    """Rodada dos inimigos: todos os vivos atacam, em ordem de iniciativa"""
+    event_system = estado.event_system
+    ficha = estado.ficha
     if not event_system.in_combat or not event_system.current_enemies:
         return None
 
-    # Escolher um inimigo aleatório para atacar
-    inimigo = random.choice(event_system.current_enemies)
-
-    # Rolagem de ataque
-    # Assumindo um bônus de ataque baseado no tipo de inimigo
-    atk_bonus = 3  # Padrão básico
-    if "cultista" in inimigo["tipo"].lower():
-        atk_bonus = 4
-    elif "espectro" in inimigo["tipo"].lower() or "aparição" in inimigo["tipo"].lower():
-        atk_bonus = 5
-
-    total_roll, d20_value, critical = DiceSystem.attack_roll(atk_bonus)
-
-    # Classe de armadura do jogador
-    ca_jogador = ficha.get("classe_armadura", 10)
-
-    hit = total_roll >= ca_jogador
-
-    # Processar resultado
-    if hit:
-        # Determinar dano base pelo tipo de inimigo
-        dano_base = "1d6"  # Padrão
-        if "esqueleto" in inimigo["tipo"].lower():
-            dano_base = "1d6"  # Espada enferrujada
-        elif "zumbi" in inimigo["tipo"].lower():
-            dano_base = "1d6"  # Golpe desajeitado
-        elif "cultista" in inimigo["tipo"].lower():
-            dano_base = "1d8"  # Adaga ritual
-        elif (
-            "espectro" in inimigo["tipo"].lower()
-            or "aparição" in inimigo["tipo"].lower()
-        ):
-            dano_base = "2d4"  # Toque fantasmagórico
-        elif "sombra" in inimigo["tipo"].lower():
-            dano_base = "2d6"  # Dreno sombrio
-
-        # Rolagem de dano
-        damage_total, damage_rolls = DiceSystem.roll(dano_base)
-        if critical:
-            bonus_damage, _ = DiceSystem.roll(dano_base)
-            damage_total += bonus_damage
-
-        # Aplicar dano ao personagem
-        pv_atual = ficha.get("pontos_vida_atuais", ficha.get("pontos_vida", 0))
-        ficha["pontos_vida_atuais"] = max(0, pv_atual - damage_total)
-
-        return {
-            "inimigo": inimigo["tipo"],
-            "rolagem_ataque": total_roll,
-            "valor_d20": d20_value,
-            "critico": critical,
-            "acerto": hit,
-            "dano": damage_total,
-            "pv_jogador": ficha["pontos_vida_atuais"],
-        }
-    else:
-        return {
-            "inimigo": inimigo["tipo"],
-            "rolagem_ataque": total_roll,
-            "valor_d20": d20_value,
-            "critico": False,
-            "acerto": False,
-        }
+    rodada = resolver_rodada(
+        event_system.current_enemies,
+        ficha.get("ca", 10),
+        ficha.get("pv_atual", ficha.get("pv_maximo", 0)),
+        ficha.get("pv_maximo", 0),
+        estado.dados.rng,
+        monstros,
+    )
+    if rodada is not None and rodada.dano_total:
+        ficha["pv_atual"] = rodada.pv_jogador
+    return rodada
 
 
 # --------------------------
@@ -1089,29 +1547,31 @@ def processar_ataque_inimigo():
 # --------------------------
 
 
-def gerar_loot_combate():
+def gerar_loot_combate(estado: GameState):
     """Gera recompensas aleatórias após combate"""
-    if not event_system.in_combat:
-        return None
+    event_system = estado.event_system
+    rng = estado.dados.rng
+    if event_system.current_enemies:
+        return None  # Ainda há inimigos de pé
 
     # Chance de encontrar itens (70%)
-    if random.random() < 0.7:
+    if rng.random() < 0.7:
         # Tipos de itens possíveis
         itens_comuns = ["Poção de Cura Menor", "Pergaminho Arcano", "Fragmento de Gema"]
         itens_incomuns = ["Amuleto Antigo", "Grimório Parcial", "Poção de Resistência"]
         itens_raros = ["Varinha Arcana", "Essência de Magia", "Pedra de Invocação"]
 
         # Determinar raridade
-        raridade_roll = random.random()
+        raridade_roll = rng.random()
         if raridade_roll < 0.7:  # 70% comum
-            item = random.choice(itens_comuns)
-            valor = random.randint(5, 25)
+            item = rng.choice(itens_comuns)
+            valor = rng.randint(5, 25)
         elif raridade_roll < 0.95:  # 25% incomum
-            item = random.choice(itens_incomuns)
-            valor = random.randint(25, 100)
+            item = rng.choice(itens_incomuns)
+            valor = rng.randint(25, 100)
         else:  # 5% raro
-            item = random.choice(itens_raros)
-            valor = random.randint(100, 500)
+            item = rng.choice(itens_raros)
+            valor = rng.randint(100, 500)
 
         return {
             "item": item,
@@ -1120,7 +1580,7 @@ def gerar_loot_combate():
         }
     else:
         # Apenas ouro
-        moedas = random.randint(5, 50)
+        moedas = rng.randint(5, 50)
         return {
             "ouro": moedas,
             "descricao": f"Você encontrou {moedas} moedas de ouro nos restos dos inimigos.",
@@ -1132,100 +1592,80 @@ def gerar_loot_combate():
 # --------------------------
 
 
-def processar_turno_com_resposta_inimigo(comando_usuario):
+def processar_turno_com_resposta_inimigo(comando_usuario, estado: GameState):
     """Processa o turno do jogador e gera reação dos inimigos quando necessário"""
-    # Executar o turno principal
-    resposta_jogador = executar_turno(comando_usuario)
+    event_system = estado.event_system
+    em_combate_antes = event_system.in_combat
+
+    # Executar o turno principal, no pipeline escolhido para a sessão
+    modo = escolher_pipeline(estado)
+    estado.ultimo_pipeline = modo
+    inicio = time.perf_counter()
+    if modo == "rapido":
+        resposta_jogador = executar_turno_rapido(comando_usuario, estado)
+    else:
+        resposta_jogador = executar_turno(comando_usuario, estado)
+    duracao = time.perf_counter() - inicio
+    registrar_latencia_pipeline(estado, modo, duracao)
+    registry.histogram(
+        "turn_seconds", "Duração do turno do jogador (sem a reação dos inimigos)", pipeline=modo
+    ).observe(duracao)
 
     resposta_final = resposta_jogador
 
-    # Se estamos em combate, processar o ataque do inimigo
+    # Se estamos em combate, os inimigos vivos agem (em ordem de iniciativa)
     if event_system.in_combat and event_system.current_enemies:
-        ataque_inimigo = processar_ataque_inimigo()
-
-        if ataque_inimigo:
-            # Criar tarefa para narrar a resposta do inimigo
-            descricao_ataque = ""
-            if ataque_inimigo["acerto"]:
-                if ataque_inimigo["critico"]:
-                    descricao_ataque = f"""
-O {ataque_inimigo["inimigo"]} reage ao seu ataque! Ele realiza um ataque CRÍTICO contra você.
-- Rolagem de ataque: {ataque_inimigo["valor_d20"]} (CRÍTICO!) + bônus = {ataque_inimigo["rolagem_ataque"]}
-- O ataque acerta você (CA {ficha.get("classe_armadura", 10)})
-- Dano sofrido: {ataque_inimigo["dano"]} pontos de vida
-- Seus pontos de vida: {ataque_inimigo["pv_jogador"]}/{ficha.get("pontos_vida", 0)}
-                    """
-                else:
-                    descricao_ataque = f"""
-O {ataque_inimigo["inimigo"]} reage ao seu ataque! Ele realiza um ataque contra você.
-- Rolagem de ataque: {ataque_inimigo["valor_d20"]} (d20) + bônus = {ataque_inimigo["rolagem_ataque"]}
-- O ataque acerta você (CA {ficha.get("classe_armadura", 10)})
-- Dano sofrido: {ataque_inimigo["dano"]} pontos de vida
-- Seus pontos de vida: {ataque_inimigo["pv_jogador"]}/{ficha.get("pontos_vida", 0)}
-                    """
-            else:
-                descricao_ataque = f"""
-O {ataque_inimigo["inimigo"]} tenta revidar, mas falha!
-- Rolagem de ataque: {ataque_inimigo["valor_d20"]} (d20) + bônus = {ataque_inimigo["rolagem_ataque"]}
-- O ataque erra você (CA {ficha.get("classe_armadura", 10)})
-                """
-
-            # Criar tarefa para narrar o contra-ataque
-            tarefa_contra_ataque = Task(
-                description=f"""Todas as respostas devem ser em português do Brasil.
-Você precisa criar uma breve narração para o contra-ataque de um inimigo em um combate de D&D.
-Use um estilo tático e direto, similar ao de um mestre de RPG em uma mesa real.
-Integre os resultados mecânicos na narrativa de forma sutil mas informativa.
+        rodada_inimigos = processar_rodada_inimigos(estado)
 
-RESULTADOS MECÂNICOS DO CONTRA-ATAQUE:
-{descricao_ataque}
-
-Crie uma narração breve (2-3 frases) que descreva este contra-ataque do inimigo.
-Use vocabulário vívido e detalhes táticos apropriados para o tipo de inimigo.
-""",
-                agent=narrador,
-                expected_output="Narração do contra-ataque inimigo",
-            )
-
-            crew_contra_ataque = Crew(
-                agents=[narrador], tasks=[tarefa_contra_ataque], verbose=False
-            )
+        if rodada_inimigos:
+            # Uma única narração para a rodada inteira dos inimigos
+            descricao_ataque = rodada_inimigos.descricao()
 
-            resultado_contra_ataque = crew_contra_ataque.kickoff()
+            # Narrar o contra-ataque
+            estado.emitir("\n\n")
+            with streaming_narracao.transmitir(estado.on_token):
+                resultado_contra_ataque = pipeline_contra_ataque.executar(
+                    descricao_ataque=descricao_ataque
+                )
 
             # Adicionar o contra-ataque à resposta final
-            resposta_final += f"\n\n{str(resultado_contra_ataque).strip()}"
+            resposta_final += f"\n\n{resultado_contra_ataque}"
 
-    # Checar se o combate acabou e há loot
-    if event_system.in_combat and not event_system.current_enemies:
-        loot = gerar_loot_combate()
+    # Checar se o combate acabou neste turno e há loot (o turno já encerrou o combate)
+    if em_combate_antes and not event_system.current_enemies:
+        loot = gerar_loot_combate(estado)
 
         if loot:
-            # Criar tarefa para narrar o loot encontrado
-            tarefa_loot = Task(
-                description=f"""Todas as respostas devem ser em português do Brasil.
-Você precisa criar uma breve narração para o loot/recompensa encontrada após um combate em D&D.
-Use um estilo épico e recompensador, como um mestre satisfeito com a vitória dos jogadores.
-
-LOOT ENCONTRADO:
-{loot["descricao"]}
-
-Crie uma narração breve (1-2 frases) que descreva de forma interessante e épica a descoberta deste loot.
-""",
-                agent=narrador,
-                expected_output="Narração da descoberta de loot",
-            )
-
-            crew_loot = Crew(agents=[narrador], tasks=[tarefa_loot], verbose=False)
-
-            resultado_loot = crew_loot.kickoff()
+            # Narrar o loot encontrado
+            estado.emitir("\n\n")
+            with streaming_narracao.transmitir(estado.on_token):
+                resultado_loot = pipeline_loot.executar(descricao_loot=loot["descricao"])
 
             # Adicionar o loot à resposta final
-            resposta_final += f"\n\n{str(resultado_loot).strip()}"
+            resposta_final += f"\n\n{resultado_loot}"
 
     return resposta_final
 
 
 # Função principal para integração com o servidor Flask
-def processar_comando(comando):
-    return processar_turno_com_resposta_inimigo(comando)
+def processar_comando(comando, estado: Optional[GameState] = None, on_token=None):
+    """
+    Processa um comando do jogador. Se `on_token` for informado, os trechos da
+    narração são enviados a ele à medida que o LLM os gera.
+    """
+    if estado is None:
+        estado = estado_padrao
+    estado.on_token = on_token
+    if cassete is not None:
+        cassete.iniciar_turno(estado)
+    try:
+        resposta = processar_turno_com_resposta_inimigo(comando, estado)
+    except Exception as e:
+        if cassete is not None:
+            cassete.registrar_turno(estado, comando, None, erro=str(e))
+        raise
+    finally:
+        estado.on_token = None
+    if cassete is not None:
+        cassete.registrar_turno(estado, comando, resposta)
+    return resposta
@@ -0,0 +1,182 @@
+# metrics.py - Métricas em memória (contadores, gauges e histogramas) do servidor
+import math
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class Counter:
+    """Contador monotônico thread-safe"""
+
+    def __init__(self, name: str, help_text: str = "", labels: Dict[str, str] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = labels or {}
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Gauge:
+    """
+    Valor instantâneo (ex.: profundidade da fila). Pode ser atualizado com
+    `set` ou calculado na leitura por uma função registrada com `track`.
+    """
+
+    def __init__(self, name: str, help_text: str = "", labels: Dict[str, str] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = labels or {}
+        self._value = 0.0
+        self._fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def track(self, fn: Callable[[], float]) -> None:
+        self._fn = fn
+
+    @property
+    def value(self) -> float:
+        return float(self._fn()) if self._fn is not None else self._value
+
+
+class Histogram:
+    """
+    Histograma de amostras (ex.: latência em segundos).
+    Guarda contagem e soma exatas e uma amostra limitada (reservoir sampling)
+    para estimar percentis sem crescer a memória.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str = "",
+        labels: Dict[str, str] = None,
+        reservoir_size: int = 2048,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = labels or {}
+        self.count = 0
+        self.sum = 0.0
+        self._reservoir: List[float] = []
+        self._reservoir_size = reservoir_size
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if len(self._reservoir) < self._reservoir_size:
+                self._reservoir.append(value)
+            else:
+                slot = random.randrange(self.count)
+                if slot < self._reservoir_size:
+                    self._reservoir[slot] = value
+
+    def quantile(self, q: float) -> float:
+        """Percentil aproximado (q entre 0 e 1); 0.0 sem amostras"""
+        with self._lock:
+            samples = sorted(self._reservoir)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """Registro único das métricas; cada combinação nome+rótulos é criada uma vez"""
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, Tuple], object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, labels: Dict[str, str]):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = cls(name, help_text, labels)
+                self._metrics[key] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def all(self) -> List[object]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        """
+        Texto no formato de exposição do Prometheus. Histogramas saem como
+        `summary`: percentis p50/p95/p99 da amostra, mais soma e contagem exatas.
+        """
+        by_name: Dict[str, List[object]] = {}
+        for metric in sorted(self.all(), key=lambda m: (m.name, sorted(m.labels.items()))):
+            by_name.setdefault(metric.name, []).append(metric)
+
+        lines = []
+        for name, metrics in by_name.items():
+            first = metrics[0]
+            kind = {Counter: "counter", Gauge: "gauge", Histogram: "summary"}[type(first)]
+            if first.help:
+                lines.append(f"# HELP {name} {_escape(first.help, help_text=True)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                if isinstance(metric, Histogram):
+                    for q in (0.5, 0.95, 0.99):
+                        labels = _labels(dict(metric.labels, quantile=str(q)))
+                        lines.append(f"{name}{labels} {_number(metric.quantile(q))}")
+                    lines.append(f"{name}_sum{_labels(metric.labels)} {_number(metric.sum)}")
+                    lines.append(f"{name}_count{_labels(metric.labels)} {metric.count}")
+                else:
+                    lines.append(f"{name}{_labels(metric.labels)} {_number(metric.value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str, help_text: bool = False) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value if help_text else value.replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in sorted(labels.items())) + "}"
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+# Registro global usado por todos os módulos
+registry = MetricsRegistry()
@@ -0,0 +1,43 @@
+# notifier.py - Publicação das mudanças de status dos comandos para quem está ouvindo
+import threading
+from queue import Queue
+from typing import Dict, Hashable, List
+
+
+class StatusBroker:
+    """
+    Pub/sub em memória: cada ouvinte (ex.: uma conexão SSE) recebe uma fila
+    própria e é acordado assim que o worker publica uma transição.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[Hashable, List[Queue]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key: Hashable) -> Queue:
+        queue = Queue()
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(queue)
+        return queue
+
+    def unsubscribe(self, key: Hashable, queue: Queue) -> None:
+        with self._lock:
+            queues = self._subscribers.get(key)
+            if not queues:
+                return
+            if queue in queues:
+                queues.remove(queue)
+            if not queues:
+                del self._subscribers[key]
+
+    def publish(self, key: Hashable, event: dict) -> int:
+        """Entrega o evento a todos os ouvintes da chave; retorna quantos receberam"""
+        with self._lock:
+            queues = list(self._subscribers.get(key, ()))
+        for queue in queues:
+            queue.put(event)
+        return len(queues)
+
+    def listeners(self) -> int:
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
@@ -0,0 +1,166 @@
+# persistence.py - Partidas salvas em SQLite para sobreviver a reinícios do servidor
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from metrics import registry
+
+persist_seconds = registry.histogram(
+    "persistence_write_seconds", "Tempo para gravar um turno ou uma foto da partida no SQLite"
+)
+sessions_restored = registry.counter(
+    "sessions_restored_total", "Sessões recarregadas do SQLite depois de saírem da memória"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    session_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    changes TEXT,
+    history TEXT NOT NULL,
+    clears_history INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+
+class SavedSession:
+    """O que foi gravado de uma sessão: última foto, turnos posteriores e histórico exibido"""
+
+    def __init__(self, snapshot: Optional[Dict], changes: List[Dict], history: List[dict], seq: int):
+        self.snapshot = snapshot
+        self.changes = changes
+        self.history = history
+        self.seq = seq
+
+
+class GameStore:
+    """
+    Gravação incremental das partidas em SQLite (modo WAL).
+
+    Cada turno vira uma linha nova em `turns` com as alterações do estado e as
+    mensagens exibidas ao jogador; nada é reescrito. A cada `snapshot_every`
+    turnos o estado completo vai para `snapshots`, para que a recarga só
+    precise refazer os turnos seguintes a ela. Uma conexão por thread.
+    """
+
+    def __init__(self, path: str, snapshot_every: int = 10):
+        self.path = path
+        self.snapshot_every = max(1, snapshot_every)
+        self._local = threading.local()
+        self._seq: Dict[str, int] = {}  # Último turno gravado das sessões em memória
+        self._seq_lock = threading.Lock()
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")  # Com WAL, seguro contra queda do processo
+            self._local.db = db
+        return db
+
+    def load(self, session_id: str) -> Optional[SavedSession]:
+        """Última foto e turnos seguintes, ou None se a sessão nunca foi gravada"""
+        db = self._connection()
+        row = db.execute(
+            "SELECT seq, state FROM snapshots WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        snapshot_seq, snapshot = (row[0], json.loads(row[1])) if row else (0, None)
+
+        changes, history, seq = [], [], 0
+        for seq, turn_changes, turn_history, clears_history in db.execute(
+            "SELECT seq, changes, history, clears_history FROM turns WHERE session_id = ? ORDER BY seq",
+            (session_id,),
+        ):
+            if clears_history:
+                history = []
+            history.extend(json.loads(turn_history))
+            if seq > snapshot_seq and turn_changes is not None:
+                changes.append(json.loads(turn_changes))
+        if row is None and not seq:
+            return None
+
+        with self._seq_lock:
+            self._seq[session_id] = max(seq, snapshot_seq)
+        sessions_restored.inc()
+        return SavedSession(snapshot, changes, history, max(seq, snapshot_seq))
+
+    def append_turn(
+        self,
+        session_id: str,
+        history: List[dict],
+        changes: Optional[Dict] = None,
+        clears_history: bool = False,
+    ) -> int:
+        """Grava um turno (alterações do estado e mensagens exibidas); devolve o número dele"""
+        with self._seq_lock:
+            last = self._seq.get(session_id)
+        if last is None:  # Sessão esquecida (`forget`) ou nunca carregada: o banco sabe
+            last = self._last_seq(session_id)
+        with self._seq_lock:
+            seq = self._seq.get(session_id, last) + 1
+            self._seq[session_id] = seq
+        started = time.perf_counter()
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO turns (session_id, seq, changes, history, clears_history, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    seq,
+                    json.dumps(changes, ensure_ascii=False) if changes is not None else None,
+                    json.dumps(history, ensure_ascii=False),
+                    int(clears_history),
+                    time.time(),
+                ),
+            )
+        persist_seconds.observe(time.perf_counter() - started)
+        return seq
+
+    def _last_seq(self, session_id: str) -> int:
+        row = self._connection().execute(
+            "SELECT MAX(seq) FROM (SELECT seq FROM turns WHERE session_id = ? "
+            "UNION ALL SELECT seq FROM snapshots WHERE session_id = ?)",
+            (session_id, session_id),
+        ).fetchone()
+        return row[0] or 0
+
+    def forget(self, session_id: str) -> None:
+        """Libera o contador de turnos de uma sessão que saiu da memória (a partida continua gravada)"""
+        with self._seq_lock:
+            self._seq.pop(session_id, None)
+
+    def snapshot_due(self, seq: int) -> bool:
+        return seq % self.snapshot_every == 0
+
+    def save_snapshot(self, session_id: str, seq: int, state: Dict) -> None:
+        """Foto completa do estado após o turno `seq`"""
+        started = time.perf_counter()
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO snapshots (session_id, seq, state, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET seq = excluded.seq, state = excluded.state, "
+                "updated_at = excluded.updated_at",
+                (session_id, seq, json.dumps(state, ensure_ascii=False), time.time()),
+            )
+        persist_seconds.observe(time.perf_counter() - started)
+
+    def delete(self, session_id: str) -> None:
+        """Apaga a partida gravada (ex.: o jogador começou uma nova)"""
+        with self._seq_lock:
+            self._seq.pop(session_id, None)
+        with self._connection() as db:
+            db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            db.execute("DELETE FROM snapshots WHERE session_id = ?", (session_id,))
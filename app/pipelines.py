@@ -0,0 +1,78 @@
+# pipelines.py - Crews de uma tarefa montadas uma vez e reaproveitadas a cada turno
+import threading
+from typing import Tuple
+
+from crewai import Agent, Crew, Task
+
+from telemetria import medir_fase
+
+# Campos que o CrewAI preenche ou altera ao executar; a cópia de um agente começa sem eles
+CAMPOS_DE_EXECUCAO = frozenset({"id", "agent_executor", "cache_handler", "tools_handler", "crew"})
+
+
+def copiar_agente(agente: Agent, **alteracoes) -> Agent:
+    """Agente novo com a configuração de `agente` (papel, objetivo, história, LLM...) e `alteracoes`"""
+    campos = {campo: getattr(agente, campo) for campo in agente.model_fields_set - CAMPOS_DE_EXECUCAO}
+    campos.update(alteracoes)
+    return Agent(**campos)
+
+
+class PipelineAgente:
+    """
+    Pipeline de um agente com uma única tarefa, cujo prompt é um modelo
+    (`str.format`) preenchido a cada chamada.
+
+    Montar `Task` e `Crew` custa validação do Pydantic, telemetria e várias
+    alocações; aqui isso acontece uma vez por thread e, nos turnos seguintes,
+    só a descrição da tarefa é trocada. Cada thread tem sua própria cópia,
+    inclusive do agente: a tarefa guarda a saída da última execução, o agente
+    recria o executor (ferramentas, tarefa, cache) a cada execução e turnos de
+    sessões diferentes e fases do mesmo turno rodam em paralelo. `agente` é
+    só o modelo das cópias.
+
+    Cada execução é medida (tempo e tokens) com os rótulos `fase` e `agente_nome`.
+    """
+
+    def __init__(
+        self,
+        fase: str,
+        agente_nome: str,
+        agente: Agent,
+        modelo_descricao: str,
+        saida_esperada: str,
+        verbose: bool = False,
+    ):
+        self.fase = fase
+        self.agente_nome = agente_nome
+        self.agente = agente
+        self.modelo_descricao = modelo_descricao
+        self.saida_esperada = saida_esperada
+        self.verbose = verbose
+        self._local = threading.local()
+
+    def preencher(self, **variaveis) -> Tuple[str, str]:
+        """Descrição e saída esperada da tarefa com as variáveis do turno"""
+        return (
+            self.modelo_descricao.format(**variaveis),
+            self.saida_esperada.format(**variaveis),
+        )
+
+    def montar(self) -> Tuple[Crew, Task]:
+        """Crew, tarefa e agente desta thread, criados na primeira chamada"""
+        montado = getattr(self._local, "montado", None)
+        if montado is None:
+            agente = copiar_agente(self.agente)
+            tarefa = Task(
+                description=self.modelo_descricao,
+                expected_output=self.saida_esperada,
+                agent=agente,
+            )
+            crew = Crew(agents=[agente], tasks=[tarefa], verbose=self.verbose)
+            montado = self._local.montado = (crew, tarefa)
+        return montado
+
+    def executar(self, **variaveis) -> str:
+        crew, tarefa = self.montar()
+        tarefa.description, tarefa.expected_output = self.preencher(**variaveis)
+        with medir_fase(self.fase, self.agente_nome):
+            return str(crew.kickoff()).strip()
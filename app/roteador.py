@@ -0,0 +1,264 @@
+# roteador.py - Roteamento local de intenções (sem LLM) para comandos óbvios
+import copy
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from metrics import registry
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas e sem acentos, para comparar palavras-chave"""
+    return "".join(
+        c
+        for c in unicodedata.normalize("NFD", texto.lower())
+        if not unicodedata.combining(c)
+    )
+
+
+def contem_termo(texto: str, termos: Iterable[str]) -> bool:
+    """Verifica se algum termo (já normalizado) aparece no texto, ignorando acentos"""
+    texto = normalizar(texto)
+    return any(termo in texto for termo in termos)
+
+
+# Termos usados na fase de rolagens do combate (normalizados, sem acento)
+TERMOS_ATAQUE = [
+    "atac",
+    "golpe",
+    "lancar",
+    "magica",
+    "magia",
+    "raio",
+    "disparo",
+    "tiro",
+    "fogo",
+    "gelo",
+]
+TERMOS_DEFESA = ["defend", "esquiv", "proteg", "escud", "bloque"]
+TERMOS_MOVIMENTO = ["mov", "corr", "salt", "andar", "recuar", "afast", "approx"]
+
+# Prefixos de palavras usados pelo roteador local
+PREFIXOS_ATAQUE_DIRETO = ["atac", "golpe", "golpei", "dispar", "tiro", "atir", "lutar", "ferir", "matar", "acert"]
+PREFIXOS_MAGIA = ["lancar", "lanco", "conjur", "magia", "feitic", "raio", "fogo", "gelo", "missei"]
+PREFIXOS_EXPLORACAO = [
+    "examin", "olh", "observ", "procur", "investig", "explor", "vasculh", "inspecion",
+    "analis", "busc", "descrev", "escut", "cheir", "avanc", "entr", "caminh", "continu",
+    "segu", "abr", "armadilh", "sala", "corredor", "porta", "parede",
+]
+PREFIXOS_DIALOGO = [
+    "falar", "falo", "fale", "convers", "pergunt", "dialog", "negoci", "persuad",
+    "cumpriment", "digo", "diga", "dizer", "grit", "sussurr", "intimid", "engan",
+    "respond", "indag", "npc",
+]
+PREFIXOS_REGRAS = [
+    "regra", "teste", "testar", "rolar", "rolagem", "modificador", "bonus", "pericia",
+    "salvaguarda", "resistenc", "iniciativa", "atributo",
+]
+
+# Agentes auxiliares e direcionamento padrão para cada líder
+AUXILIARES_POR_LIDER = {
+    "combate": ["narrador", "regras"],
+    "mundo": ["narrador", "mestre"],
+    "npcs": ["narrador", "mestre"],
+    "regras": ["narrador"],
+}
+DIRECIONAMENTO_POR_LIDER = {
+    "combate": "Resolva a ação de combate do jogador com foco tático, considerando os resultados das rolagens.",
+    "mundo": "Descreva o que Alion percebe ao realizar a ação, com detalhes sensoriais e elementos interativos.",
+    "npcs": "Interprete a reação e as falas do personagem com quem Alion interage.",
+    "regras": "Explique e aplique a regra do D&D 5e envolvida na ação do jogador.",
+}
+
+decisoes_roteamento = {
+    origem: registry.counter(
+        "router_decisions_total", "Decisões de roteamento por origem", origem=origem
+    )
+    for origem in ("local", "llm")
+}
+economia_roteamento = registry.counter(
+    "router_saved_seconds_total", "Latência estimada economizada pelo roteador local"
+)
+latencia_orquestrador = registry.histogram(
+    "orchestrator_llm_seconds", "Duração da chamada ao Orquestrador (LLM)"
+)
+acertos_cache_roteamento = registry.counter(
+    "router_cache_hits_total", "Decisões do Orquestrador servidas pelo cache"
+)
+falhas_cache_roteamento = registry.counter(
+    "router_cache_misses_total", "Consultas ao cache de roteamento sem resultado"
+)
+
+
+class Roteamento:
+    """Resultado da classificação local de um comando"""
+
+    def __init__(self, decisao: Optional[Dict], confianca: float, categoria: str, termos: List[str], confiavel: bool):
+        self.decisao = decisao
+        self.confianca = confianca
+        self.categoria = categoria
+        self.termos = termos
+        self.confiavel = confiavel
+
+
+class IntentRouter:
+    """
+    Classificador de intenção por palavras-chave, insensível a acentos.
+    Gera a mesma `decisao` que o Orquestrador produziria para comandos óbvios
+    (atacar em combate, examinar a sala, falar com um NPC) e indica baixa
+    confiança nos demais casos, para que o LLM seja consultado.
+    """
+
+    def __init__(self, confianca_minima: float = 0.75, latencia_llm_padrao: float = 1.5):
+        self.confianca_minima = confianca_minima
+        self._latencia_llm = latencia_llm_padrao  # Média móvel da chamada ao Orquestrador
+        self._lock = threading.Lock()
+        self.acertos_locais = 0
+        self.chamadas_llm = 0
+        self.economia_segundos = 0.0
+
+    def classificar(
+        self,
+        comando: str,
+        em_combate: bool = False,
+        encontro: Optional[Dict] = None,
+        tem_aliados: bool = False,
+    ) -> Roteamento:
+        palavras = re.findall(r"\w+", normalizar(comando))
+
+        def casa(prefixos):
+            return [p for p in prefixos if any(palavra.startswith(p) for palavra in palavras)]
+
+        ataque = casa(PREFIXOS_ATAQUE_DIRETO)
+        magia = casa(PREFIXOS_MAGIA)
+        defesa = casa(TERMOS_DEFESA)
+        movimento = casa(TERMOS_MOVIMENTO)
+        exploracao = casa(PREFIXOS_EXPLORACAO)
+        dialogo = casa(PREFIXOS_DIALOGO)
+        regras = casa(PREFIXOS_REGRAS)
+
+        # Candidatos: (líder, confiança base, termos encontrados)
+        candidatos = []
+        if em_combate:
+            if ataque or magia or defesa:
+                candidatos.append(("combate", 0.95, ataque + magia + defesa))
+            elif movimento:
+                candidatos.append(("combate", 0.8, movimento))
+        elif ataque:
+            # Atacar fora de combate pode ser o início de uma luta ou algo narrativo
+            candidatos.append(("combate", 0.6, ataque))
+        if dialogo and not em_combate:
+            candidatos.append(("npcs", 0.9 if tem_aliados else 0.85, dialogo))
+        if exploracao and not em_combate:
+            candidatos.append(("mundo", 0.9, exploracao))
+        if regras:
+            candidatos.append(("regras", 0.8, regras))
+
+        if not candidatos:
+            return Roteamento(None, 0.0, "desconhecida", [], False)
+
+        lideres = {lider for lider, _, _ in candidatos}
+        lider, confianca, termos = max(candidatos, key=lambda c: c[1])
+        if len(lideres) > 1:
+            confianca *= 0.6  # Intenções concorrentes: melhor perguntar ao LLM
+        if magia and not em_combate and lider == "mundo":
+            confianca *= 0.8  # Ex.: "Lançar Detectar Magia" pode ter efeitos narrativos
+        if encontro:
+            confianca *= 0.5  # Um evento aleatório muda a cena: o Orquestrador decide
+
+        decisao = {
+            "agente_lider": lider,
+            "agentes_auxiliares": list(AUXILIARES_POR_LIDER[lider]),
+            "análise_situacional": f"Roteamento local: intenção de {lider} identificada por palavras-chave ({', '.join(termos)}).",
+            "direcionamento": DIRECIONAMENTO_POR_LIDER[lider],
+        }
+        return Roteamento(decisao, confianca, lider, termos, confianca >= self.confianca_minima)
+
+    def registrar_local(self, roteamento: Roteamento) -> None:
+        """Contabiliza uma decisão tomada sem LLM e a latência economizada"""
+        with self._lock:
+            self.acertos_locais += 1
+            self.economia_segundos += self._latencia_llm
+            economia = self._latencia_llm
+        decisoes_roteamento["local"].inc()
+        economia_roteamento.inc(economia)
+        print(
+            f"Roteador local: {roteamento.categoria} (confiança {roteamento.confianca:.2f}) | "
+            f"taxa de acerto {self.taxa_acerto():.0%} | economia estimada {self.economia_segundos:.1f}s"
+        )
+
+    def registrar_llm(self, roteamento: Roteamento, duracao: float) -> None:
+        """Contabiliza uma decisão que precisou do Orquestrador e atualiza a latência média"""
+        with self._lock:
+            self.chamadas_llm += 1
+            self._latencia_llm = 0.8 * self._latencia_llm + 0.2 * duracao
+        decisoes_roteamento["llm"].inc()
+        latencia_orquestrador.observe(duracao)
+        print(
+            f"Roteador local sem confiança ({roteamento.confianca:.2f}); Orquestrador levou {duracao:.2f}s | "
+            f"taxa de acerto {self.taxa_acerto():.0%}"
+        )
+
+    def taxa_acerto(self) -> float:
+        total = self.acertos_locais + self.chamadas_llm
+        return self.acertos_locais / total if total else 0.0
+
+
+class RoutingCache:
+    """
+    Cache LRU limitado das decisões do Orquestrador.
+
+    A chave é a forma canônica das entradas que realmente determinam o
+    roteamento: comando normalizado, combate/exploração e o tipo de encontro
+    aleatório do turno. As entradas pertencem a uma sessão e podem ser
+    invalidadas por sessão (ex.: quando o jogador reinicia a aventura).
+    """
+
+    def __init__(self, max_entradas: int = 2048):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    @staticmethod
+    def chave(comando: str, em_combate: bool, encontro: Optional[Dict]) -> Tuple:
+        comando_canonico = " ".join(re.findall(r"\w+", normalizar(comando)))
+        tipo_encontro = encontro["tipo"] if encontro else None
+        return (comando_canonico, bool(em_combate), tipo_encontro)
+
+    def obter(self, sessao: Hashable, chave: Tuple) -> Optional[Dict]:
+        with self._lock:
+            decisao = self._entradas.get((sessao, chave))
+            if decisao is None:
+                self.falhas += 1
+            else:
+                self._entradas.move_to_end((sessao, chave))
+                self.acertos += 1
+        if decisao is None:
+            falhas_cache_roteamento.inc()
+            return None
+        acertos_cache_roteamento.inc()
+        # Cópia: o turno altera a lista de auxiliares da decisão
+        return copy.deepcopy(decisao)
+
+    def guardar(self, sessao: Hashable, chave: Tuple, decisao: Dict) -> None:
+        with self._lock:
+            self._entradas[(sessao, chave)] = copy.deepcopy(decisao)
+            self._entradas.move_to_end((sessao, chave))
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, sessao: Hashable) -> int:
+        """Remove todas as decisões guardadas para a sessão"""
+        with self._lock:
+            chaves = [chave for chave in self._entradas if chave[0] == sessao]
+            for chave in chaves:
+                del self._entradas[chave]
+        return len(chaves)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entradas": len(self._entradas), "acertos": self.acertos, "falhas": self.falhas}
@@ -0,0 +1,159 @@
+# sessions.py - Armazenamento do estado de jogo isolado por sessão
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class Session:
+    """Entrada do SessionStore: o estado de um jogador e o lock que o protege"""
+
+    def __init__(self, session_id: str, state, now: float):
+        self.id = session_id
+        self.state = state
+        self.lock = threading.RLock()
+        self.created_at = now
+        self.last_access = now
+        self.size = 0  # Estimativa em bytes, atualizada ao liberar a sessão
+        self.active = 0  # Quantos usuários seguram a sessão no momento
+
+
+class SessionStore:
+    """
+    Mantém um estado de jogo independente por id de sessão.
+
+    - Cada sessão tem seu próprio lock (turnos da mesma sessão não se misturam)
+    - Sessões ociosas por mais de `idle_ttl` segundos são descartadas
+    - Ao exceder `max_sessions` ou `max_bytes`, as menos usadas (LRU) saem primeiro
+    - Sessões em uso nunca são removidas
+    - `on_evict(session_id, state)` é chamado sempre que um estado sai da memória
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], object],
+        max_sessions: int = 500,
+        idle_ttl: float = 3600.0,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[object], int]] = None,
+        on_evict: Optional[Callable[[str, object], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._clock = clock
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str, hold: bool = False) -> Session:
+        """
+        Retorna a sessão (criando-a se necessário) e a marca como usada recentemente.
+        Com hold=True a sessão fica protegida contra remoção até `release`.
+        """
+        with self._lock:
+            now = self._clock()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = Session(session_id, self._factory(session_id), now)
+                self._sessions[session_id] = entry
+            else:
+                self._sessions.move_to_end(session_id)
+            entry.last_access = now
+            if hold:
+                entry.active += 1
+            self._evict_locked(now)
+            return entry
+
+    @contextmanager
+    def session(self, session_id: str):
+        """Segura o lock da sessão enquanto o estado é usado e devolve o estado"""
+        entry = self.get(session_id, hold=True)
+        try:
+            with entry.lock:
+                yield entry.state
+        finally:
+            self.release(entry)
+
+    def release(self, entry: Session) -> None:
+        """Atualiza tempo de acesso e tamanho estimado depois do uso da sessão"""
+        with self._lock:
+            entry.active = max(0, entry.active - 1)
+            now = self._clock()
+            entry.last_access = now
+            if self._sessions.get(entry.id) is entry:
+                self._sessions.move_to_end(entry.id)
+            if self._sizeof is not None and self._sessions.get(entry.id) is entry:
+                new_size = self._sizeof(entry.state)
+                self._total_bytes += new_size - entry.size
+                entry.size = new_size
+            self._evict_locked(now)
+
+    def reset(self, session_id: str) -> Session:
+        """Descarta o estado atual da sessão e cria um novo, sem afetar as outras"""
+        self.discard(session_id)
+        return self.get(session_id)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self._total_bytes -= entry.size
+        if entry is not None and self._on_evict is not None:
+            self._on_evict(session_id, entry.state)
+
+    def evict_expired(self) -> int:
+        """Remove sessões ociosas; o servidor chama a cada `DND_SWEEP_INTERVAL` segundos"""
+        with self._lock:
+            return self._evict_locked(self._clock())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._total_bytes,
+                "evictions": self.evictions,
+            }
+
+    def _evict_locked(self, now: float) -> int:
+        removed = 0
+        # Ociosas primeiro (a ordem do OrderedDict é do menos para o mais recente)
+        for session_id, entry in list(self._sessions.items()):
+            if now - entry.last_access < self.idle_ttl:
+                break
+            if entry.active:
+                continue
+            self._drop_locked(session_id, entry)
+            removed += 1
+
+        # Depois, LRU até voltar aos limites de quantidade e memória
+        for session_id, entry in list(self._sessions.items()):
+            over_count = len(self._sessions) > self.max_sessions
+            over_bytes = self.max_bytes is not None and self._total_bytes > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            if entry.active:
+                continue
+            self._drop_locked(session_id, entry)
+            removed += 1
+        return removed
+
+    def _drop_locked(self, session_id: str, entry: Session) -> None:
+        del self._sessions[session_id]
+        self._total_bytes -= entry.size
+        self.evictions += 1
+        print(f"Sessão {session_id} removida da memória.")
+        if self._on_evict is not None:
+            self._on_evict(session_id, entry.state)
@@ -13,6 +13,8 @@ document.addEventListener('DOMContentLoaded', function () {
     let processingCommand = false;
     let pollingInterval = null;
     const POLLING_INTERVAL_MS = 2000;
+    const COMMAND_RETRIES = 2;
+    const COMMAND_RETRY_DELAY_MS = 1000;
 
     const collapsibles = document.querySelectorAll('.collapsible-header');
     collapsibles.forEach(header => {
@@ -36,6 +38,89 @@ document.addEventListener('DOMContentLoaded', function () {
         narrativeContainer.scrollTop = narrativeContainer.scrollHeight;
     }
 
+    // Trata uma atualização de status (vinda do SSE ou do polling).
+    // Retorna true quando o comando terminou (com sucesso ou erro).
+    function handleStatus(data) {
+        if (!data.processing) {
+            removeStreamingMessage();
+            loadCharacterInfo(); // O turno pode ter mudado o PV; sem mudança, o servidor responde 304
+        }
+
+        if (!data.success && !data.processing) {
+            statusIndicator.textContent = 'Erro ao processar.';
+            statusIndicator.className = 'status-indicator status-error';
+            processingCommand = false;
+            if (data.history_additions && Array.isArray(data.history_additions)) {
+                data.history_additions.forEach(msg => appendMessage(msg.type, msg.content));
+            }
+            return true;
+        }
+
+        if (!data.processing) {
+            statusIndicator.textContent = 'Pronto para o próximo comando';
+            statusIndicator.className = 'status-indicator status-ready';
+            processingCommand = false;
+
+            if (data.history_additions && Array.isArray(data.history_additions)) {
+                data.history_additions.forEach(msg => appendMessage(msg.type, msg.content));
+            }
+            return true;
+        }
+
+        typingIndicator.style.display = 'inline-block';
+        return false;
+    }
+
+    // Bolha temporária que mostra a narração enquanto os tokens chegam;
+    // é substituída pela resposta final quando o comando termina.
+    let streamingMessage = null;
+
+    function appendToken(text) {
+        if (!streamingMessage) {
+            streamingMessage = document.createElement('div');
+            streamingMessage.classList.add('message', 'message-response', 'message-streaming');
+            narrativeContainer.appendChild(streamingMessage);
+        }
+        streamingMessage.textContent += text;
+        narrativeContainer.scrollTop = narrativeContainer.scrollHeight;
+    }
+
+    function removeStreamingMessage() {
+        if (streamingMessage) {
+            streamingMessage.remove();
+            streamingMessage = null;
+        }
+    }
+
+    // Recebe as transições do comando por Server-Sent Events; se o navegador
+    // não suportar ou a conexão falhar antes do fim, cai para o polling.
+    function watchCommand(commandId) {
+        if (!window.EventSource) {
+            startPolling(commandId);
+            return;
+        }
+
+        let finished = false;
+        const source = new EventSource(`/events/${commandId}`);
+
+        source.addEventListener('token', event => {
+            appendToken(JSON.parse(event.data).text);
+        });
+
+        source.addEventListener('status', event => {
+            finished = handleStatus(JSON.parse(event.data));
+            if (finished) source.close();
+        });
+
+        source.onerror = () => {
+            source.close();
+            if (!finished) {
+                console.warn('SSE indisponível, usando polling.');
+                startPolling(commandId);
+            }
+        };
+    }
+
     function startPolling(commandId) {
         if (pollingInterval) clearInterval(pollingInterval);
 
@@ -43,26 +128,9 @@ document.addEventListener('DOMContentLoaded', function () {
             fetch(`/status/${commandId}`)
                 .then(response => response.json())
                 .then(data => {
-                    if (!data.success && !data.processing) {
+                    if (handleStatus(data)) {
                         clearInterval(pollingInterval);
                         pollingInterval = null;
-                        statusIndicator.textContent = 'Erro ao processar.';
-                        statusIndicator.className = 'status-indicator status-error';
-                        return;
-                    }
-
-                    if (!data.processing) {
-                        clearInterval(pollingInterval);
-                        pollingInterval = null;
-                        statusIndicator.textContent = 'Pronto para o próximo comando';
-                        statusIndicator.className = 'status-indicator status-ready';
-                        processingCommand = false;
-
-                        if (data.history_additions && Array.isArray(data.history_additions)) {
-                            data.history_additions.forEach(msg => appendMessage(msg.type, msg.content));
-                        }
-                    } else {
-                        typingIndicator.style.display = 'inline-block';
                     }
                 })
                 .catch(error => {
@@ -117,10 +185,23 @@ document.addEventListener('DOMContentLoaded', function () {
         statusIndicator.textContent = 'Processando comando...';
         statusIndicator.className = 'status-indicator status-processing';
 
+        // Uma chave por envio: se a rede falhar, o reenvio usa a mesma e o
+        // servidor devolve o comando original em vez de jogar o turno de novo
         const payload = {
-            command: command
+            command: command,
+            idempotency_key: newIdempotencyKey()
         };
 
+        submitCommand(payload, COMMAND_RETRIES);
+        commandInput.value = '';
+    });
+
+    function newIdempotencyKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    function submitCommand(payload, retriesLeft) {
         fetch('/command', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -129,7 +210,9 @@ document.addEventListener('DOMContentLoaded', function () {
             .then(response => response.json())
             .then(data => {
                 if (data.success && data.processing && data.command_id) {
-                    startPolling(data.command_id);
+                    watchCommand(data.command_id);
+                } else if (data.duplicate && !data.processing) {
+                    handleStatus(data); // Já terminou: o resultado veio na própria resposta
                 } else {
                     processingCommand = false;
                     statusIndicator.textContent = 'Erro ao enviar comando';
@@ -137,14 +220,17 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
             })
             .catch(error => {
+                if (retriesLeft > 0) {
+                    console.warn('Falha ao enviar comando, tentando de novo:', error);
+                    setTimeout(() => submitCommand(payload, retriesLeft - 1), COMMAND_RETRY_DELAY_MS);
+                    return;
+                }
                 console.error('Erro ao enviar comando:', error);
                 processingCommand = false;
                 statusIndicator.textContent = 'Erro de conexão.';
                 statusIndicator.className = 'status-indicator status-error';
             });
-
-        commandInput.value = '';
-    });
+    }
 
     suggestions.forEach(suggestion => {
         suggestion.addEventListener('click', function () {
@@ -0,0 +1,60 @@
+# streaming.py - Repasse dos tokens da narração final para o navegador
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class StreamingNarracao(BaseCallbackHandler):
+    """
+    Callback do LLM que envia cada token gerado para o destino registrado
+    na thread atual. Fora de `transmitir(...)` os tokens são ignorados, então
+    só as chamadas escolhidas (narração final, contra-ataque e loot) chegam
+    ao jogador.
+
+    Os agentes do CrewAI respondem no formato "Thought: ... Final Answer: ...";
+    o texto anterior ao marcador é retido e só a resposta final é repassada.
+    """
+
+    MARCADOR_RESPOSTA = "Final Answer:"
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    @contextmanager
+    def transmitir(self, destino: Optional[Callable[[str], None]]):
+        if destino is None:
+            yield
+            return
+        self._local.destino = destino
+        self._local.buffer = ""
+        self._local.liberado = False
+        try:
+            yield
+        finally:
+            self._local.destino = None
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        destino = getattr(self._local, "destino", None)
+        if destino is None or not token:
+            return
+
+        if self._local.liberado:
+            destino(token)
+            return
+
+        # Ainda no "Thought": acumula até encontrar o início da resposta final
+        self._local.buffer += token
+        inicio = self._local.buffer.find(self.MARCADOR_RESPOSTA)
+        if inicio >= 0:
+            self._local.liberado = True
+            resto = self._local.buffer[inicio + len(self.MARCADOR_RESPOSTA):].lstrip()
+            self._local.buffer = ""
+            if resto:
+                destino(resto)
+
+
+# Instância única compartilhada pelo LLM da narração
+streaming_narracao = StreamingNarracao()
@@ -0,0 +1,103 @@
+# telemetria.py - Tempo e tokens de cada fase do turno (chamadas ao LLM e rolagens)
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from historico import estimar_tokens
+from metrics import registry
+
+
+class MedidorTokens(BaseCallbackHandler):
+    """
+    Callback dos LLMs que soma os tokens de prompt e de resposta na medição
+    aberta pela thread atual (`medir_fase`). Usa o `token_usage` devolvido
+    pela API quando existe; em streaming, estima pelo tamanho dos textos.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def iniciar(self) -> Tuple[Dict[str, int], Optional[Dict[str, int]]]:
+        """Abre uma medição na thread atual; devolve ela e a que estava aberta antes"""
+        anterior = getattr(self._local, "medicao", None)
+        medicao = {"prompt": 0, "completion": 0, "chamadas": 0}
+        self._local.medicao = medicao
+        return medicao, anterior
+
+    def encerrar(self, anterior: Optional[Dict[str, int]]) -> None:
+        self._local.medicao = anterior
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        # Chat models sem on_chat_model_start caem aqui com as mensagens já em texto
+        self._local.prompt_estimado = sum(estimar_tokens(p) for p in prompts)
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        medicao = getattr(self._local, "medicao", None)
+        if medicao is None:
+            return
+        uso = (response.llm_output or {}).get("token_usage") or {}
+        if uso.get("prompt_tokens"):
+            medicao["prompt"] += uso["prompt_tokens"]
+            medicao["completion"] += uso.get("completion_tokens", 0)
+        else:
+            medicao["prompt"] += getattr(self._local, "prompt_estimado", 0)
+            # Sem uso informado pela API (streaming): estimativa pelo tamanho dos textos
+            medicao["completion"] += sum(
+                estimar_tokens(geracao.text) for geracoes in response.generations for geracao in geracoes
+            )
+        medicao["chamadas"] += 1
+
+
+# Instância única registrada em todos os LLMs
+medidor_tokens = MedidorTokens()
+
+
+class MedidorLatenciaLLM(BaseCallbackHandler):
+    """Duração de cada chamada ao LLM, por nível de modelo (principal/rápido) e modelo"""
+
+    def __init__(self, nivel: str, modelo: str):
+        super().__init__()
+        self.histograma = registry.histogram(
+            "llm_call_seconds", "Duração de cada chamada ao LLM", nivel=nivel, modelo=modelo
+        )
+        self._inicios: Dict[object, float] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs) -> None:
+        self._inicios[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs) -> None:
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is not None:
+            self.histograma.observe(time.perf_counter() - inicio)
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs) -> None:
+        self._inicios.pop(run_id, None)
+
+
+@contextmanager
+def medir_fase(fase: str, agente: str = "sistema"):
+    """
+    Mede a duração e os tokens gastos dentro do bloco, por fase e agente.
+    As chamadas ao LLM são síncronas, então os callbacks rodam na mesma thread.
+    """
+    medicao, anterior = medidor_tokens.iniciar()
+    inicio = time.perf_counter()
+    try:
+        yield medicao
+    finally:
+        duracao = time.perf_counter() - inicio
+        medidor_tokens.encerrar(anterior)
+        registry.histogram(
+            "turn_phase_seconds", "Duração de cada fase do turno", fase=fase, agente=agente
+        ).observe(duracao)
+        if medicao["chamadas"]:
+            registry.histogram(
+                "llm_prompt_tokens", "Tokens de prompt por fase", fase=fase, agente=agente
+            ).observe(medicao["prompt"])
+            registry.histogram(
+                "llm_completion_tokens", "Tokens de resposta por fase", fase=fase, agente=agente
+            ).observe(medicao["completion"])
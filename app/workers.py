@@ -0,0 +1,176 @@
+# workers.py - Pool de workers que processa turnos de várias sessões em paralelo
+import threading
+import time
+from collections import deque
+from queue import Empty, Queue
+from typing import Callable, Dict, Hashable, List, Optional
+
+from metrics import registry
+
+# Tempo entre uma sessão ficar pronta e um worker começar a executá-la
+dispatch_latency = registry.histogram(
+    "worker_dispatch_latency_seconds",
+    "Tempo entre o comando ficar pronto e um worker iniciar sua execução",
+)
+worker_restarts = registry.counter(
+    "worker_restarts_total", "Workers reiniciados pelo supervisor após falha"
+)
+
+
+class SessionWorkerPool:
+    """
+    Executa jobs com N threads, preservando a ordem dentro de cada sessão.
+
+    Cada sessão tem sua própria fila (FIFO). Uma sessão só fica na fila de
+    prontas quando nenhum worker está cuidando dela, então dois comandos do
+    mesmo jogador nunca rodam ao mesmo tempo, enquanto sessões diferentes
+    avançam em paralelo.
+
+    Os workers bloqueiam na fila de prontas (sem polling) e são acordados
+    assim que um job chega. Um supervisor recria qualquer worker que morra e,
+    se `maintenance` for informado, o chama a cada `maintenance_interval`
+    segundos (ex.: limpeza de sessões ociosas, mesmo sem tráfego).
+    """
+
+    def __init__(
+        self,
+        handler: Callable,
+        num_workers: int = 4,
+        name: str = "turn-worker",
+        maintenance: Optional[Callable[[], None]] = None,
+        maintenance_interval: float = 60.0,
+    ):
+        self._handler = handler
+        self._maintenance = maintenance
+        self.maintenance_interval = maintenance_interval
+        self.num_workers = max(1, num_workers)
+        self.name = name
+        self._pending: Dict[Hashable, deque] = {}  # sessão -> jobs aguardando
+        self._ready: Queue = Queue()  # (sessão, instante em que ficou pronta)
+        self._crashed: Queue = Queue()  # índices de workers que terminaram com erro
+        self._lock = threading.Lock()
+        self._threads: List[Optional[threading.Thread]] = [None] * self.num_workers
+        self._supervisor: Optional[threading.Thread] = None
+        self._stopping = False
+        self.active = 0  # Jobs em execução neste momento
+
+    def start(self) -> None:
+        for index in range(self.num_workers):
+            self._spawn(index)
+        self._supervisor = threading.Thread(
+            target=self._supervise, name=f"{self.name}-supervisor", daemon=True
+        )
+        self._supervisor.start()
+        print(f"{self.num_workers} workers de turno iniciados.")
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """
+        Encerra o pool: os jobs em execução terminam normalmente e
+        os que ainda não começaram são descartados.
+        """
+        if self._stopping:
+            return
+        self._stopping = True
+        with self._lock:
+            self._pending.clear()
+        for _ in self._threads:
+            self._ready.put(None)  # Um sinal de parada por worker
+        self._crashed.put(None)
+        for thread in self._threads + [self._supervisor]:
+            if thread is not None:
+                thread.join(timeout)
+        print("Workers de turno encerrados.")
+
+    def submit(self, session_id: Hashable, job) -> None:
+        """Enfileira um job; jobs da mesma sessão rodam na ordem de chegada"""
+        if self._stopping:
+            raise RuntimeError("O pool de workers está encerrado.")
+        with self._lock:
+            jobs = self._pending.get(session_id)
+            if jobs is None:
+                self._pending[session_id] = deque([job])
+                self._ready.put((session_id, time.monotonic()))
+            else:
+                jobs.append(job)
+
+    def pending(self) -> int:
+        """Quantidade de jobs aguardando (sem contar os em execução)"""
+        with self._lock:
+            return sum(len(jobs) for jobs in self._pending.values()) - self.active
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.num_workers,
+            "alive": sum(1 for t in self._threads if t is not None and t.is_alive()),
+            "active": self.active,
+            "pending": self.pending(),
+            "restarts": worker_restarts.value,
+            "dispatch_p50": dispatch_latency.quantile(0.50),
+            "dispatch_p99": dispatch_latency.quantile(0.99),
+        }
+
+    def _spawn(self, index: int) -> None:
+        thread = threading.Thread(
+            target=self._worker_loop, args=(index,), name=f"{self.name}-{index}", daemon=True
+        )
+        self._threads[index] = thread
+        thread.start()
+
+    def _supervise(self) -> None:
+        # Bloqueia até algum worker avisar que morreu; só acorda sozinho para a manutenção
+        timeout = self.maintenance_interval if self._maintenance is not None else None
+        while True:
+            try:
+                index = self._crashed.get(timeout=timeout)
+            except Empty:
+                self._run_maintenance()
+                continue
+            if index is None or self._stopping:
+                return
+            worker_restarts.inc()
+            print(f"Worker {self.name}-{index} terminou inesperadamente; reiniciando.")
+            self._spawn(index)
+
+    def _run_maintenance(self) -> None:
+        try:
+            self._maintenance()
+        except Exception as e:
+            print(f"Erro na manutenção do {self.name}-supervisor: {e}")
+
+    def _worker_loop(self, index: int) -> None:
+        try:
+            while True:
+                item = self._ready.get()  # Bloqueia até haver trabalho
+                if item is None:
+                    return
+                session_id, ready_at = item
+                dispatch_latency.observe(time.monotonic() - ready_at)
+                self._run_next(session_id)
+        finally:
+            if not self._stopping:
+                self._crashed.put(index)
+
+    def _run_next(self, session_id: Hashable) -> None:
+        with self._lock:
+            jobs = self._pending.get(session_id)
+            if not jobs:
+                # O pool foi encerrado enquanto a sessão esperava
+                return
+            job = jobs[0]
+            self.active += 1
+
+        try:
+            self._handler(job)
+        except Exception as e:
+            print(f"Erro no worker {threading.current_thread().name}: {e}")
+        finally:
+            with self._lock:
+                self.active -= 1
+                jobs = self._pending.get(session_id)
+                if jobs:
+                    jobs.popleft()
+                if jobs:
+                    # Ainda há comandos desta sessão: volta para o fim da fila
+                    self._ready.put((session_id, time.monotonic()))
+                elif jobs is not None:
+                    del self._pending[session_id]
@@ -0,0 +1,265 @@
+"""
+Teste de carga HTTP: N jogadores simultâneos contra o servidor Flask.
+
+Cada jogador abre uma sessão própria (cookie), chama `/start` e envia uma
+sequência de comandos por `/command`, acompanhando cada um por `/status/<id>`
+até terminar. Por padrão o servidor é iniciado aqui mesmo, em outro processo,
+com o LLM falso (DND_LLM_BACKEND=fake) e a latência escolhida; com `--url` o
+teste roda contra um servidor já no ar.
+
+Enquanto a carga roda, `/metrics` é lido periodicamente para acompanhar a fila
+dos workers. No fim são mostrados a vazão, a profundidade da fila ao longo do
+tempo e os percentis p50/p99 da latência dos comandos.
+
+    python benchmarks/bench_carga.py [--jogadores 20] [--comandos 5] [--latencia 0.2] [--workers 4]
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+COMANDOS = [
+    "Examino a sala com cuidado",
+    "Procuro armadilhas no corredor",
+    "Ataco o esqueleto com um raio de fogo",
+    "Falo com o espírito que aparece",
+    "Olho as inscrições na parede",
+    "Lanço mísseis mágicos na criatura",
+    "Abro o sarcófago devagar",
+    "Penso sobre o que fazer a seguir",
+]
+
+# Sobe o servidor sem o reloader do modo debug e com uma thread por requisição;
+# o motor do jogo é carregado antes, para a medição não incluir o import
+SERVIDOR = """
+import sys
+import app
+app.load_game()
+app.app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True, debug=False, use_reloader=False)
+"""
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--jogadores", type=int, default=20, help="jogadores simultâneos")
+parser.add_argument("--comandos", type=int, default=5, help="comandos por jogador (além do /start)")
+parser.add_argument("--latencia", type=float, default=0.2, help="segundos por chamada ao LLM falso")
+parser.add_argument("--workers", type=int, default=4, help="DND_WORKERS do servidor iniciado aqui")
+parser.add_argument("--pausa", type=float, default=0.0, help="tempo de reflexão do jogador entre comandos")
+parser.add_argument("--intervalo", type=float, default=0.1, help="intervalo de consulta do /status")
+parser.add_argument("--amostragem", type=float, default=0.5, help="intervalo de leitura do /metrics")
+parser.add_argument("--url", help="servidor já em execução (não inicia um local)")
+
+
+class Jogador:
+    """Um navegador: cookie de sessão próprio e a sequência de turnos"""
+
+    def __init__(self, indice, url, resultados):
+        self.indice = indice
+        self.url = url
+        self.resultados = resultados
+        self.cliente = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def pedir(self, caminho, corpo=None):
+        dados = json.dumps(corpo).encode("utf-8") if corpo is not None else None
+        pedido = urllib.request.Request(
+            self.url + caminho, data=dados, headers={"Content-Type": "application/json"}
+        )
+        with self.cliente.open(pedido, timeout=300) as resposta:
+            conteudo = resposta.read()
+        return json.loads(conteudo) if conteudo.startswith(b"{") else None
+
+    def jogar(self, comandos, args):
+        try:
+            self.pedir("/")  # Cria a sessão
+            inicio = time.perf_counter()
+            self.pedir("/start")
+            self.resultados.registrar("start", time.perf_counter() - inicio)
+
+            for numero in range(comandos):
+                comando = COMANDOS[(self.indice + numero) % len(COMANDOS)]
+                inicio = time.perf_counter()
+                resposta = self.pedir("/command", {"command": comando, "id": f"carga_{self.indice}_{numero}"})
+                while True:
+                    time.sleep(args.intervalo)
+                    status = self.pedir(f"/status/{resposta['command_id']}")
+                    if not status.get("processing"):
+                        break
+                if status.get("success"):
+                    self.resultados.registrar("command", time.perf_counter() - inicio)
+                else:
+                    self.resultados.erro(status.get("error"))
+                if args.pausa:
+                    time.sleep(args.pausa)
+        except (urllib.error.URLError, OSError, KeyError, ValueError) as e:
+            self.resultados.erro(e)
+
+
+class Resultados:
+    """Latências e erros coletados pelas threads dos jogadores"""
+
+    def __init__(self):
+        self.latencias = {"start": [], "command": []}
+        self.erros = []
+        self._lock = threading.Lock()
+
+    def registrar(self, tipo, segundos):
+        with self._lock:
+            self.latencias[tipo].append(segundos)
+
+    def erro(self, motivo):
+        with self._lock:
+            self.erros.append(str(motivo))
+
+
+def ler_metricas(url):
+    """Valores das métricas sem rótulos do /metrics (ex.: worker_queue_depth)"""
+    with urllib.request.urlopen(url + "/metrics", timeout=10) as resposta:
+        texto = resposta.read().decode("utf-8")
+    valores = {}
+    for linha in texto.splitlines():
+        if linha and not linha.startswith("#") and "{" not in linha:
+            nome, valor = linha.rsplit(" ", 1)
+            valores[nome] = float(valor)
+    return valores
+
+
+def amostrar_fila(url, intervalo, parar, amostras):
+    inicio = time.perf_counter()
+    while not parar.is_set():
+        try:
+            metricas = ler_metricas(url)
+        except (urllib.error.URLError, OSError):
+            metricas = {}
+        amostras.append((
+            time.perf_counter() - inicio,
+            metricas.get("worker_queue_depth", 0),
+            metricas.get("worker_active_jobs", 0),
+        ))
+        parar.wait(intervalo)
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(args):
+    porta = porta_livre()
+    env = dict(
+        os.environ,
+        DND_LLM_BACKEND="fake",
+        DND_FAKE_LLM_LATENCY=str(args.latencia),
+        DND_WORKERS=str(args.workers),
+        DND_WARMUP="0",
+        DND_DB_PATH=os.path.join(tempfile.mkdtemp(prefix="bench_carga"), "sessoes.sqlite3"),
+        OTEL_SDK_DISABLED="true",
+    )
+    processo = subprocess.Popen(
+        [sys.executable, "-c", SERVIDOR, str(porta)],
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{porta}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            sys.exit(f"O servidor terminou ao iniciar (código {processo.returncode})")
+        try:
+            ler_metricas(url)
+            return processo, url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    processo.terminate()
+    sys.exit("O servidor não respondeu em 60s")
+
+
+def percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(q * (len(valores) - 1))))]
+
+
+def linha_latencias(nome, valores):
+    if not valores:
+        return f"{nome:<10} sem amostras"
+    ms = [v * 1000 for v in valores]
+    return (
+        f"{nome:<10} {len(ms):5d} | p50 {statistics.median(ms):8.1f} ms | "
+        f"p99 {percentil(ms, 0.99):8.1f} ms | máx {max(ms):8.1f} ms"
+    )
+
+
+def grafico_fila(amostras, colunas=12):
+    """Profundidade da fila ao longo do tempo, agrupada em algumas faixas"""
+    if not amostras:
+        return []
+    passo = max(1, -(-len(amostras) // colunas))
+    linhas = []
+    for i in range(0, len(amostras), passo):
+        faixa = amostras[i:i + passo]
+        fila = max(a[1] for a in faixa)
+        ativos = max(a[2] for a in faixa)
+        linhas.append(f"  {faixa[0][0]:6.1f}s  fila {fila:4.0f} {'#' * int(fila)}  (em execução {ativos:.0f})")
+    return linhas
+
+
+def main():
+    args = parser.parse_args()
+    processo = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        processo, url = iniciar_servidor(args)
+
+    try:
+        resultados = Resultados()
+        amostras = []
+        parar = threading.Event()
+        amostrador = threading.Thread(target=amostrar_fila, args=(url, args.amostragem, parar, amostras), daemon=True)
+        amostrador.start()
+
+        jogadores = [Jogador(i, url, resultados) for i in range(args.jogadores)]
+        threads = [threading.Thread(target=j.jogar, args=(args.comandos, args)) for j in jogadores]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+        parar.set()
+        amostrador.join()
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait(10)
+
+    turnos = len(resultados.latencias["start"]) + len(resultados.latencias["command"])
+    origem = url if args.url else f"servidor local, LLM falso {args.latencia * 1000:.0f} ms/chamada, {args.workers} workers"
+    print(f"{args.jogadores} jogadores x {args.comandos} comandos ({origem})\n")
+    print(f"Duração {duracao:.1f}s | {turnos} turnos | vazão {turnos / duracao:.2f} turnos/s | erros {len(resultados.erros)}")
+    print(linha_latencias("/start", resultados.latencias["start"]))
+    print(linha_latencias("/command", resultados.latencias["command"]))
+    if amostras:
+        filas = [a[1] for a in amostras]
+        print(f"\nFila dos workers: média {statistics.mean(filas):.1f}, máx {max(filas):.0f}")
+        print("\n".join(grafico_fila(amostras)))
+    for erro in sorted(set(resultados.erros))[:5]:
+        print(f"Erro: {erro}")
+
+
+if __name__ == "__main__":
+    main()
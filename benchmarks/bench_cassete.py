@@ -0,0 +1,127 @@
+"""
+Reprodução de partidas gravadas (cassetes): refaz cada turno gravado sem
+rede, com as respostas do LLM e os sorteios tirados do arquivo, confere se a
+resposta saiu idêntica e mede o custo do turno fora do LLM. Com --perfil,
+mostra as funções mais caras (cProfile).
+
+Uma cassete é gravada pelo servidor ou pelo terminal com DND_CASSETTE=<arquivo>;
+--gravar grava uma partida roteirizada com o LLM falso, para testar.
+
+    python benchmarks/bench_cassete.py partida.jsonl.gz [--repeticoes 3] [--perfil 25]
+    python benchmarks/bench_cassete.py partida.jsonl.gz --gravar [--jogadores 2] [--turnos 12]
+"""
+import argparse
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import statistics
+import sys
+import time
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("cassete", help="arquivo da cassete (.jsonl ou .jsonl.gz)")
+parser.add_argument("--gravar", action="store_true", help="grava uma partida roteirizada com o LLM falso")
+parser.add_argument("--jogadores", type=int, default=2, help="partidas gravadas com --gravar")
+parser.add_argument("--turnos", type=int, default=12, help="turnos por partida com --gravar")
+parser.add_argument("--repeticoes", type=int, default=3, help="vezes que a cassete é reproduzida")
+parser.add_argument("--perfil", type=int, default=0, metavar="N", help="mostra as N funções mais caras")
+args = parser.parse_args()
+
+# A cassete precisa ser configurada antes de importar o main
+os.environ["DND_CASSETTE"] = args.cassete
+os.environ["DND_CASSETTE_MODE"] = "record" if args.gravar else "replay"
+if args.gravar:
+    os.environ["DND_LLM_BACKEND"] = "fake"
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main  # noqa: E402
+
+COMANDOS = [
+    "Examino a sala com cuidado",
+    "Avanço pelo corredor escuro",
+    "Ataco o inimigo mais próximo com um raio de fogo",
+    "Procuro armadilhas no corredor",
+    "Ataco a criatura com um míssil mágico",
+    "Falo com o espírito que aparece",
+]
+
+
+def gravar():
+    for jogador in range(args.jogadores):
+        estado = main.GameState(f"cassete-{jogador}")
+        for turno in range(args.turnos):
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.processar_comando(COMANDOS[(turno + jogador) % len(COMANDOS)], estado)
+    main.cassete.fechar()
+    print(f"{args.jogadores} partidas de {args.turnos} turnos gravadas em {args.cassete} "
+          f"({os.path.getsize(args.cassete) / 1024:.0f} KB)")
+
+
+def montar_partida(cassete, numero):
+    """GameState no estado gravado, com o gerador reproduzindo os sorteios da partida"""
+    partida = cassete.partidas[numero]
+    estado = main.GameState.from_dict(partida["estado"], partida["sessao"])
+    rng = cassete.rng_partida(numero)
+    estado.dados.rng = rng
+    estado.event_system.rng = rng
+    estado.partida_cassete = numero  # Já associada: iniciar_turno não a renumera
+    main.cache_roteamento.invalidar(partida["sessao"])
+    return estado
+
+
+def reproduzir(cassete):
+    """Refaz todos os turnos; retorna (durações, divergências)"""
+    cassete.rebobinar()
+    estados, duracoes, divergencias = {}, [], []
+    for turno in cassete.turnos:
+        estado = estados.get(turno["partida"])
+        if estado is None:
+            estado = estados[turno["partida"]] = montar_partida(cassete, turno["partida"])
+        if turno.get("pipeline"):
+            estado.modo_pipeline = turno["pipeline"]
+        resposta, erro = None, None
+        inicio = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                resposta = main.processar_comando(turno["comando"], estado)
+        except Exception as e:
+            erro = str(e)
+        duracoes.append(time.perf_counter() - inicio)
+        if resposta != turno["resposta"] or erro != turno.get("erro"):
+            divergencias.append((turno, resposta, erro))
+    return duracoes, divergencias
+
+
+if __name__ == "__main__":
+    if args.gravar:
+        gravar()
+        sys.exit(0)
+
+    cassete = main.cassete
+    print(f"{len(cassete.turnos)} turnos em {len(cassete.partidas)} partidas\n")
+    perfil = cProfile.Profile() if args.perfil else None
+    for repeticao in range(1, args.repeticoes + 1):
+        if perfil:
+            perfil.enable()
+        duracoes, divergencias = reproduzir(cassete)
+        if perfil:
+            perfil.disable()
+        ms = sorted(d * 1000 for d in duracoes)
+        print(
+            f"Reprodução {repeticao}: {sum(duracoes):.2f}s | por turno p50 {statistics.median(ms):.1f} ms, "
+            f"p95 {ms[int(0.95 * (len(ms) - 1))]:.1f} ms | "
+            f"{'idêntica' if not divergencias else f'{len(divergencias)} turnos divergentes'}"
+        )
+        for turno, resposta, erro in divergencias[:3]:
+            print(f"  partida {turno['partida']} \"{turno['comando']}\": {erro or 'resposta diferente'}")
+            if resposta is not None:
+                print(f"    gravada:    {(turno['resposta'] or '')[:120]!r}\n    reproduzida: {resposta[:120]!r}")
+
+    if perfil:
+        print()
+        pstats.Stats(perfil).sort_stats("cumulative").print_stats(args.perfil)
+    sys.exit(1 if divergencias else 0)
@@ -0,0 +1,75 @@
+"""
+Benchmark do simulador de encontros: custo de montar a tabela de dificuldade,
+custo de uma consulta e de escolher um encontro, e a chance de vitória do
+jogador nos encontros gerados sem e com o balanceamento.
+
+A chance de vitória de cada encontro gerado é medida com uma simulação própria
+(`simular_encontro`), independente da tabela.
+
+    python benchmarks/bench_encontros.py [encontros]
+"""
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("DND_LLM_BACKEND", "fake")  # Nenhuma chamada ao LLM aqui
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main  # noqa: E402
+from encontros import simular_encontro  # noqa: E402
+
+
+def gerar(ficha, turno, balancear, rng):
+    eventos = main.EventSystem(rng)
+    eventos.turn_counter = turno
+    eventos.encounter_chance = 100.0
+    while not eventos.in_combat:
+        with contextlib.redirect_stdout(io.StringIO()):
+            eventos.check_random_encounter(ficha if balancear else None)
+    return eventos.current_enemies
+
+
+def vitoria_real(ficha, inimigos):
+    return simular_encontro(
+        main.monstros,
+        inimigos,
+        main.CharacterManager.calculate_attack_bonus(ficha, "magia"),
+        ficha.get("ca", 10),
+        ficha.get("pv_atual", ficha.get("pv_maximo", 0)),
+        simulacoes=5000,
+    )["vitoria"]
+
+
+if __name__ == "__main__":
+    encontros = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    ficha = main.carregar_ficha()
+
+    inicio = time.perf_counter()
+    tabela = main.tabela_encontros(ficha)
+    print(f"Tabela de dificuldade: {time.perf_counter() - inicio:.2f}s para montar")
+
+    inicio = time.perf_counter()
+    for _ in range(100000):
+        tabela.chance_vitoria(1, (0, 2), 8)
+    print(f"Consulta: {(time.perf_counter() - inicio) * 10:.2f} µs")
+
+    eventos = main.EventSystem()
+    inicio = time.perf_counter()
+    for _ in range(1000):
+        eventos.escolher_inimigos(4, ficha)
+    print(f"Escolha de um encontro (4 inimigos): {(time.perf_counter() - inicio) * 1000:.0f} µs\n")
+
+    print(f"Chance de vitória nos encontros gerados (alvo {main.CHANCE_VITORIA_ALVO:.0%}):")
+    for balancear in (False, True):
+        rng = random.Random(42)
+        chances = [vitoria_real(ficha, gerar(ficha, rng.randint(0, 12), balancear, rng)) for _ in range(encontros)]
+        print(
+            f"  {'com' if balancear else 'sem'} balanceamento: média {statistics.mean(chances):.0%} | "
+            f"mínima {min(chances):.0%} | abaixo do alvo {sum(c < main.CHANCE_VITORIA_ALVO for c in chances) / len(chances):.0%}"
+        )
@@ -0,0 +1,94 @@
+"""
+Microbenchmark: custo de montar Task/Crew a cada chamada vs. pipelines reaproveitados.
+
+Não chama o LLM: mede só a construção dos objetos e o preenchimento dos prompts,
+que é o que muda entre as duas abordagens.
+
+    python benchmarks/bench_pipelines.py [repeticoes]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")  # Os clientes não fazem chamadas aqui
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from crewai import Crew, Task  # noqa: E402
+
+import main  # noqa: E402
+
+VARIAVEIS = {
+    "estado_atual": "Em combate",
+    "contexto": "Alion entrou na cripta.\nUm esqueleto se levanta do sarcófago.",
+    "contexto_evento": "",
+    "comando_usuario": "Lanço um raio de fogo no esqueleto",
+    "analise_situacional": "Combate contra um esqueleto",
+    "direcionamento": "Resolva o ataque mágico",
+    "contexto_regras": "",
+    "contexto_mecanico": "Rolagem de ataque: 17 contra CA 13 (acerto)",
+    "agente_lider": "combate",
+    "contribuicao_lider": "O raio atinge o esqueleto.",
+    "papel": "COMBATE",
+    "contexto_integracao": main.CONTEXTO_INTEGRACAO_COMBATE,
+    "outras_contribuicoes": "Agente regras:\nAtaque resolvido.\n\n",
+    "instrucao_tom": main.TOM_COMBATE_INTEGRACAO,
+}
+
+# As chamadas de um turno de combate completo: orquestrador, líder, auxiliar,
+# integração, contra-ataque e loot
+PIPELINES_TURNO = [
+    main.pipeline_orquestrador,
+    main.pipelines_lider["combate"],
+    main.pipelines_auxiliar["regras"],
+    main.pipeline_integracao,
+    main.pipeline_contra_ataque,
+    main.pipeline_loot,
+]
+VARIAVEIS_EXTRAS = {"descricao_ataque": "O esqueleto erra.", "descricao_loot": "10 peças de ouro"}
+
+
+def montar_a_cada_turno():
+    for pipeline in PIPELINES_TURNO:
+        descricao, saida = pipeline.preencher(**VARIAVEIS, **VARIAVEIS_EXTRAS)
+        tarefa = Task(description=descricao, expected_output=saida, agent=pipeline.agente)
+        Crew(agents=[pipeline.agente], tasks=[tarefa], verbose=False)
+
+
+def reaproveitar_pipelines():
+    for pipeline in PIPELINES_TURNO:
+        _, tarefa = pipeline.montar()
+        tarefa.description, tarefa.expected_output = pipeline.preencher(**VARIAVEIS, **VARIAVEIS_EXTRAS)
+
+
+def medir(nome, funcao, repeticoes):
+    funcao()  # Aquecimento (e montagem inicial dos pipelines)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    duracao = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    for _ in range(min(repeticoes, 50)):
+        funcao()
+    depois = tracemalloc.take_snapshot()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    alocado = sum(stat.size_diff for stat in depois.compare_to(antes, "filename") if stat.size_diff > 0)
+    blocos = sum(stat.count_diff for stat in depois.compare_to(antes, "filename") if stat.count_diff > 0)
+
+    por_turno_ms = duracao / repeticoes * 1000
+    print(
+        f"{nome:<24} {por_turno_ms:8.3f} ms/turno | pico {pico / 1024:8.1f} KiB | "
+        f"retido {alocado / 1024:8.1f} KiB em {blocos} blocos ({min(repeticoes, 50)} turnos)"
+    )
+    return por_turno_ms
+
+
+if __name__ == "__main__":
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{len(PIPELINES_TURNO)} chamadas de agente por turno, {repeticoes} turnos\n")
+    antes = medir("Task/Crew por chamada", montar_a_cada_turno, repeticoes)
+    depois = medir("Pipelines reaproveitados", reaproveitar_pipelines, repeticoes)
+    print(f"\nConstrução {antes / depois:.0f}x mais rápida ({antes - depois:.3f} ms economizados por turno)")
@@ -0,0 +1,94 @@
+"""
+Benchmark de inicialização: quanto custa importar o servidor Flask e o motor do jogo.
+
+Cada medição roda em um interpretador novo (nada em cache no processo), e a
+mediana de várias execuções é reportada. Também lista os módulos mais caros
+do import do motor, via `python -X importtime`.
+
+    python benchmarks/bench_startup.py [execucoes]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# Importa o servidor (sem aquecimento em segundo plano) e atende / e /character
+MEDIR_SERVIDOR = """
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+cliente = app.app.test_client()
+cliente.get('/')
+t2 = time.perf_counter()
+cliente.get('/character')
+t3 = time.perf_counter()
+import sys
+print('RESULTADO', t1 - t0, t2 - t1, t3 - t2, 'main' in sys.modules)
+"""
+
+# Carrega o motor do jogo: crewai, langchain, clientes do LLM e agentes
+MEDIR_MOTOR = """
+import time
+t0 = time.perf_counter()
+import main
+print('RESULTADO', time.perf_counter() - t0)
+"""
+
+
+def rodar(codigo, *opcoes):
+    # Partidas salvas num banco temporário, fora da pasta do app
+    banco = os.path.join(tempfile.gettempdir(), "bench_startup.sqlite3")
+    env = dict(os.environ, DND_WARMUP="0", OTEL_SDK_DISABLED="true", DND_DB_PATH=banco)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    return subprocess.run(
+        [sys.executable, *opcoes, "-c", codigo],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def resultado(saida):
+    # O servidor também escreve no stdout (workers, sessões); pega só a linha marcada
+    linha = next(l for l in saida.stdout.splitlines() if l.startswith("RESULTADO "))
+    return linha.split()[1:]
+
+
+def mais_caros(stderr, quantidade=10):
+    """Módulos com maior tempo acumulado no relatório do -X importtime"""
+    modulos = []
+    for linha in stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, acumulado, nome = linha[len("import time:"):].split("|")
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2
+        if profundidade <= 1:  # O próprio main e o que ele importa diretamente
+            modulos.append((int(acumulado), nome.strip()))
+    return sorted(modulos, reverse=True)[:quantidade]
+
+
+if __name__ == "__main__":
+    execucoes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    servidor = [resultado(rodar(MEDIR_SERVIDOR)) for _ in range(execucoes)]
+    motor = [float(resultado(rodar(MEDIR_MOTOR))[0]) for _ in range(execucoes)]
+
+    def mediana_ms(valores):
+        return statistics.median(float(v) for v in valores) * 1000
+
+    print(f"Mediana de {execucoes} execuções (processo novo a cada uma)\n")
+    print(f"import app              {mediana_ms(s[0] for s in servidor):9.1f} ms")
+    print(f"GET / (primeira)        {mediana_ms(s[1] for s in servidor):9.1f} ms")
+    print(f"GET /character          {mediana_ms(s[2] for s in servidor):9.1f} ms")
+    print(f"motor carregado no boot {'sim' if servidor[0][3] == 'True' else 'não'}")
+    print(f"import main (motor)     {statistics.median(motor) * 1000:9.1f} ms")
+
+    print("\nMódulos mais caros ao carregar o motor (-X importtime):")
+    for acumulado, nome in mais_caros(rodar(MEDIR_MOTOR, "-X", "importtime").stderr):
+        print(f"  {acumulado / 1000:9.1f} ms  {nome}")
@@ -0,0 +1,141 @@
+"""
+Benchmark do pipeline de turnos com o LLM falso (sem chamar a OpenAI).
+
+Roda sessões roteirizadas (exploração, combate com encontros do EventSystem
+e loot) e mostra, por turno, a latência, o número de chamadas ao LLM, os
+tokens de prompt e o tempo de CPU gasto fora da espera simulada do LLM. No fim, a divisão das
+chamadas e da latência entre os níveis de modelo (principal e rápido).
+
+    python benchmarks/bench_turnos.py [--latencia 0.05] [--latencia-rapida 0.02] [--tokens 80] [--modo completo|rapido] [-v]
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--latencia", type=float, default=0.05, help="segundos por chamada ao LLM falso")
+parser.add_argument("--latencia-rapida", type=float, help="segundos por chamada no nível rápido (padrão: --latencia)")
+parser.add_argument("--tokens", type=int, default=80, help="tamanho aproximado das narrações")
+parser.add_argument("--modo", choices=["completo", "rapido"], default="completo", help="pipeline do turno")
+parser.add_argument("--semente", type=int, default=42, help="semente dos dados e encontros")
+parser.add_argument("-v", "--verbose", action="store_true", help="mostra cada turno")
+args = parser.parse_args()
+
+# O backend precisa ser escolhido antes de importar o main
+os.environ["DND_LLM_BACKEND"] = "fake"
+os.environ["DND_FAKE_LLM_LATENCY"] = str(args.latencia)
+os.environ["DND_FAKE_LLM_FAST_LATENCY"] = str(args.latencia if args.latencia_rapida is None else args.latencia_rapida)
+os.environ["DND_FAKE_LLM_TOKENS"] = str(args.tokens)
+os.environ["DND_PIPELINE_MODE"] = args.modo
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main  # noqa: E402
+from metrics import registry  # noqa: E402
+
+chamadas_llm = registry.counter("fake_llm_calls_total")
+
+
+def soma_tokens_prompt():
+    # Um histograma por fase/agente: soma todos
+    return sum(m.sum for m in registry.all() if m.name == "llm_prompt_tokens")
+
+
+def iniciar_combate(estado):
+    """Força um encontro hostil pelo próprio EventSystem (chance de 100%)"""
+    eventos = estado.event_system
+    while not eventos.in_combat:
+        eventos.encounter_chance = 100.0
+        eventos.check_random_encounter()
+
+
+def exploracao(estado):
+    for comando in [
+        "Examino a sala com cuidado",
+        "Olho as inscrições na parede",
+        "Procuro armadilhas no corredor",
+        "Falo com o espírito que aparece",
+        "Qual regra de teste de percepção se aplica?",
+        "Penso sobre o que fazer a seguir",
+    ]:
+        yield comando
+
+
+def combate(estado):
+    yield "Avanço pelo corredor escuro"
+    iniciar_combate(estado)
+    for _ in range(40):  # Ataca até o combate acabar (com loot) ou o limite
+        if not estado.event_system.in_combat:
+            break
+        yield "Ataco o inimigo mais próximo com um raio de fogo"
+    yield "Examino os restos da criatura"
+
+
+CENARIOS = [("exploração", exploracao), ("combate e loot", combate)]
+
+
+def rodar_cenario(nome, roteiro):
+    estado = main.GameState(f"bench-{nome}", semente_dados=args.semente)
+    estado.event_system.encounter_chance = -100.0  # Encontros só quando o roteiro pedir
+    turnos = []
+    for comando in roteiro(estado):
+        chamadas_antes, tokens_antes = chamadas_llm.value, soma_tokens_prompt()
+        cpu_antes, inicio = time.process_time(), time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.processar_comando(comando, estado)
+        duracao = time.perf_counter() - inicio
+        turno = {
+            "comando": comando,
+            "latencia": duracao,
+            "cpu": time.process_time() - cpu_antes,
+            "chamadas": int(chamadas_llm.value - chamadas_antes),
+            "tokens": int(soma_tokens_prompt() - tokens_antes),
+            "combate": estado.event_system.in_combat,
+        }
+        turnos.append(turno)
+        if args.verbose:
+            print(
+                f"  {turno['latencia'] * 1000:8.1f} ms | {turno['chamadas']} chamadas | "
+                f"{turno['tokens']:5d} tokens | CPU {turno['cpu'] * 1000:7.1f} ms | "
+                f"{'[combate] ' if turno['combate'] else ''}{comando}"
+            )
+    return turnos
+
+
+def percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(q * (len(valores) - 1))))]
+
+
+if __name__ == "__main__":
+    print(
+        f"LLM falso: {args.latencia * 1000:.0f} ms/chamada "
+        f"({float(os.environ['DND_FAKE_LLM_FAST_LATENCY']) * 1000:.0f} ms no nível rápido), ~{args.tokens} tokens/resposta | "
+        f"pipeline {args.modo} | semente {args.semente}\n"
+    )
+    for nome, roteiro in CENARIOS:
+        if args.verbose:
+            print(f"{nome}:")
+        turnos = rodar_cenario(nome, roteiro)
+        latencias = [t["latencia"] * 1000 for t in turnos]
+        print(
+            f"{nome:<16} {len(turnos):3d} turnos | latência p50 {statistics.median(latencias):7.1f} ms "
+            f"p95 {percentil(latencias, 0.95):7.1f} ms | "
+            f"{statistics.mean(t['chamadas'] for t in turnos):4.1f} chamadas/turno | "
+            f"{statistics.mean(t['tokens'] for t in turnos):6.0f} tokens de prompt/turno | "
+            f"CPU {statistics.mean(t['cpu'] for t in turnos) * 1000:6.1f} ms/turno"
+        )
+
+    print("\nChamadas ao LLM por nível de modelo:")
+    niveis = [m for m in registry.all() if m.name == "llm_call_seconds" and m.count]
+    total = sum(m.sum for m in niveis) or 1.0
+    for medida in sorted(niveis, key=lambda m: m.labels["nivel"]):
+        print(
+            f"  {medida.labels['nivel']:<10} {medida.count:4d} chamadas | média {medida.sum / medida.count * 1000:7.1f} ms "
+            f"p95 {medida.quantile(0.95) * 1000:7.1f} ms | {medida.sum / total:4.0%} do tempo no LLM"
+        )